@@ -1,12 +1,13 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-# --- Helper Functions ---
-
-def cs_rank(series: pd.Series) -> pd.Series:
-    """Cross-sectional rank (percentage)."""
-    # Ensure only non-NaN values are ranked. NaNs will remain NaN.
-    return series.rank(method='average', pct=True)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from engine import Panel, operators as op
+from engine.output import write_csv
+from engine.store import load_frame
 
 # --- Main Alpha Calculation Function ---
 
@@ -21,34 +22,25 @@ def calculate_alpha33(df: pd.DataFrame) -> pd.DataFrame:
             raise ValueError(f"Required column '{col}' not found in DataFrame.")
 
     # Ensure data is sorted by date first for cross-sectional operations
-    df = df.sort_values(by=['date', 'asset_id']).copy()
-
-    # Calculate (1 - (open / close))
-    # Handle division by zero for 'close' price
-    # If close is 0, the ratio will be inf, and (1 - inf) will be -inf, which will propagate to NaN after rank
-    # We'll let pandas handle inf/-inf and resulting NaNs. Rank handles NaNs by default.
-    df['intermediate_ratio'] = (1 - (df['open'] / df['close']))
+    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
+    panel = Panel.from_long(df, required_cols)
 
     # Calculate -1 * (1 - (open / close))
-    df['intermediate_negated'] = -1 * df['intermediate_ratio']
-
-    # Apply cross-sectional rank
-    df['alpha33'] = df.groupby('date')['intermediate_negated'].transform(cs_rank)
+    # If close is 0, the ratio will be inf, and (1 - inf) will be -inf; rank handles inf/-inf and NaNs.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        intermediate_negated = -1 * (1 - (panel['open'] / panel['close']))
 
-    # Rounding alpha33 to two decimal places
+    # Apply cross-sectional rank and round alpha33 to two decimal places
+    df['alpha33'] = panel.to_long(op.cs_rank(intermediate_negated))
     df['alpha33'] = df['alpha33'].round(2)
 
     # Define columns to keep, ensuring original data + new alpha
-    # Use a set to avoid duplicates and preserve order for original columns
     original_cols_ordered = ['date', 'asset_id', 'open', 'high', 'low', 'close', 'volume', 'vwap', 'returns']
     output_cols = [col for col in original_cols_ordered if col in df.columns]
 
     # Add alpha33 to the end, if not already present
     if 'alpha33' not in output_cols:
         output_cols.append('alpha33')
-    
-    # Re-sort by date and asset_id for final output consistency
-    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
 
     return df[output_cols]
 
@@ -62,7 +54,7 @@ if __name__ == "__main__":
     # --- Load Data ---
     try:
         print(f"Loading data from {DATA_FILE_PATH}...")
-        input_df = pd.read_csv(DATA_FILE_PATH)
+        input_df = load_frame(DATA_FILE_PATH, codes=True)
         print("Data loaded successfully.")
     except FileNotFoundError:
         print(f"Error: Data file not found at {DATA_FILE_PATH}.")
@@ -71,18 +63,6 @@ if __name__ == "__main__":
         print(f"Error loading data: {e}")
         exit(1)
 
-    # --- Data Preprocessing ---
-    try:
-        input_df['date'] = pd.to_datetime(input_df['date'])
-        # Ensure asset_id is treated as object/string to avoid issues with numeric IDs being misinterpreted
-        if 'asset_id' in input_df.columns:
-            input_df['asset_id'] = input_df['asset_id'].astype(str)
-
-        print("Data preprocessing (date conversion, asset_id type) complete.")
-    except Exception as e:
-        print(f"Error during data preprocessing: {e}")
-        exit(1)
-
     # --- Calculate Alpha ---
     try:
         print("Calculating Alpha#33...")
@@ -95,7 +75,7 @@ if __name__ == "__main__":
 
     # --- Save Results ---
     try:
-        results_df.to_csv(OUTPUT_FILE_PATH, index=False, float_format='%.2f')
+        write_csv(results_df, OUTPUT_FILE_PATH, float_format='%.2f')
         print(f"Alpha#33 results saved to {OUTPUT_FILE_PATH}")
     except Exception as e:
         print(f"Error saving results: {e}")
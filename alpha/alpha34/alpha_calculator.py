@@ -1,19 +1,12 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-# --- Helper Functions ---
-
-def cs_rank(series: pd.Series) -> pd.Series:
-    """Cross-sectional rank (percentage)."""
-    return series.rank(method='average', pct=True)
-
-def ts_stddev(series: pd.Series, period: int) -> pd.Series:
-    """Time-series standard deviation over the past period."""
-    return series.rolling(window=period, min_periods=period).std()
-
-def ts_delta(series: pd.Series, period: int) -> pd.Series:
-    """Time-series delta: current value minus value 'period' days ago."""
-    return series - series.shift(period)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from engine import Panel, operators as op
+from engine.store import load_frame
 
 # --- Main Alpha Calculation Function ---
 
@@ -27,67 +20,40 @@ def calculate_alpha34(df: pd.DataFrame) -> pd.DataFrame:
         if col not in df.columns:
             raise ValueError(f"Required column '{col}' not found in DataFrame.")
 
-    # Ensure data is sorted by asset_id then date for time-series operations
-    df = df.sort_values(by=['asset_id', 'date']).copy()
-
-    # --- Part 1: stddev(returns, 2) ---
-    df['stddev_returns_2'] = df.groupby('asset_id')['returns'].transform(lambda x: ts_stddev(x, 2))
-
-    # --- Part 2: stddev(returns, 5) ---
-    df['stddev_returns_5'] = df.groupby('asset_id')['returns'].transform(lambda x: ts_stddev(x, 5))
-
-    # --- Part 3: (stddev(returns, 2) / stddev(returns, 5)) ---
-    # Handle division by zero: if stddev_returns_5 is 0 or NaN, the ratio should be NaN or 0,
-    # depending on desired behavior. Here, we'll let pandas handle NaN propagate,
-    # and if denominator is 0, result will be inf (which rank will handle).
-    # It's better to explicitly handle zero division to avoid inf/NaN propagating unexpectedly
-    df['stddev_ratio'] = df['stddev_returns_2'] / df['stddev_returns_5'].replace(0, np.nan)
-
-    # --- Part 4: 1 - rank(stddev_ratio) - Cross-sectional operation, re-sort by date ---
-    df = df.sort_values(by=['date', 'asset_id'])
-    df['part_A'] = df.groupby('date')['stddev_ratio'].transform(
-        lambda x: 1 - cs_rank(x) if x.notna().sum() > 1 else pd.Series(0.0, index=x.index)
-    )
+    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
+    panel = Panel.from_long(df, required_cols)
 
-    # --- Part 5: delta(close, 1) - Time-series operation, re-sort by asset_id ---
-    df = df.sort_values(by=['asset_id', 'date'])
-    df['delta_close_1'] = df.groupby('asset_id')['close'].transform(lambda x: ts_delta(x, 1))
+    # --- Part A: 1 - rank(stddev(returns, 2) / stddev(returns, 5)) ---
+    # Zero stddev_returns_5 is treated as NaN rather than producing inf
+    stddev_returns_5 = op.ts_stddev(panel['returns'], 5)
+    stddev_returns_5[stddev_returns_5 == 0] = np.nan
+    stddev_ratio = op.ts_stddev(panel['returns'], 2) / stddev_returns_5
+    # Dates with fewer than two valid values get 0.0 (rank filled with 1.0)
+    part_A = 1 - op.cs_rank(stddev_ratio, min_count=2, fill=1.0)
 
-    # --- Part 6: 1 - rank(delta_close_1) - Cross-sectional operation, re-sort by date ---
-    df = df.sort_values(by=['date', 'asset_id'])
-    df['part_B'] = df.groupby('date')['delta_close_1'].transform(
-        lambda x: 1 - cs_rank(x) if x.notna().sum() > 1 else pd.Series(0.0, index=x.index)
-    )
+    # --- Part B: 1 - rank(delta(close, 1)) ---
+    part_B = 1 - op.cs_rank(op.ts_delta(panel['close'], 1), min_count=2, fill=1.0)
 
-    # --- Part 7: Sum of Part A and Part B ---
-    df['sum_parts_AB'] = df['part_A'] + df['part_B']
+    # --- Final Alpha Calculation: rank(part_A + part_B) ---
+    sum_parts_AB = part_A + part_B
+    alpha34 = op.cs_rank(sum_parts_AB, min_count=2, fill=0.0)
 
-    # --- Final Alpha Calculation: rank(sum_parts_AB) - Cross-sectional operation, re-sort by date ---
-    df['alpha34'] = df.groupby('date')['sum_parts_AB'].transform(
-        lambda x: cs_rank(x) if x.notna().sum() > 1 else pd.Series(0.0, index=x.index)
-    )
+    df['part_A'] = panel.to_long(part_A)
+    df['part_B'] = panel.to_long(part_B)
+    df['sum_parts_AB'] = panel.to_long(sum_parts_AB)
+    df['alpha34'] = panel.to_long(alpha34)
 
     # Rounding to 2 decimal places as required for final alpha
-    alpha_related_cols_to_round = [
-        'stddev_returns_2', 'stddev_returns_5', 'stddev_ratio', 'part_A',
-        'delta_close_1', 'part_B', 'sum_parts_AB', 'alpha34'
-    ]
-
-    for col in alpha_related_cols_to_round:
-        if col in df.columns:
-            if pd.api.types.is_numeric_dtype(df[col]):
-                df[col] = df[col].round(2)
-            
-    # Re-sort by date and asset_id for final output consistency
-    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
-    
+    for col in ['part_A', 'part_B', 'sum_parts_AB', 'alpha34']:
+        df[col] = df[col].round(2)
+
     # Define columns to keep, ensuring original data + new alpha + key intermediates
     original_cols = [col for col in ['date', 'asset_id', 'open', 'high', 'low', 'close', 'volume', 'vwap', 'returns'] if col in df.columns]
     
     intermediate_cols_for_output = ['part_A', 'part_B', 'sum_parts_AB'] # Keep relevant intermediates
     final_alpha_col = ['alpha34']
     
-    output_cols = original_cols + [col for col in intermediate_cols_for_output + final_alpha_col if col not in original_cols and col in df.columns]
+    output_cols = original_cols + [col for col in intermediate_cols_for_output + final_alpha_col if col not in original_cols]
 
     return df[output_cols]
 
@@ -100,7 +66,7 @@ if __name__ == "__main__":
     # --- Load Data ---
     try:
         print(f"Loading data from {DATA_FILE_PATH}...")
-        input_df = pd.read_csv(DATA_FILE_PATH)
+        input_df = load_frame(DATA_FILE_PATH, codes=True)
         print("Data loaded successfully.")
     except FileNotFoundError:
         print(f"Error: Data file not found at {DATA_FILE_PATH}.")
@@ -109,17 +75,6 @@ if __name__ == "__main__":
         print(f"Error loading data: {e}")
         exit(1)
 
-    # --- Data Preprocessing ---
-    try:
-        input_df['date'] = pd.to_datetime(input_df['date'])
-        if 'asset_id' in input_df.columns:
-            input_df['asset_id'] = input_df['asset_id'].astype(str)
-
-        print("Data preprocessing (date conversion, asset_id type) complete.")
-    except Exception as e:
-        print(f"Error during data preprocessing: {e}")
-        exit(1)
-    
     # --- Calculate Alpha ---
     try:
         print("Calculating Alpha#34...")
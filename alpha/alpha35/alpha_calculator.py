@@ -1,39 +1,45 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
-import os
 
-def ts_rank(series, window):
-    """
-    Calculates the time-series rank of a series over a specified window.
-    For each element, it ranks the current value against the values in the preceding window,
-    and then normalizes it to a [0, 1] range (percentile rank).
-    """
-    return series.rolling(window=window).apply(lambda x: pd.Series(x).rank(method='average').iloc[-1] / len(x), raw=False)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from engine import Panel, operators as op
+from engine.store import load_frame
 
 def calculate_alpha35(df):
     """
     Calculates Alpha#35 based on the given DataFrame.
     Formula: ((Ts_Rank(volume, 32) * (1 - Ts_Rank(((close + high) - low), 16))) * (1 - Ts_Rank(returns, 32)))
+
+    Ts_Rank is evaluated per asset over the panel's date axis, so windows never
+    span two assets.
+
+    Returns:
+        pd.Series: Alpha#35 values aligned with df's index.
     """
     # Ensure necessary columns exist
     required_cols = ['close', 'high', 'low', 'volume', 'returns']
     if not all(col in df.columns for col in required_cols):
         raise ValueError(f"Missing required columns. Ensure {required_cols} are in the DataFrame.")
 
+    panel = Panel.from_long(df, required_cols)
+
     # Calculate intermediate terms
-    df['price_term'] = (df['close'] + df['high'] - df['low'])
+    price_term = panel['close'] + panel['high'] - panel['low']
 
     # Apply Ts_Rank
-    df['ts_rank_volume_32'] = ts_rank(df['volume'], 32)
-    df['ts_rank_price_term_16'] = ts_rank(df['price_term'], 16)
-    df['ts_rank_returns_32'] = ts_rank(df['returns'], 32)
+    ts_rank_volume_32 = op.ts_rank(panel['volume'], 32)
+    ts_rank_price_term_16 = op.ts_rank(price_term, 16)
+    ts_rank_returns_32 = op.ts_rank(panel['returns'], 32)
 
     # Calculate Alpha#35
-    alpha35_values = (df['ts_rank_volume_32'] *
-                      (1 - df['ts_rank_price_term_16']) *
-                      (1 - df['ts_rank_returns_32']))
+    alpha35_values = (ts_rank_volume_32 *
+                      (1 - ts_rank_price_term_16) *
+                      (1 - ts_rank_returns_32))
 
-    return alpha35_values
+    return pd.Series(panel.to_long(alpha35_values), index=df.index)
 
 def main():
     script_dir = os.path.dirname(__file__)
@@ -41,7 +47,7 @@ def main():
     output_path = os.path.join(script_dir, 'alpha35_results.csv')
 
     try:
-        df = pd.read_csv(data_path)
+        df = load_frame(data_path, codes=True)
     except FileNotFoundError:
         print(f"Error: Data file not found at {data_path}. Please ensure mock_data.csv exists in the data/ directory.")
         return
@@ -58,8 +64,8 @@ def main():
     # Calculate Alpha#35
     df['Alpha#35'] = calculate_alpha35(df)
 
-    # Keep original data and Alpha#35, drop intermediate columns
-    final_df = df.drop(columns=['price_term', 'ts_rank_volume_32', 'ts_rank_price_term_16', 'ts_rank_returns_32'], errors='ignore')
+    # Keep original data and Alpha#35
+    final_df = df.copy()
 
     # Round Alpha#35 to two decimal places
     final_df['Alpha#35'] = final_df['Alpha#35'].round(2)
@@ -1,31 +1,13 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-# --- Helper Functions ---
-
-def cs_rank(series: pd.Series) -> pd.Series:
-    """Cross-sectional rank (percentage)."""
-    return series.rank(method='average', pct=True)
-
-def ts_delay(series: pd.Series, period: int) -> pd.Series:
-    """Time-series delay."""
-    return series.shift(period)
-
-def ts_correlation(series1: pd.Series, series2: pd.Series, period: int) -> pd.Series:
-    """Time-series correlation."""
-    return series1.rolling(window=period).corr(series2)
-
-def ts_rank(series: pd.Series, period: int) -> pd.Series:
-    """Time-series rank."""
-    return series.rolling(window=period).apply(lambda x: x.rank(pct=True).iloc[-1], raw=False)
-
-def ts_sum(series: pd.Series, period: int) -> pd.Series:
-    """Time-series sum."""
-    return series.rolling(window=period).sum()
-
-def ts_mean(series: pd.Series, period: int) -> pd.Series:
-    """Time-series mean."""
-    return series.rolling(window=period).mean()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from engine import Panel, operators as op
+from engine.output import write_csv
+from engine.store import load_frame
 
 # --- Main Alpha Calculation Function ---
 
@@ -38,55 +20,37 @@ def calculate_alpha36(df: pd.DataFrame) -> pd.DataFrame:
         if col not in df.columns:
             raise ValueError(f"Required column '{col}' not found in DataFrame.")
 
-    df = df.sort_values(by=['asset_id', 'date']).copy()
+    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
+    panel = Panel.from_long(df, required_cols)
+    open_, close = panel['open'], panel['close']
 
     # --- Pre-calculations ---
     # adv20: 20-day average daily dollar volume
-    df['dollar_volume'] = df['close'] * df['volume']
-    df['adv20'] = df.groupby('asset_id')['dollar_volume'].transform(lambda x: ts_mean(x, 20))
+    adv20 = op.ts_mean(close * panel['volume'], 20)
 
     # --- Term 1 ---
-    df['close_minus_open'] = df['close'] - df['open']
-    df['delayed_volume_1'] = df.groupby('asset_id')['volume'].transform(lambda x: ts_delay(x, 1))
-    df['corr_15d'] = df.groupby('asset_id').apply(
-        lambda x: ts_correlation(x['close_minus_open'], x['delayed_volume_1'], 15)
-    ).reset_index(level=0, drop=True)
-    
-    df = df.sort_values(by=['date', 'asset_id'])
-    df['term1'] = 2.21 * df.groupby('date')['corr_15d'].transform(cs_rank)
+    corr_15d = op.ts_correlation(close - open_, op.ts_delay(panel['volume'], 1), 15)
+    term1 = 2.21 * op.cs_rank(corr_15d)
 
     # --- Term 2 ---
-    df['open_minus_close'] = df['open'] - df['close']
-    df['term2'] = 0.7 * df.groupby('date')['open_minus_close'].transform(cs_rank)
+    term2 = 0.7 * op.cs_rank(open_ - close)
 
     # --- Term 3 ---
-    df = df.sort_values(by=['asset_id', 'date'])
-    df['neg_returns_delayed_6'] = df.groupby('asset_id')['returns'].transform(lambda x: ts_delay(-1 * x, 6))
-    df['ts_rank_5d'] = df.groupby('asset_id')['neg_returns_delayed_6'].transform(lambda x: ts_rank(x, 5))
-    
-    df = df.sort_values(by=['date', 'asset_id'])
-    df['term3'] = 0.73 * df.groupby('date')['ts_rank_5d'].transform(cs_rank)
+    ts_rank_5d = op.ts_rank(op.ts_delay(-1 * panel['returns'], 6), 5)
+    term3 = 0.73 * op.cs_rank(ts_rank_5d)
 
     # --- Term 4 ---
-    df = df.sort_values(by=['asset_id', 'date'])
-    df['corr_vwap_adv20_6d'] = df.groupby('asset_id').apply(
-        lambda x: ts_correlation(x['vwap'], x['adv20'], 6)
-    ).reset_index(level=0, drop=True)
-    df['abs_corr'] = df['corr_vwap_adv20_6d'].abs()
-    
-    df = df.sort_values(by=['date', 'asset_id'])
-    df['term4'] = df.groupby('date')['abs_corr'].transform(cs_rank)
+    abs_corr = np.abs(op.ts_correlation(panel['vwap'], adv20, 6))
+    term4 = op.cs_rank(abs_corr)
 
     # --- Term 5 ---
-    df = df.sort_values(by=['asset_id', 'date'])
-    df['sum_close_200'] = df.groupby('asset_id')['close'].transform(lambda x: ts_sum(x, 200))
-    df['avg_close_200'] = df['sum_close_200'] / 200
-    df['value_momentum_interaction'] = (df['avg_close_200'] - df['open']) * (df['close'] - df['open'])
-    
-    df = df.sort_values(by=['date', 'asset_id'])
-    df['term5'] = 0.6 * df.groupby('date')['value_momentum_interaction'].transform(cs_rank)
-    
+    avg_close_200 = op.ts_sum(close, 200) / 200
+    value_momentum_interaction = (avg_close_200 - open_) * (close - open_)
+    term5 = 0.6 * op.cs_rank(value_momentum_interaction)
+
     # --- Final Alpha Calculation ---
+    for name, term in [('term1', term1), ('term2', term2), ('term3', term3), ('term4', term4), ('term5', term5)]:
+        df[name] = panel.to_long(term)
     df['alpha36'] = df['term1'] + df['term2'] + df['term3'] + df['term4'] + df['term5']
 
     # --- Output Formatting ---
@@ -95,18 +59,14 @@ def calculate_alpha36(df: pd.DataFrame) -> pd.DataFrame:
         'term1', 'term2', 'term3', 'term4', 'term5', 'alpha36'
     ]
     for col in alpha_related_cols_to_round:
-        if col in df.columns and pd.api.types.is_numeric_dtype(df[col]):
-            df[col] = df[col].round(2)
-            
-    # Re-sort for final output consistency
-    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
-    
+        df[col] = df[col].round(2)
+
     # Define columns to keep
     original_cols = [col for col in ['date', 'asset_id', 'open', 'high', 'low', 'close', 'volume', 'vwap', 'returns'] if col in df.columns]
     intermediate_cols_for_output = ['term1', 'term2', 'term3', 'term4', 'term5']
     final_alpha_col = ['alpha36']
     
-    output_cols = original_cols + [col for col in intermediate_cols_for_output + final_alpha_col if col not in original_cols and col in df.columns]
+    output_cols = original_cols + [col for col in intermediate_cols_for_output + final_alpha_col if col not in original_cols]
 
     return df[output_cols]
 
@@ -116,10 +76,7 @@ if __name__ == "__main__":
     OUTPUT_FILE_PATH = "alpha36_results.csv"
 
     try:
-        input_df = pd.read_csv(DATA_FILE_PATH)
-        input_df['date'] = pd.to_datetime(input_df['date'])
-        if 'asset_id' in input_df.columns:
-            input_df['asset_id'] = input_df['asset_id'].astype(str)
+        input_df = load_frame(DATA_FILE_PATH, codes=True)
         print("Data loaded and preprocessed successfully.")
     except FileNotFoundError:
         print(f"Error: Data file not found at {DATA_FILE_PATH}.")
@@ -139,7 +96,7 @@ if __name__ == "__main__":
         exit(1)
 
     try:
-        alpha_df_output.to_csv(OUTPUT_FILE_PATH, index=False, float_format='%.2f')
+        write_csv(alpha_df_output, OUTPUT_FILE_PATH, float_format='%.2f')
         print(f"Alpha#36 results saved to {OUTPUT_FILE_PATH}")
     except Exception as e:
         print(f"Error saving results to CSV: {e}")
@@ -1,21 +1,11 @@
-import pandas as pd
-import numpy as np
-
-# --- Helper Functions ---
-
-def cs_rank(series: pd.Series) -> pd.Series:
-    """Cross-sectional rank (percentage)."""
-    return series.rank(method='average', pct=True)
+import os
+import sys
 
-def ts_delay(series: pd.Series, period: int) -> pd.Series:
-    """Time-series delay: value of series 'period' days ago."""
-    return series.shift(period)
+import pandas as pd
 
-def ts_correlation(series_x: pd.Series, series_y: pd.Series, period: int) -> pd.Series:
-    """Time-series correlation of series_x and series_y over the past period."""
-    # Ensure both series are aligned for correlation calculation
-    # The rolling correlation function inherently handles alignment based on index
-    return series_x.rolling(window=period, min_periods=period).corr(series_y)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from engine import Panel, operators as op
+from engine.store import load_frame
 
 # --- Main Alpha Calculation Function ---
 
@@ -29,59 +19,41 @@ def calculate_alpha37(df: pd.DataFrame) -> pd.DataFrame:
         if col not in df.columns:
             raise ValueError(f"Required column '{col}' not found in DataFrame.")
 
-    # Ensure data is sorted by asset_id then date for time-series operations
-    df = df.sort_values(by=['asset_id', 'date']).copy()
+    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
+    panel = Panel.from_long(df, required_cols)
 
     # --- Part 1: (open - close) ---
-    df['oc_diff'] = df['open'] - df['close']
-
-    # --- Part 2: delay((open - close), 1) ---
-    df['oc_diff_delay1'] = df.groupby('asset_id')['oc_diff'].transform(lambda x: ts_delay(x, 1))
-
-    # --- Part 3: correlation(delay((open - close), 1), close, 200) ---
-    # Group by asset_id and apply rolling correlation
-    # For rolling correlation, ensure both series are passed to corr, not just one.
-    # The `transform` applies the grouped operation back to the original DataFrame's shape.
-    df['corr_oc_delay1_close_200'] = df.groupby('asset_id').apply(
-        lambda x: ts_correlation(x['oc_diff_delay1'], x['close'], 200)
-    ).reset_index(level=0, drop=True) # Reset index from apply to merge back correctly
-
-    # --- Part 4: rank(correlation(delay((open - close), 1), close, 200)) - Cross-sectional operation ---
-    df = df.sort_values(by=['date', 'asset_id'])
-    df['ranked_corr'] = df.groupby('date')['corr_oc_delay1_close_200'].transform(
-        lambda x: cs_rank(x) if x.notna().sum() > 1 else pd.Series(np.nan, index=x.index) # Use NaN for insufficient data
-    )
-
-    # --- Part 5: rank((open - close)) - Cross-sectional operation ---
-    df['ranked_oc_diff'] = df.groupby('date')['oc_diff'].transform(
-        lambda x: cs_rank(x) if x.notna().sum() > 1 else pd.Series(np.nan, index=x.index) # Use NaN for insufficient data
-    )
+    oc_diff = panel['open'] - panel['close']
+
+    # --- Part 2 & 3: correlation(delay((open - close), 1), close, 200) ---
+    corr_oc_delay1_close_200 = op.ts_correlation(op.ts_delay(oc_diff, 1), panel['close'], 200)
+
+    # --- Part 4 & 5: cross-sectional ranks, NaN for dates with insufficient data ---
+    ranked_corr = op.cs_rank(corr_oc_delay1_close_200, min_count=2)
+    ranked_oc_diff = op.cs_rank(oc_diff, min_count=2)
+
+    df['oc_diff'] = panel.to_long(oc_diff)
+    df['corr_oc_delay1_close_200'] = panel.to_long(corr_oc_delay1_close_200)
+    df['ranked_corr'] = panel.to_long(ranked_corr)
+    df['ranked_oc_diff'] = panel.to_long(ranked_oc_diff)
 
     # --- Final Alpha Calculation: sum of ranks ---
     df['alpha37'] = df['ranked_corr'] + df['ranked_oc_diff']
 
     # Rounding to 2 decimal places as required for final alpha and relevant intermediates
     alpha_related_cols_to_round = [
-        'oc_diff', 'oc_diff_delay1', 'corr_oc_delay1_close_200',
-        'ranked_corr', 'ranked_oc_diff', 'alpha37'
+        'oc_diff', 'corr_oc_delay1_close_200', 'ranked_corr', 'ranked_oc_diff', 'alpha37'
     ]
-
     for col in alpha_related_cols_to_round:
-        if col in df.columns:
-            if pd.api.types.is_numeric_dtype(df[col]):
-                # Use .loc to avoid SettingWithCopyWarning, especially with chained operations
-                df.loc[:, col] = df[col].round(2)
-            
-    # Re-sort by date and asset_id for final output consistency
-    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
-    
+        df[col] = df[col].round(2)
+
     # Define columns to keep, ensuring original data + new alpha + key intermediates
     original_cols = [col for col in ['date', 'asset_id', 'open', 'high', 'low', 'close', 'volume', 'vwap', 'returns'] if col in df.columns]
     
     intermediate_cols_for_output = ['oc_diff', 'corr_oc_delay1_close_200', 'ranked_corr', 'ranked_oc_diff']
     final_alpha_col = ['alpha37']
     
-    output_cols = original_cols + [col for col in intermediate_cols_for_output + final_alpha_col if col not in original_cols and col in df.columns]
+    output_cols = original_cols + [col for col in intermediate_cols_for_output + final_alpha_col if col not in original_cols]
 
     return df[output_cols]
 
@@ -94,7 +66,7 @@ if __name__ == "__main__":
     # --- Load Data ---
     try:
         print(f"Loading data from {DATA_FILE_PATH}...")
-        input_df = pd.read_csv(DATA_FILE_PATH)
+        input_df = load_frame(DATA_FILE_PATH, codes=True)
         print("Data loaded successfully.")
     except FileNotFoundError:
         print(f"Error: Data file not found at {DATA_FILE_PATH}.")
@@ -103,17 +75,6 @@ if __name__ == "__main__":
         print(f"Error loading data: {e}")
         exit(1)
 
-    # --- Data Preprocessing ---
-    try:
-        input_df['date'] = pd.to_datetime(input_df['date'])
-        if 'asset_id' in input_df.columns:
-            input_df['asset_id'] = input_df['asset_id'].astype(str)
-
-        print("Data preprocessing (date conversion, asset_id type) complete.")
-    except Exception as e:
-        print(f"Error during data preprocessing: {e}")
-        exit(1)
-    
     # --- Calculate Alpha ---
     try:
         print("Calculating Alpha#37...")
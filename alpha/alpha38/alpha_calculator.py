@@ -1,15 +1,13 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-# --- Helper Functions ---
-
-def cs_rank(series: pd.Series) -> pd.Series:
-    """Cross-sectional rank (percentage)."""
-    return series.rank(method='average', pct=True)
-
-def ts_rank(series: pd.Series, period: int) -> pd.Series:
-    """Time-series rank over the past period."""
-    return series.rolling(window=period, min_periods=period).apply(lambda x: x.rank(method='average', pct=True).iloc[-1], raw=False)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from engine import Panel, operators as op
+from engine.output import write_csv
+from engine.store import load_frame
 
 # --- Main Alpha Calculation Function ---
 
@@ -23,59 +21,49 @@ def calculate_alpha38(df: pd.DataFrame) -> pd.DataFrame:
         if col not in df.columns:
             raise ValueError(f"Required column '{col}' not found in DataFrame.")
 
-    # Ensure data is sorted by asset_id then date for time-series operations
-    df = df.sort_values(by=['asset_id', 'date']).copy()
+    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
+    panel = Panel.from_long(df, required_cols)
 
     # --- Part 1: (close / open) ---
-    df['close_over_open'] = df['close'] / df['open']
-    # Handle division by zero or very small open values if they exist by replacing with NaN or inf
-    df.loc[df['open'] == 0, 'close_over_open'] = np.nan # Or np.inf if that's desired behavior
+    # Zero open prices yield NaN instead of inf
+    with np.errstate(divide='ignore', invalid='ignore'):
+        close_over_open = panel['close'] / panel['open']
+    close_over_open[panel['open'] == 0] = np.nan
 
     # --- Part 2: Ts_Rank(close, 10) ---
-    df['ts_rank_close_10'] = df.groupby('asset_id')['close'].transform(lambda x: ts_rank(x, 10))
+    ts_rank_close_10 = op.ts_rank(panel['close'], 10)
 
-    # --- Part 3: rank(Ts_Rank(close, 10)) - Cross-sectional operation ---
-    df = df.sort_values(by=['date', 'asset_id'])
-    df['ranked_ts_rank_close_10'] = df.groupby('date')['ts_rank_close_10'].transform(
-        lambda x: cs_rank(x) if x.notna().sum() > 1 else pd.Series(np.nan, index=x.index) # Use NaN for insufficient data
-    )
+    # --- Part 3 & 4: (-1 * rank(Ts_Rank(close, 10))), NaN for dates with insufficient data ---
+    ranked_ts_rank_close_10 = op.cs_rank(ts_rank_close_10, min_count=2)
+    neg_ranked_ts_rank = -1 * ranked_ts_rank_close_10
 
-    # --- Part 4: (-1 * rank(Ts_Rank(close, 10))) ---
-    df['neg_ranked_ts_rank'] = -1 * df['ranked_ts_rank_close_10']
+    # --- Part 5: rank((close / open)) ---
+    ranked_close_over_open = op.cs_rank(close_over_open, min_count=2)
 
-    # --- Part 5: rank((close / open)) - Cross-sectional operation ---
-    df['ranked_close_over_open'] = df.groupby('date')['close_over_open'].transform(
-        lambda x: cs_rank(x) if x.notna().sum() > 1 else pd.Series(np.nan, index=x.index) # Use NaN for insufficient data
-    )
+    intermediates = {
+        'close_over_open': close_over_open,
+        'ts_rank_close_10': ts_rank_close_10,
+        'ranked_ts_rank_close_10': ranked_ts_rank_close_10,
+        'neg_ranked_ts_rank': neg_ranked_ts_rank,
+        'ranked_close_over_open': ranked_close_over_open,
+    }
+    for name, values in intermediates.items():
+        df[name] = panel.to_long(values)
 
     # --- Final Alpha Calculation: Multiplication of ranks ---
     df['alpha38'] = df['neg_ranked_ts_rank'] * df['ranked_close_over_open']
 
     # Rounding to 2 decimal places as required for final alpha and relevant intermediates
-    alpha_related_cols_to_round = [
-        'close_over_open', 'ts_rank_close_10', 'ranked_ts_rank_close_10',
-        'neg_ranked_ts_rank', 'ranked_close_over_open', 'alpha38'
-    ]
-
-    for col in alpha_related_cols_to_round:
-        if col in df.columns:
-            if pd.api.types.is_numeric_dtype(df[col]):
-                # Use .loc to avoid SettingWithCopyWarning, especially with chained operations
-                df.loc[:, col] = df[col].round(2)
-            
-    # Re-sort by date and asset_id for final output consistency
-    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
-    
+    for col in list(intermediates) + ['alpha38']:
+        df[col] = df[col].round(2)
+
     # Define columns to keep, ensuring original data + new alpha + key intermediates
     original_cols = [col for col in ['date', 'asset_id', 'open', 'high', 'low', 'close', 'volume', 'vwap', 'returns'] if col in df.columns]
     
-    intermediate_cols_for_output = [
-        'close_over_open', 'ts_rank_close_10', 'ranked_ts_rank_close_10',
-        'neg_ranked_ts_rank', 'ranked_close_over_open'
-    ]
+    intermediate_cols_for_output = list(intermediates)
     final_alpha_col = ['alpha38']
     
-    output_cols = original_cols + [col for col in intermediate_cols_for_output + final_alpha_col if col not in original_cols and col in df.columns]
+    output_cols = original_cols + [col for col in intermediate_cols_for_output + final_alpha_col if col not in original_cols]
 
     return df[output_cols]
 
@@ -88,7 +76,7 @@ if __name__ == "__main__":
     # --- Load Data ---
     try:
         print(f"Loading data from {DATA_FILE_PATH}...")
-        input_df = pd.read_csv(DATA_FILE_PATH)
+        input_df = load_frame(DATA_FILE_PATH, codes=True)
         print("Data loaded successfully.")
     except FileNotFoundError:
         print(f"Error: Data file not found at {DATA_FILE_PATH}.")
@@ -97,17 +85,6 @@ if __name__ == "__main__":
         print(f"Error loading data: {e}")
         exit(1)
 
-    # --- Data Preprocessing ---
-    try:
-        input_df['date'] = pd.to_datetime(input_df['date'])
-        if 'asset_id' in input_df.columns:
-            input_df['asset_id'] = input_df['asset_id'].astype(str)
-
-        print("Data preprocessing (date conversion, asset_id type) complete.")
-    except Exception as e:
-        print(f"Error during data preprocessing: {e}")
-        exit(1)
-    
     # --- Calculate Alpha ---
     try:
         print("Calculating Alpha#38...")
@@ -126,7 +103,7 @@ if __name__ == "__main__":
     # --- Save Results ---
     try:
         # Use float_format to ensure 2 decimal places for floats in the CSV
-        alpha_df_output.to_csv(OUTPUT_FILE_PATH, index=False, float_format='%.2f')
+        write_csv(alpha_df_output, OUTPUT_FILE_PATH, float_format='%.2f')
         print(f"Alpha#38 results saved to {OUTPUT_FILE_PATH}")
     except Exception as e:
         print(f"Error saving results to CSV: {e}")
@@ -1,11 +1,12 @@
-import pandas as pd
-import numpy as np
+import os
+import sys
 
-# --- Helper Functions ---
+import pandas as pd
 
-def cs_rank(series: pd.Series) -> pd.Series:
-    """Cross-sectional rank (percentage)."""
-    return series.rank(method='average', pct=True)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from engine import Panel, operators as op
+from engine.output import write_csv
+from engine.store import load_frame
 
 # --- Main Alpha Calculation Function ---
 
@@ -19,26 +20,21 @@ def calculate_alpha40(df: pd.DataFrame) -> pd.DataFrame:
         if col not in df.columns:
             raise ValueError(f"Required column '{col}' not found in DataFrame.")
 
-    # Ensure data is sorted by asset_id then date for time-series operations
-    df = df.sort_values(by=['asset_id', 'date']).copy()
+    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
+    panel = Panel.from_long(df, required_cols)
 
     # --- Component 1: stddev(high, 10) ---
-    df['stddev_high_10'] = df.groupby('asset_id')['high'].transform(lambda x: x.rolling(window=10, min_periods=10).std())
+    stddev_high_10 = op.ts_stddev(panel['high'], 10)
 
-    # --- Component 2: rank(stddev(high, 10)) ---
-    # Sort by date for cross-sectional ranking
-    df = df.sort_values(by=['date', 'asset_id'])
-    df['rank_stddev_high_10'] = df.groupby('date')['stddev_high_10'].transform(
-        lambda x: cs_rank(x) if x.notna().sum() > 1 else pd.Series(np.nan, index=x.index)
-    )
+    # --- Component 2: rank(stddev(high, 10)), NaN for dates with insufficient data ---
+    rank_stddev_high_10 = op.cs_rank(stddev_high_10, min_count=2)
 
     # --- Component 3: correlation(high, volume, 10) ---
-    # Sort back by asset then date for time-series correlation
-    df = df.sort_values(by=['asset_id', 'date'])
-    df['corr_high_volume_10'] = df.groupby('asset_id').apply(
-        lambda g: g['high'].rolling(window=10, min_periods=10).corr(g['volume'])
-    ).reset_index(level=0, drop=True)
+    corr_high_volume_10 = op.ts_correlation(panel['high'], panel['volume'], 10)
 
+    df['stddev_high_10'] = panel.to_long(stddev_high_10)
+    df['rank_stddev_high_10'] = panel.to_long(rank_stddev_high_10)
+    df['corr_high_volume_10'] = panel.to_long(corr_high_volume_10)
 
     # --- Final Alpha Calculation ---
     # Formula: ((-1 * rank(stddev(high, 10))) * correlation(high, volume, 10))
@@ -48,13 +44,8 @@ def calculate_alpha40(df: pd.DataFrame) -> pd.DataFrame:
     alpha_related_cols_to_round = [
         'stddev_high_10', 'rank_stddev_high_10', 'corr_high_volume_10', 'alpha40'
     ]
-
     for col in alpha_related_cols_to_round:
-        if col in df.columns:
-            if pd.api.types.is_numeric_dtype(df[col]):
-                df.loc[:, col] = df[col].round(2)
-
-    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
+        df[col] = df[col].round(2)
 
     original_cols = [col for col in ['date', 'asset_id', 'open', 'high', 'low', 'close', 'volume', 'vwap', 'returns'] if col in df.columns]
 
@@ -63,7 +54,7 @@ def calculate_alpha40(df: pd.DataFrame) -> pd.DataFrame:
     ]
     final_alpha_col = ['alpha40']
 
-    output_cols = original_cols + [col for col in intermediate_cols_for_output + final_alpha_col if col not in original_cols and col in df.columns]
+    output_cols = original_cols + [col for col in intermediate_cols_for_output + final_alpha_col if col not in original_cols]
 
     return df[output_cols]
 
@@ -76,7 +67,7 @@ if __name__ == "__main__":
     # --- Load Data ---
     try:
         print(f"Loading data from {DATA_FILE_PATH}...")
-        input_df = pd.read_csv(DATA_FILE_PATH)
+        input_df = load_frame(DATA_FILE_PATH, codes=True)
         print("Data loaded successfully.")
     except FileNotFoundError:
         print(f"Error: Data file not found at {DATA_FILE_PATH}.")
@@ -85,17 +76,6 @@ if __name__ == "__main__":
         print(f"Error loading data: {e}")
         exit(1)
 
-    # --- Data Preprocessing ---
-    try:
-        input_df['date'] = pd.to_datetime(input_df['date'])
-        if 'asset_id' in input_df.columns:
-            input_df['asset_id'] = input_df['asset_id'].astype(str)
-
-        print("Data preprocessing (date conversion, asset_id type) complete.")
-    except Exception as e:
-        print(f"Error during data preprocessing: {e}")
-        exit(1)
-
     # --- Calculate Alpha ---
     try:
         print("Calculating Alpha#40...")
@@ -116,7 +96,7 @@ if __name__ == "__main__":
         alpha_df_output = alpha_df_output.dropna(subset=['alpha40'])
 
         # Use float_format to ensure 2 decimal places for floats in the CSV
-        alpha_df_output.to_csv(OUTPUT_FILE_PATH, index=False, float_format='%.2f')
+        write_csv(alpha_df_output, OUTPUT_FILE_PATH, float_format='%.2f')
         print(f"Alpha#40 results saved to {OUTPUT_FILE_PATH}")
     except Exception as e:
         print(f"Error saving results to CSV: {e}")
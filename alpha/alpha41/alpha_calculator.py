@@ -1,6 +1,11 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from engine.output import write_csv
+from engine.store import load_frame
 
 def calculate_alpha41(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -43,18 +48,12 @@ if __name__ == "__main__":
     # --- 加载数据 ---
     try:
         print(f"正在从 {DATA_FILE_PATH} 加载数据...")
-        input_df = pd.read_csv(DATA_FILE_PATH)
+        input_df = load_frame(DATA_FILE_PATH, codes=True)
         print("数据加载成功。")
     except FileNotFoundError:
         print(f"错误: 在 {DATA_FILE_PATH} 未找到数据文件。")
         exit(1)
 
-    # --- 数据预处理 ---
-    input_df['date'] = pd.to_datetime(input_df['date'])
-    if 'asset_id' in input_df.columns:
-        input_df['asset_id'] = input_df['asset_id'].astype(str)
-    print("数据预处理完成。")
-
     # --- 计算 Alpha ---
     try:
         print(f"正在计算 Alpha#{ALPHA_NUMBER}...")
@@ -78,7 +77,7 @@ if __name__ == "__main__":
     final_df = alpha_df_filtered[output_cols]
 
     try:
-        final_df.to_csv(OUTPUT_FILE_PATH, index=False, float_format='%.2f')
+        write_csv(final_df, OUTPUT_FILE_PATH, float_format='%.2f')
         print(f"Alpha#{ALPHA_NUMBER} 结果已保存至 {OUTPUT_FILE_PATH}")
     except Exception as e:
         print(f"保存结果至CSV时出错: {e}")
@@ -1,21 +1,11 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-def signed_power(series, exponent):
-    """
-    Computes sign(series) * (abs(series) ** exponent).
-    """
-    return np.sign(series) * (np.abs(series) ** exponent)
-
-def ts_arg_max(series, window):
-    """
-    对每一天，返回过去window天内最大值出现的位置（0为今天，1为昨天，依此类推）。
-    """
-    def argmax_pos(x):
-        # x为长度window的Series
-        return window - 1 - np.argmax(x.values[::-1])
-    return series.rolling(window=window, min_periods=1).apply(argmax_pos, raw=False)
-
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
 
 def calculate_alpha1(df, stddev_window=20, ts_argmax_window=5):
     """
@@ -26,34 +16,29 @@ def calculate_alpha1(df, stddev_window=20, ts_argmax_window=5):
     """
     # Ensure data is sorted by date for rolling calculations
     df = df.sort_values(by=['asset_id', 'date'])
+    panel = Panel.from_long(df, ['close', 'returns'])
+    returns = panel['returns']
 
     # Calculate stddev_returns for each asset
-    df['stddev_returns'] = df.groupby('asset_id')['returns'].transform(
-        lambda x: x.rolling(window=stddev_window, min_periods=1).std()
-    )
+    stddev_returns = op.ts_stddev(returns, stddev_window, min_periods=1)
 
     # Condition: (returns < 0) ? stddev(returns, 20) : close
-    df['conditional_value'] = np.where(df['returns'] < 0, df['stddev_returns'], df['close'])
+    conditional_value = np.where(returns < 0, stddev_returns, panel['close'])
 
     # SignedPower(conditional_value, 2.)
-    df['signed_power_value'] = df.groupby('asset_id')['conditional_value'].transform(
-        lambda x: signed_power(x, 2.0)
-    )
     # Fill NaNs that might result from signed_power if conditional_value was NaN (e.g. early stddev)
-    df['signed_power_value'] = df['signed_power_value'].fillna(0)
+    signed_power_value = np.nan_to_num(op.signed_power(conditional_value, 2.0), nan=0.0)
 
     # Ts_ArgMax(SignedPower_value, 5)
     # 返回最大值出现的相对天数
-    df['ts_argmax_value'] = df.groupby('asset_id')['signed_power_value'].transform(
-        lambda x: ts_arg_max(x, window=ts_argmax_window)
-    )
+    ts_argmax_value = op.ts_argmax(signed_power_value, ts_argmax_window, min_periods=1)
 
     # rank(ts_argmax_value)
     # Rank is calculated daily across all assets
-    df['rank_ts_argmax'] = df.groupby('date')['ts_argmax_value'].rank(pct=True, method='average')
+    rank_ts_argmax = op.cs_rank(ts_argmax_value)
 
     # Final Alpha: (rank - 0.5)
-    df['alpha1'] = round(df['rank_ts_argmax'] - 0.5, 2)
+    df['alpha1'] = np.round(panel.to_long(rank_ts_argmax) - 0.5, 2)
 
     return df[['date', 'asset_id', 'close', 'returns', 'alpha1']]
 
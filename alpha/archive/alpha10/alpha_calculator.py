@@ -1,27 +1,11 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-def calculate_delta(series, period=1):
-    """Helper to calculate difference, ensuring enough periods or NaN."""
-    if len(series) < period + 1: # Need period+1 observations for one difference
-        return pd.Series([np.nan] * len(series), index=series.index)
-    return series.diff(periods=period)
-
-def ts_min(series, window):
-    """Helper for time-series min over a rolling window."""
-    if len(series) < window:
-        return pd.Series([np.nan] * len(series), index=series.index)
-    return series.rolling(window=window, min_periods=window).min()
-
-def ts_max(series, window):
-    """Helper for time-series max over a rolling window."""
-    if len(series) < window:
-        return pd.Series([np.nan] * len(series), index=series.index)
-    return series.rolling(window=window, min_periods=window).max()
-
-def rank_pct(series):
-    """Helper for cross-sectional rank (percentile)."""
-    return series.rank(pct=True)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
 
 def calculate_alpha10(df, delta_period=1, ts_window=4):
     """
@@ -37,42 +21,33 @@ def calculate_alpha10(df, delta_period=1, ts_window=4):
         pd.DataFrame: DataFrame with Alpha#10 values and intermediate calculations.
     """
     df = df.sort_values(by=['asset_id', 'date']).copy()
+    panel = Panel.from_long(df, ['close'])
 
     # Calculate delta(close, 1)
-    df['delta_close_1'] = df.groupby('asset_id')['close'].transform(
-        lambda x: calculate_delta(x, delta_period)
-    )
-
-    # Calculate ts_min(delta(close, 1), 4)
-    df['ts_min_delta_close_1_4'] = df.groupby('asset_id')['delta_close_1'].transform(
-        lambda x: ts_min(x, ts_window)
-    )
-
-    # Calculate ts_max(delta(close, 1), 4)
-    df['ts_max_delta_close_1_4'] = df.groupby('asset_id')['delta_close_1'].transform(
-        lambda x: ts_max(x, ts_window)
-    )
-
-    # Apply the conditional logic to determine the intermediate value
-    condition1 = 0 < df['ts_min_delta_close_1_4']
-    condition2 = df['ts_max_delta_close_1_4'] < 0
-
-    df['intermediate_value'] = np.select(
+    delta_close_1 = op.ts_delta(panel['close'], delta_period)
+
+    # Calculate ts_min / ts_max(delta(close, 1), 4); NaN until a full window is available
+    ts_min_delta_close_1_4 = op.ts_min(delta_close_1, ts_window)
+    ts_max_delta_close_1_4 = op.ts_max(delta_close_1, ts_window)
+
+    # Apply the conditional logic to determine the intermediate value.
+    # NaN comparisons are False, so a missing ts_min/ts_max falls through to
+    # the default, and a missing delta_close_1 stays NaN.
+    condition1 = 0 < ts_min_delta_close_1_4
+    condition2 = ts_max_delta_close_1_4 < 0
+    intermediate_value = np.select(
         [condition1, condition2],
-        [df['delta_close_1'], df['delta_close_1']],
-        default=(-1 * df['delta_close_1'])
+        [delta_close_1, delta_close_1],
+        default=(-1 * delta_close_1)
     )
-    
-    # Handle NaNs from conditions or inputs propagating to intermediate_value
-    # If delta_close_1 is NaN, intermediate_value will be NaN.
-    # If ts_min or ts_max is NaN, the conditions might evaluate in an unexpected way for np.select if not careful.
-    # However, np.select propagates NaNs from the choicelist correctly.
-    # NaNs in condition arrays: condition1/2 will be False if ts_min/ts_max is NaN. This leads to default.
-    # If default's component (-1 * delta_close_1) is NaN, then intermediate is NaN.
-    # This seems to handle NaN propagation correctly based on np.select behavior.
 
     # Calculate rank of the intermediate value (cross-sectional rank for each day)
-    df['alpha10'] = df.groupby('date')['intermediate_value'].transform(rank_pct)
+    alpha10 = op.cs_rank(intermediate_value)
+
+    for name, values in [('delta_close_1', delta_close_1), ('ts_min_delta_close_1_4', ts_min_delta_close_1_4),
+                         ('ts_max_delta_close_1_4', ts_max_delta_close_1_4),
+                         ('intermediate_value', intermediate_value), ('alpha10', alpha10)]:
+        df[name] = panel.to_long(values)
 
     # Round final alpha and intermediate steps for clarity in output
     df['alpha10'] = df['alpha10'].round(2)
@@ -1,5 +1,11 @@
+import os
+import sys
+
 import pandas as pd
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+
 # 读取数据
 def load_data():
     data_path = '../../data/mock_data.csv'
@@ -16,24 +22,31 @@ def load_data():
 def calculate_alpha11(df):
     # 确保数据按 asset_id 和 date 排序
     df = df.sort_values(by=['asset_id', 'date']).reset_index(drop=True)
+    panel = Panel.from_long(df, ['close', 'vwap', 'volume'])
 
     # 计算 vwap - close
-    df['vwap_close_diff'] = (df['vwap'] - df['close']).round(4) # 保留更多小数位以提高中间计算精度
+    vwap_close_diff = (panel['vwap'] - panel['close']).round(4) # 保留更多小数位以提高中间计算精度
 
-    # 按 asset_id 分组计算时间序列相关的指标
+    # 按资产计算时间序列相关的指标 (日期 × 资产矩阵)
     # ts_max((vwap - close), 3)
-    df['ts_max_diff_3'] = df.groupby('asset_id')['vwap_close_diff'].rolling(window=3, min_periods=3).max().reset_index(level=0, drop=True).round(4)
+    ts_max_diff_3 = op.ts_max(vwap_close_diff, 3).round(4)
     
     # ts_min((vwap - close), 3)
-    df['ts_min_diff_3'] = df.groupby('asset_id')['vwap_close_diff'].rolling(window=3, min_periods=3).min().reset_index(level=0, drop=True).round(4)
+    ts_min_diff_3 = op.ts_min(vwap_close_diff, 3).round(4)
     
     # delta(volume, 3)
-    df['delta_volume_3'] = df.groupby('asset_id')['volume'].transform(lambda x: x.diff(3)).round(4)
+    delta_volume_3 = op.ts_delta(panel['volume'], 3).round(4)
+
+    # 每日截面排名 (百分比形式 0-1)
+    rank_ts_max_diff_3 = op.cs_rank(ts_max_diff_3)
+    rank_ts_min_diff_3 = op.cs_rank(ts_min_diff_3)
+    rank_delta_volume_3 = op.cs_rank(delta_volume_3)
 
-    # 按 date 分组进行截面排名 (pct=True 将排名转换为百分比形式 0-1)
-    df['rank_ts_max_diff_3'] = df.groupby('date')['ts_max_diff_3'].rank(method='average', ascending=True, pct=True, na_option='keep')
-    df['rank_ts_min_diff_3'] = df.groupby('date')['ts_min_diff_3'].rank(method='average', ascending=True, pct=True, na_option='keep')
-    df['rank_delta_volume_3'] = df.groupby('date')['delta_volume_3'].rank(method='average', ascending=True, pct=True, na_option='keep')
+    for name, values in [('vwap_close_diff', vwap_close_diff), ('ts_max_diff_3', ts_max_diff_3),
+                         ('ts_min_diff_3', ts_min_diff_3), ('delta_volume_3', delta_volume_3),
+                         ('rank_ts_max_diff_3', rank_ts_max_diff_3), ('rank_ts_min_diff_3', rank_ts_min_diff_3),
+                         ('rank_delta_volume_3', rank_delta_volume_3)]:
+        df[name] = panel.to_long(values)
     
     # 计算 Alpha#11: ((rank(ts_max((vwap - close), 3)) + rank(ts_min((vwap - close), 3))) * rank(delta(volume, 3)))
     df['alpha11'] = ((df['rank_ts_max_diff_3'] + df['rank_ts_min_diff_3']) * df['rank_delta_volume_3']).round(2)
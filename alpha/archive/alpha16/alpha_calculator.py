@@ -1,24 +1,17 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-def rank_pct(series):
-    """Helper for cross-sectional rank (percentile)."""
-    return series.rank(pct=True)
-
-def rolling_covariance(series1, series2, window):
-    """Helper to calculate rolling covariance between two series for each asset."""
-    s1 = pd.Series(series1)
-    s2 = pd.Series(series2)
-    return s1.rolling(window=window, min_periods=max(2, window)).cov(s2)
-
-def format_float_to_2_sig_figs(val):
-    """Formats a float to two significant figures, handling NaN and 0."""
-    if pd.isna(val):
-        return ""  # Keep NaN as empty string for CSV
-    if val == 0:
-        return "0.00" # Represent 0 as 0.00
-    # Format to 2 significant figures
-    return f"{val:.2g}"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+from engine.output import format_significant, write_csv
+
+def format_float_to_2_sig_figs(values):
+    """Formats floats to two significant figures, handling NaN and 0."""
+    # NaN as empty string for CSV, 0 as 0.00
+    return format_significant(values, 2, na_rep="", zero_rep="0.00")
 
 def calculate_alpha16(df, cov_window=5):
     """
@@ -33,7 +26,7 @@ def calculate_alpha16(df, cov_window=5):
     Returns:
         pd.DataFrame: DataFrame with Alpha#16 values and intermediate calculations.
     """
-    df = df.sort_values(by=['asset_id', 'date']).copy()
+    df = df.sort_values(by=['asset_id', 'date']).reset_index(drop=True)
 
     # Check for required columns
     required_cols = ['high', 'volume']
@@ -41,19 +34,22 @@ def calculate_alpha16(df, cov_window=5):
         if col not in df.columns:
             raise ValueError(f"错误: 数据文件缺少必需列: '{col}'. Alpha#16 无法计算。请检查 mock_data.csv 或更新生成脚本。")
 
-    # Step 1: Calculate rank(high) cross-sectionally for each day
-    df['rank_high'] = df.groupby('date')['high'].transform(rank_pct)
+    panel = Panel.from_long(df, required_cols)
+
+    # Step 1 & 2: Cross-sectional percentile ranks of high and volume for each day
+    rank_high = op.cs_rank(panel['high'])
+    rank_volume = op.cs_rank(panel['volume'])
 
-    # Step 2: Calculate rank(volume) cross-sectionally for each day
-    df['rank_volume'] = df.groupby('date')['volume'].transform(rank_pct)
+    # Step 3 & 4: covariance(rank(high), rank(volume), 5) for each asset over time
+    cov = op.ts_covariance(rank_high, rank_volume, cov_window, min_periods=max(2, cov_window))
 
-    # Step 3 & 4: Calculate covariance(rank(high), rank(volume), 5) for each asset over time
-    df['cov_rank_high_rank_volume_5'] = df.groupby('asset_id', group_keys=False).apply(
-        lambda x: rolling_covariance(x['rank_high'], x['rank_volume'], cov_window)
-    ) # No rounding here, keep precision for rank_cov
+    # Step 5: Cross-sectional rank of the covariance for each day
+    rank_cov = op.cs_rank(cov)
 
-    # Step 5: Calculate rank of the covariance (cross-sectional rank for each day)
-    df['rank_cov'] = df.groupby('date')['cov_rank_high_rank_volume_5'].transform(rank_pct)
+    df['rank_high'] = panel.to_long(rank_high)
+    df['rank_volume'] = panel.to_long(rank_volume)
+    df['cov_rank_high_rank_volume_5'] = panel.to_long(cov) # No rounding here, keep precision for rank_cov
+    df['rank_cov'] = panel.to_long(rank_cov)
 
     # Step 6: Final Alpha#16 value
     df['alpha16'] = -1 * df['rank_cov']
@@ -125,45 +121,36 @@ if __name__ == "__main__":
 
     # Format alpha16 to two significant figures
     if 'alpha16' in save_df.columns:
-        save_df['alpha16_formatted'] = save_df['alpha16'].apply(format_float_to_2_sig_figs)
+        save_df['alpha16_formatted'] = format_float_to_2_sig_figs(save_df['alpha16'])
         # Overwrite original alpha16 col for saving, or keep original and save formatted as new
         # For consistency with request "新alpha保留两位有效数字", we will save the formatted one.
         save_df['alpha16'] = save_df['alpha16_formatted']
         save_df = save_df.drop(columns=['alpha16_formatted'])
 
-    # Define formatters for other columns for CSV output
-    csv_formatters = {}
+    # Define formats for other columns for CSV output
+    csv_formats = {}
     float_cols_to_format = ['rank_high', 'rank_volume', 'rank_cov']
     for col in float_cols_to_format:
         if col in save_df.columns:
-            csv_formatters[col] = lambda x: f"{x:.4f}" if pd.notnull(x) else ''
+            csv_formats[col] = '.4f'
     
     if 'cov_rank_high_rank_volume_5' in save_df.columns:
-        csv_formatters['cov_rank_high_rank_volume_5'] = lambda x: f"{x:.6f}" if pd.notnull(x) else ''
+        csv_formats['cov_rank_high_rank_volume_5'] = '.6f'
 
     # Original data formatting
     original_numeric_cols = ['open', 'high', 'low', 'close', 'returns', 'volume']
     for col in original_numeric_cols:
         if col in save_df.columns:
             if col == 'volume': # Volume typically integer
-                csv_formatters[col] = lambda x, c=col: f"{x:.0f}" if pd.notnull(x) else ''
+                csv_formats[col] = '.0f'
             elif col == 'returns':
-                 csv_formatters[col] = lambda x, c=col: f"{x:.4f}" if pd.notnull(x) else '' # returns often needs more precision
+                 csv_formats[col] = '.4f' # returns often needs more precision
             else: # open, high, low, close
-                 csv_formatters[col] = lambda x, c=col: f"{x:.2f}" if pd.notnull(x) else ''
+                 csv_formats[col] = '.2f'
     
-    # Apply formatters by converting columns to string before to_csv
-    # This gives more control over NaN representation (empty string)
-    for col_name, formatter in csv_formatters.items():
-        if col_name in save_df.columns:
-            save_df[col_name] = save_df[col_name].apply(formatter)
-    
-    # For alpha16, it's already string formatted by format_float_to_2_sig_figs
-    # Ensure NaN in alpha16 becomes empty string if not already handled
-    if 'alpha16' in save_df.columns:
-        save_df['alpha16'] = save_df['alpha16'].apply(lambda x: '' if pd.isna(x) or x is None else x)
-
-    save_df.to_csv(OUTPUT_FILE_PATH, index=False, na_rep='') # Save NaN as empty string
+    # Columns are formatted whole while writing; alpha16 is already string
+    # formatted by format_float_to_2_sig_figs
+    write_csv(save_df, OUTPUT_FILE_PATH, formats=csv_formats, na_rep='') # Save NaN as empty string
     print(f"Alpha#16 计算完成，结果已保存到 {OUTPUT_FILE_PATH}")
 
     print("Alpha#16 结果预览 (alpha16 列为CSV中的格式):")
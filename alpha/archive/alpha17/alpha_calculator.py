@@ -1,13 +1,18 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+
 def calculate_alpha17(df, ts_rank_close_window=10, adv_window=20, ts_rank_vol_window=5):
     """
     Calculate Alpha#17: (((-1 * rank(ts_rank(close, 10))) * rank(delta(delta(close, 1), 1))) * rank(ts_rank((volume / adv20), 5)))
 
     Args:
         df (pd.DataFrame): DataFrame with 'date', 'asset_id', 'close', 'volume'.
-                           It's assumed that the DataFrame is sorted by 'asset_id' and 'date'.
         ts_rank_close_window (int): Rolling window for ts_rank of close (default 10).
         adv_window (int): Rolling window for average daily volume (default 20).
         ts_rank_vol_window (int): Rolling window for ts_rank of (volume / adv) (default 5).
@@ -20,72 +25,58 @@ def calculate_alpha17(df, ts_rank_close_window=10, adv_window=20, ts_rank_vol_wi
         if col not in df.columns:
             raise ValueError(f"Required column '{col}' not found in DataFrame.")
 
-    # Ensure data is sorted for groupby operations and ranks
-    df = df.sort_values(by=['date', 'asset_id']).copy()
+    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
+    panel = Panel.from_long(df, required_cols)
+    close = panel['close']
 
     # --- Component A: (-1 * rank(ts_rank(close, 10))) --- 
-    # Sort by asset_id then date for rolling operations per asset
-    df = df.sort_values(by=['asset_id', 'date'])
-    df['ts_rank_close_10'] = df.groupby('asset_id')['close'].transform(
-        lambda x: x.rolling(window=ts_rank_close_window, min_periods=ts_rank_close_window).rank(pct=True)
-    )
-    # Sort again by date, asset_id for the next cross-sectional rank
-    df = df.sort_values(by=['date', 'asset_id'])
-    df['rank_ts_rank_close_10'] = df.groupby('date')['ts_rank_close_10'].rank(method='average', pct=True)
-    df['component_a'] = -1 * df['rank_ts_rank_close_10']
+    ts_rank_close_10 = op.ts_rank(close, ts_rank_close_window)
+    rank_ts_rank_close_10 = op.cs_rank(ts_rank_close_10)
+    component_a = -1 * rank_ts_rank_close_10
 
     # --- Component B: rank(delta(delta(close, 1), 1)) ---
-    # Sort by asset_id then date for diff operations per asset
-    df = df.sort_values(by=['asset_id', 'date'])
-    df['delta_close_1'] = df.groupby('asset_id')['close'].diff(1)
-    df['delta_delta_close_1_1'] = df.groupby('asset_id')['delta_close_1'].diff(1)
-    # Sort again by date, asset_id for the next cross-sectional rank
-    df = df.sort_values(by=['date', 'asset_id'])
-    df['rank_delta_delta_close_1_1'] = df.groupby('date')['delta_delta_close_1_1'].rank(method='average', pct=True)
-    df['component_b'] = df['rank_delta_delta_close_1_1']
+    delta_close_1 = op.ts_delta(close, 1)
+    delta_delta_close_1_1 = op.ts_delta(delta_close_1, 1)
+    rank_delta_delta_close_1_1 = op.cs_rank(delta_delta_close_1_1)
+    component_b = rank_delta_delta_close_1_1
 
     # --- Component C: rank(ts_rank((volume / adv20), 5)) ---
-    # Sort by asset_id then date for rolling operations per asset
-    df = df.sort_values(by=['asset_id', 'date'])
-    df['adv20'] = df.groupby('asset_id')['volume'].transform(
-        lambda x: x.rolling(window=adv_window, min_periods=adv_window).mean()
-    )
+    adv20 = op.ts_mean(panel['volume'], adv_window)
     # Replace inf with NaN which can arise from adv20 being 0, though unlikely with min_periods=adv_window
-    df['volume_adv20_ratio'] = (df['volume'] / df['adv20']).replace([np.inf, -np.inf], np.nan)
-    
-    df['ts_rank_vol_adv20_5'] = df.groupby('asset_id')['volume_adv20_ratio'].transform(
-        lambda x: x.rolling(window=ts_rank_vol_window, min_periods=ts_rank_vol_window).rank(pct=True)
-    )
-    # Sort again by date, asset_id for the next cross-sectional rank
-    df = df.sort_values(by=['date', 'asset_id'])
-    df['rank_ts_rank_vol_adv20_5'] = df.groupby('date')['ts_rank_vol_adv20_5'].rank(method='average', pct=True)
-    df['component_c'] = df['rank_ts_rank_vol_adv20_5']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        volume_adv20_ratio = panel['volume'] / adv20
+    volume_adv20_ratio[np.isinf(volume_adv20_ratio)] = np.nan
+    ts_rank_vol_adv20_5 = op.ts_rank(volume_adv20_ratio, ts_rank_vol_window)
+    rank_ts_rank_vol_adv20_5 = op.cs_rank(ts_rank_vol_adv20_5)
+    component_c = rank_ts_rank_vol_adv20_5
+
+    intermediates = {
+        'adv20': adv20,
+        'ts_rank_close_10': ts_rank_close_10,
+        'rank_ts_rank_close_10': rank_ts_rank_close_10,
+        'component_a': component_a,
+        'delta_close_1': delta_close_1,
+        'delta_delta_close_1_1': delta_delta_close_1_1,
+        'rank_delta_delta_close_1_1': rank_delta_delta_close_1_1,
+        'component_b': component_b,
+        'volume_adv20_ratio': volume_adv20_ratio,
+        'ts_rank_vol_adv20_5': ts_rank_vol_adv20_5,
+        'rank_ts_rank_vol_adv20_5': rank_ts_rank_vol_adv20_5,
+        'component_c': component_c,
+    }
+    for name, values in intermediates.items():
+        df[name] = panel.to_long(values)
 
     # --- Calculate Alpha#17 ---
     df['alpha17'] = df['component_a'] * df['component_b'] * df['component_c']
 
     # --- Round results ---
-    cols_to_round = [
-        'ts_rank_close_10', 'rank_ts_rank_close_10', 'component_a',
-        'delta_close_1', 'delta_delta_close_1_1', 'rank_delta_delta_close_1_1', 'component_b',
-        'adv20', 'volume_adv20_ratio', 'ts_rank_vol_adv20_5', 'rank_ts_rank_vol_adv20_5', 'component_c',
-        'alpha17'
-    ]
-    for col in cols_to_round:
-        if col in df.columns: # Check if column exists, e.g., adv20 might be all NaNs initially
-            df[col] = df[col].round(2) 
-    
-    # Re-sort by date and asset_id for final output consistency
-    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
+    for col in list(intermediates) + ['alpha17']:
+        df[col] = df[col].round(2) 
 
     # Define columns to keep in the final output
     base_cols_present = [col for col in ['date', 'asset_id', 'open', 'high', 'low', 'close', 'volume', 'vwap', 'returns'] if col in df.columns]
-    alpha_cols = [
-        'adv20', 'ts_rank_close_10', 'rank_ts_rank_close_10', 'component_a',
-        'delta_close_1', 'delta_delta_close_1_1', 'rank_delta_delta_close_1_1', 'component_b',
-        'volume_adv20_ratio', 'ts_rank_vol_adv20_5', 'rank_ts_rank_vol_adv20_5', 'component_c',
-        'alpha17'
-    ]
+    alpha_cols = list(intermediates) + ['alpha17']
     output_columns = base_cols_present + [col for col in alpha_cols if col not in base_cols_present] 
     
     return df[output_columns]
@@ -1,18 +1,17 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-def format_float_to_2_sig_figs(val):
-    """Formats a float to two significant figures, handling NaN and 0."""
-    if pd.isna(val):
-        return ""  # Keep NaN as empty string for CSV
-    if val == 0:
-        return "0.00"
-    try:
-        # Attempt to format, ensuring it's a float first
-        float_val = float(val)
-        return f"{float_val:.2g}"
-    except (ValueError, TypeError):
-        return str(val) # Return original if not formattable as float
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+from engine.output import format_significant, write_csv
+
+def format_float_to_2_sig_figs(values):
+    """Formats floats to two significant figures, handling NaN and 0."""
+    # NaN as empty string for CSV, 0 as 0.00
+    return format_significant(values, 2, na_rep="", zero_rep="0.00")
 
 def calculate_alpha18(df, stddev_window=5, corr_window=10):
     """
@@ -32,33 +31,39 @@ def calculate_alpha18(df, stddev_window=5, corr_window=10):
         if col not in df.columns:
             raise ValueError(f"错误: 数据文件缺少必需列: '{col}'. Alpha#18 无法计算。")
 
-    df = df.sort_values(by=['asset_id', 'date']).copy()
+    # One sort; the panel serves both the time-series and the cross-sectional steps
+    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
+    panel = Panel.from_long(df, required_cols)
+    close, open_ = panel['close'], panel['open']
 
     # Step 1: abs((close - open))
-    df['abs_close_minus_open'] = (df['close'] - df['open']).abs()
+    abs_close_minus_open = np.abs(close - open_)
 
     # Step 2: stddev(abs((close - open)), 5)
-    df['stddev_abs_co_5'] = df.groupby('asset_id', group_keys=False)['abs_close_minus_open']\
-                               .transform(lambda x: x.rolling(window=stddev_window, min_periods=stddev_window).std())
+    stddev_abs_co_5 = op.ts_stddev(abs_close_minus_open, stddev_window)
 
     # Step 3: (close - open)
-    df['co_diff'] = df['close'] - df['open']
+    co_diff = close - open_
 
     # Step 4: correlation(close, open, 10)
-    # Pandas rolling.corr() calculates correlation between two Series within a group.
-    def rolling_corr(data_group):
-        return data_group['close'].rolling(window=corr_window, min_periods=corr_window).corr(data_group['open'])
-
-    df['corr_close_open_10'] = df.groupby('asset_id', group_keys=False).apply(rolling_corr)
+    corr_close_open_10 = op.ts_correlation(close, open_, corr_window)
 
     # Step 5: Combined value: (stddev_abs_co_5 + co_diff + corr_close_open_10)
-    df['combined_value'] = df['stddev_abs_co_5'] + df['co_diff'] + df['corr_close_open_10']
-
-    # Ensure data is sorted by date, asset_id for cross-sectional rank
-    df = df.sort_values(by=['date', 'asset_id'])
+    combined_value = stddev_abs_co_5 + co_diff + corr_close_open_10
 
     # Step 6: rank(combined_value)
-    df['rank_combined_value'] = df.groupby('date')['combined_value'].rank(method='average', pct=True)
+    rank_combined_value = op.cs_rank(combined_value)
+
+    intermediates = {
+        'abs_close_minus_open': abs_close_minus_open,
+        'stddev_abs_co_5': stddev_abs_co_5,
+        'co_diff': co_diff,
+        'corr_close_open_10': corr_close_open_10,
+        'combined_value': combined_value,
+        'rank_combined_value': rank_combined_value,
+    }
+    for name, values in intermediates.items():
+        df[name] = panel.to_long(values)
 
     # Step 7: Final Alpha#18
     df['alpha18'] = -1 * df['rank_combined_value']
@@ -120,12 +125,12 @@ if __name__ == "__main__":
     # Prepare a copy for saving with specific formatting for alpha18
     save_df = alpha_df_calculated.copy()
     if 'alpha18' in save_df.columns:
-        save_df['alpha18_formatted'] = save_df['alpha18'].apply(format_float_to_2_sig_figs)
+        save_df['alpha18_formatted'] = format_float_to_2_sig_figs(save_df['alpha18'])
         save_df['alpha18'] = save_df['alpha18_formatted'] # Overwrite with formatted string
         save_df = save_df.drop(columns=['alpha18_formatted'])
     
     # Formatting other numeric columns for CSV output (e.g., 4-6 decimal places or original if already suitable)
-    csv_formatters = {}
+    csv_formats = {}
     original_data_cols = ['open', 'high', 'low', 'close', 'volume', 'returns']
     intermediate_cols = ['abs_close_minus_open', 'stddev_abs_co_5', 'co_diff', 'corr_close_open_10', 'combined_value', 'rank_combined_value']
 
@@ -133,27 +138,19 @@ if __name__ == "__main__":
         if col in original_data_cols:
             if save_df[col].dtype == 'float64':
                 if col == 'volume': # Volume typically integer like
-                     csv_formatters[col] = lambda x: f"{x:.0f}" if pd.notnull(x) else ''
+                     csv_formats[col] = '.0f'
                 elif col == 'returns':
-                     csv_formatters[col] = lambda x: f"{x:.4f}" if pd.notnull(x) else ''
+                     csv_formats[col] = '.4f'
                 else: # open, high, low, close
-                     csv_formatters[col] = lambda x: f"{x:.2f}" if pd.notnull(x) else ''
+                     csv_formats[col] = '.2f'
         elif col in intermediate_cols:
             if save_df[col].dtype == 'float64':
-                 csv_formatters[col] = lambda x: f"{x:.6f}" if pd.notnull(x) else ''
+                 csv_formats[col] = '.6f'
         # alpha18 is already string formatted
 
-    # Apply formatters by converting columns to string before to_csv for better NaN handling
-    for col_name, formatter_func in csv_formatters.items():
-        if col_name in save_df.columns:
-            save_df[col_name] = save_df[col_name].apply(formatter_func)
-    
-    # Ensure NaN in alpha18 becomes empty string (if not already handled by format_float_to_2_sig_figs)
-    if 'alpha18' in save_df.columns:
-         save_df['alpha18'] = save_df['alpha18'].apply(lambda x: '' if (pd.isna(x) or x is None or str(x).lower()=='nan') else x)
-
+    # Columns are formatted whole while writing, NaN as empty string
     try:
-        save_df.to_csv(OUTPUT_FILE_PATH, index=False, na_rep='') # Save NaN as empty string
+        write_csv(save_df, OUTPUT_FILE_PATH, formats=csv_formats, na_rep='') # Save NaN as empty string
         print(f"Alpha#18 结果已保存到 {OUTPUT_FILE_PATH}")
     except Exception as e:
         print(f"保存结果到 CSV 时出错: {e}")
@@ -1,17 +1,17 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-def format_float_to_2_sig_figs(val):
-    """Formats a float to two significant figures, handling NaN and 0."""
-    if pd.isna(val):
-        return ""  # Keep NaN as empty string for CSV
-    if val == 0:
-        return "0.00"
-    try:
-        float_val = float(val)
-        return f"{float_val:.2g}"
-    except (ValueError, TypeError):
-        return str(val) # Return original if not formattable as float
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+from engine.output import format_significant, write_csv
+
+def format_float_to_2_sig_figs(values):
+    """Formats floats to two significant figures, handling NaN and 0."""
+    # NaN as empty string for CSV, 0 as 0.00
+    return format_significant(values, 2, na_rep="", zero_rep="0.00")
 
 def calculate_alpha19(df, delay_period=7, sum_returns_period=250):
     """
@@ -31,40 +31,52 @@ def calculate_alpha19(df, delay_period=7, sum_returns_period=250):
         if col not in df.columns:
             raise ValueError(f"错误: 数据文件缺少必需列: '{col}'. Alpha#19 无法计算。")
 
-    df = df.sort_values(by=['asset_id', 'date']).copy()
+    # One sort; the panel serves both the time-series and the cross-sectional steps
+    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
+    panel = Panel.from_long(df, required_cols)
+    close = panel['close']
 
     # Component 1: Trend signal
     # delay(close, 7)
-    df['close_delay_7'] = df.groupby('asset_id', group_keys=False)['close'].transform(
-        lambda x: x.shift(delay_period)
-    )
+    close_delay_7 = op.ts_delay(close, delay_period)
     # (close - delay(close, 7))
-    df['price_change_7d'] = df['close'] - df['close_delay_7']
-    
+    price_change_7d = close - close_delay_7
+
     # delta(close, 7) is assumed to be price_change_7d
     # So, ((close - delay(close, 7)) + delta(close, 7)) = 2 * price_change_7d
-    df['double_price_change_7d'] = 2 * df['price_change_7d']
-    
+    double_price_change_7d = 2 * price_change_7d
+
     # sign(...)
-    df['sign_double_price_change'] = np.sign(df['double_price_change_7d'])
-    
+    sign_double_price_change = np.sign(double_price_change_7d)
+
     # -1 * sign(...)
-    df['trend_signal_component'] = -1 * df['sign_double_price_change']
+    trend_signal_component = -1 * sign_double_price_change
 
     # Component 2: Long-term return rank factor
     # sum(returns, 250)
-    df['sum_returns_250'] = df.groupby('asset_id', group_keys=False)['returns'].transform(
-        lambda x: x.rolling(window=sum_returns_period, min_periods=sum_returns_period).sum()
-    )
-    
-    df['one_plus_sum_returns'] = 1 + df['sum_returns_250']
-    
+    sum_returns_250 = op.ts_sum(panel['returns'], sum_returns_period)
+
+    one_plus_sum_returns = 1 + sum_returns_250
+
     # rank(1 + sum(returns, 250)) - cross-sectional rank
-    df = df.sort_values(by=['date', 'asset_id']) # Sort for cross-sectional rank
-    df['rank_sum_returns'] = df.groupby('date')['one_plus_sum_returns'].rank(method='average', pct=True)
-    
+    rank_sum_returns = op.cs_rank(one_plus_sum_returns)
+
     # (1 + rank(...))
-    df['return_rank_factor'] = 1 + df['rank_sum_returns']
+    return_rank_factor = 1 + rank_sum_returns
+
+    intermediates = {
+        'close_delay_7': close_delay_7,
+        'price_change_7d': price_change_7d,
+        'double_price_change_7d': double_price_change_7d,
+        'sign_double_price_change': sign_double_price_change,
+        'trend_signal_component': trend_signal_component,
+        'sum_returns_250': sum_returns_250,
+        'one_plus_sum_returns': one_plus_sum_returns,
+        'rank_sum_returns': rank_sum_returns,
+        'return_rank_factor': return_rank_factor,
+    }
+    for name, values in intermediates.items():
+        df[name] = panel.to_long(values)
 
     # Final Alpha#19
     df['alpha19'] = df['trend_signal_component'] * df['return_rank_factor']
@@ -128,11 +140,11 @@ if __name__ == "__main__":
 
     save_df = alpha_df_calculated.copy()
     if 'alpha19' in save_df.columns:
-        save_df['alpha19_formatted'] = save_df['alpha19'].apply(format_float_to_2_sig_figs)
+        save_df['alpha19_formatted'] = format_float_to_2_sig_figs(save_df['alpha19'])
         save_df['alpha19'] = save_df['alpha19_formatted']
         save_df = save_df.drop(columns=['alpha19_formatted'])
 
-    csv_formatters = {}
+    csv_formats = {}
     original_data_cols = ['open', 'high', 'low', 'close', 'volume', 'returns']
     intermediate_output_cols = [
         'close_delay_7', 'price_change_7d', 'double_price_change_7d', 'sign_double_price_change', 'trend_signal_component',
@@ -143,24 +155,17 @@ if __name__ == "__main__":
         if col in original_data_cols:
             if save_df[col].dtype == 'float64' or save_df[col].dtype == 'int64':
                 if col == 'volume': 
-                     csv_formatters[col] = lambda x: f"{x:.0f}" if pd.notnull(x) else ''
+                     csv_formats[col] = '.0f'
                 elif col == 'returns':
-                     csv_formatters[col] = lambda x: f"{x:.4f}" if pd.notnull(x) else ''
+                     csv_formats[col] = '.4f'
                 else: 
-                     csv_formatters[col] = lambda x: f"{x:.2f}" if pd.notnull(x) else ''
+                     csv_formats[col] = '.2f'
         elif col in intermediate_output_cols:
             if save_df[col].dtype == 'float64' or save_df[col].dtype == 'int64':
-                 csv_formatters[col] = lambda x: f"{x:.6f}" if pd.notnull(x) else ''
+                 csv_formats[col] = '.6f'
     
-    for col_name, formatter_func in csv_formatters.items():
-        if col_name in save_df.columns:
-            save_df[col_name] = save_df[col_name].apply(formatter_func)
-            
-    if 'alpha19' in save_df.columns:
-         save_df['alpha19'] = save_df['alpha19'].apply(lambda x: '' if (pd.isna(x) or x is None or str(x).lower()=='nan') else x)
-
     try:
-        save_df.to_csv(OUTPUT_FILE_PATH, index=False, na_rep='')
+        write_csv(save_df, OUTPUT_FILE_PATH, formats=csv_formats, na_rep='')
         print(f"Alpha#19 结果已保存到 {OUTPUT_FILE_PATH}")
     except Exception as e:
         print(f"保存结果到 CSV 时出错: {e}")
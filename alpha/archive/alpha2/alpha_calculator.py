@@ -1,18 +1,11 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-def delta(series, period):
-    """
-    Computes the difference between current value and value 'period' periods ago.
-    delta(series, N) = series[t] - series[t-N]
-    """
-    return series - series.shift(period)
-
-def rolling_correlation(x, y, window):
-    """
-    Computes rolling correlation between two series over a specified window.
-    """
-    return x.rolling(window=window, min_periods=1).corr(y)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
 
 def calculate_alpha2(df, delta_period=2, correlation_window=6):
     """
@@ -28,42 +21,33 @@ def calculate_alpha2(df, delta_period=2, correlation_window=6):
     missing_columns = [col for col in required_columns if col not in df.columns]
     if missing_columns:
         raise ValueError(f"Missing required columns: {missing_columns}")
-    
-    # Calculate log(volume)
-    df['log_volume'] = np.log(df['volume'])
-    
+
+    panel = Panel.from_long(df, ['close', 'open', 'volume'])
+
     # Calculate delta(log(volume), 2) for each asset
-    df['delta_log_volume'] = df.groupby('asset_id')['log_volume'].transform(
-        lambda x: delta(x, delta_period)
-    )
-    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta_log_volume = op.ts_delta(np.log(panel['volume']), delta_period)
+
     # Calculate intraday return: (close - open) / open
-    df['intraday_return'] = (df['close'] - df['open']) / df['open']
-    
+    intraday_return = (panel['close'] - panel['open']) / panel['open']
+
     # Calculate daily cross-sectional ranks
-    df['rank_delta_log_volume'] = df.groupby('date')['delta_log_volume'].rank(pct=True, method='average')
-    df['rank_intraday_return'] = df.groupby('date')['intraday_return'].rank(pct=True, method='average')
-    
+    rank_delta_log_volume = op.cs_rank(delta_log_volume)
+    rank_intraday_return = op.cs_rank(intraday_return)
+
     # Calculate rolling correlation for each asset
-    def calculate_correlation_for_group(group):
-        return rolling_correlation(
-            group['rank_delta_log_volume'], 
-            group['rank_intraday_return'], 
-            correlation_window
-        )
-    
-    df['correlation'] = df.groupby('asset_id').apply(
-        calculate_correlation_for_group
-    ).reset_index(level=0, drop=True)
-    
+    correlation = op.ts_correlation(rank_delta_log_volume, rank_intraday_return, correlation_window, min_periods=1)
+
     # Final Alpha#2: -1 * correlation
-    df['alpha2'] = -1 * df['correlation']
+    df['alpha2'] = panel.to_long(-1 * correlation)
     
     # Round to 4 decimal places for better readability
     df['alpha2'] = df['alpha2'].round(4)
     
     # Handle NaN values (set to 0 for early periods where correlation cannot be calculated)
     df['alpha2'] = df['alpha2'].fillna(0)
+    # Handle -0.0 from -1 * correlation (and rounding) by converting to 0.0
+    df['alpha2'] = df['alpha2'] + 0.0
     
     return df[['date', 'asset_id', 'open', 'close', 'volume', 'alpha2']]
 
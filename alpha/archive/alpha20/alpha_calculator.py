@@ -1,17 +1,17 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-def format_float_to_2_sig_figs(val):
-    """Formats a float to two significant figures, handling NaN and 0."""
-    if pd.isna(val):
-        return ""  # Keep NaN as empty string for CSV
-    if val == 0:
-        return "0.00"
-    try:
-        float_val = float(val)
-        return f"{float_val:.2g}"
-    except (ValueError, TypeError):
-        return str(val) # Return original if not formattable as float
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+from engine.output import format_significant, write_csv
+
+def format_float_to_2_sig_figs(values):
+    """Formats floats to two significant figures, handling NaN and 0."""
+    # NaN as empty string for CSV, 0 as 0.00
+    return format_significant(values, 2, na_rep="", zero_rep="0.00")
 
 def calculate_alpha20(df, delay_n=1):
     """
@@ -29,25 +29,35 @@ def calculate_alpha20(df, delay_n=1):
         if col not in df.columns:
             raise ValueError(f"错误: 数据文件缺少必需列: '{col}'. Alpha#20 无法计算。")
 
-    df = df.sort_values(by=['asset_id', 'date']).copy()
+    # One sort; the panel serves both the time-series and the cross-sectional steps
+    df = df.sort_values(by=['date', 'asset_id']).reset_index(drop=True)
+    panel = Panel.from_long(df, required_cols)
+    open_ = panel['open']
 
     # Calculate delayed values for high, close, low
-    df['prev_high'] = df.groupby('asset_id', group_keys=False)['high'].transform(lambda x: x.shift(delay_n))
-    df['prev_close'] = df.groupby('asset_id', group_keys=False)['close'].transform(lambda x: x.shift(delay_n))
-    df['prev_low'] = df.groupby('asset_id', group_keys=False)['low'].transform(lambda x: x.shift(delay_n))
+    prev_high = op.ts_delay(panel['high'], delay_n)
+    prev_close = op.ts_delay(panel['close'], delay_n)
+    prev_low = op.ts_delay(panel['low'], delay_n)
 
     # Calculate differences: (open - delay(X, 1))
-    df['diff_open_prev_high'] = df['open'] - df['prev_high']
-    df['diff_open_prev_close'] = df['open'] - df['prev_close']
-    df['diff_open_prev_low'] = df['open'] - df['prev_low']
-
-    # Sort for cross-sectional ranking
-    df = df.sort_values(by=['date', 'asset_id'])
-
-    # Calculate ranks of these differences cross-sectionally
-    df['rank_diff_oph'] = df.groupby('date')['diff_open_prev_high'].rank(method='average', pct=True)
-    df['rank_diff_opc'] = df.groupby('date')['diff_open_prev_close'].rank(method='average', pct=True)
-    df['rank_diff_opl'] = df.groupby('date')['diff_open_prev_low'].rank(method='average', pct=True)
+    diff_open_prev_high = open_ - prev_high
+    diff_open_prev_close = open_ - prev_close
+    diff_open_prev_low = open_ - prev_low
+
+    intermediates = {
+        'prev_high': prev_high,
+        'prev_close': prev_close,
+        'prev_low': prev_low,
+        'diff_open_prev_high': diff_open_prev_high,
+        'diff_open_prev_close': diff_open_prev_close,
+        'diff_open_prev_low': diff_open_prev_low,
+        # Calculate ranks of these differences cross-sectionally
+        'rank_diff_oph': op.cs_rank(diff_open_prev_high),
+        'rank_diff_opc': op.cs_rank(diff_open_prev_close),
+        'rank_diff_opl': op.cs_rank(diff_open_prev_low),
+    }
+    for name, values in intermediates.items():
+        df[name] = panel.to_long(values)
 
     # Calculate components for Alpha#20 formula
     comp1 = -1 * df['rank_diff_oph']
@@ -118,11 +128,11 @@ if __name__ == "__main__":
 
     save_df = alpha_df_calculated.copy()
     if 'alpha20' in save_df.columns:
-        save_df['alpha20_formatted'] = save_df['alpha20'].apply(format_float_to_2_sig_figs)
+        save_df['alpha20_formatted'] = format_float_to_2_sig_figs(save_df['alpha20'])
         save_df['alpha20'] = save_df['alpha20_formatted']
         save_df = save_df.drop(columns=['alpha20_formatted'])
     
-    csv_formatters = {}
+    csv_formats = {}
     original_data_cols = ['open', 'high', 'low', 'close', 'volume', 'returns']
     intermediate_output_cols = [
         'prev_high', 'prev_close', 'prev_low',
@@ -134,24 +144,17 @@ if __name__ == "__main__":
         if col in original_data_cols:
             if save_df[col].dtype == 'float64' or save_df[col].dtype == 'int64':
                 if col == 'volume': 
-                     csv_formatters[col] = lambda x: f"{x:.0f}" if pd.notnull(x) else ''
+                     csv_formats[col] = '.0f'
                 elif col == 'returns':
-                     csv_formatters[col] = lambda x: f"{x:.4f}" if pd.notnull(x) else ''
+                     csv_formats[col] = '.4f'
                 else: 
-                     csv_formatters[col] = lambda x: f"{x:.2f}" if pd.notnull(x) else ''
+                     csv_formats[col] = '.2f'
         elif col in intermediate_output_cols:
             if save_df[col].dtype == 'float64' or save_df[col].dtype == 'int64':
-                 csv_formatters[col] = lambda x: f"{x:.6f}" if pd.notnull(x) else ''
-
-    for col_name, formatter_func in csv_formatters.items():
-        if col_name in save_df.columns:
-            save_df[col_name] = save_df[col_name].apply(formatter_func)
-
-    if 'alpha20' in save_df.columns:
-         save_df['alpha20'] = save_df['alpha20'].apply(lambda x: '' if (pd.isna(x) or x is None or str(x).lower()=='nan') else x)
+                 csv_formats[col] = '.6f'
 
     try:
-        save_df.to_csv(OUTPUT_FILE_PATH, index=False, na_rep='')
+        write_csv(save_df, OUTPUT_FILE_PATH, formats=csv_formats, na_rep='')
         print(f"Alpha#20 结果已保存到 {OUTPUT_FILE_PATH}")
     except Exception as e:
         print(f"保存结果到 CSV 时出错: {e}")
@@ -1,6 +1,12 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+
 def format_float_to_2_sig_figs(val):
     if pd.isna(val):
         return ""
@@ -18,14 +24,16 @@ def calculate_alpha21(df):
         if col not in df.columns:
             raise ValueError(f"数据缺少必要列: {col}")
     df = df.sort_values(['asset_id', 'date']).copy()
+    panel = Panel.from_long(df, required_cols)
+    close = panel['close']
     # 8日均价
-    df['close_mean_8'] = df.groupby('asset_id')['close'].transform(lambda x: x.rolling(8, min_periods=8).mean())
+    df['close_mean_8'] = panel.to_long(op.ts_mean(close, 8))
     # 8日波动率
-    df['close_std_8'] = df.groupby('asset_id')['close'].transform(lambda x: x.rolling(8, min_periods=8).std())
+    df['close_std_8'] = panel.to_long(op.ts_stddev(close, 8))
     # 2日均价
-    df['close_mean_2'] = df.groupby('asset_id')['close'].transform(lambda x: x.rolling(2, min_periods=2).mean())
+    df['close_mean_2'] = panel.to_long(op.ts_mean(close, 2))
     # 20日均量
-    df['adv20'] = df.groupby('asset_id')['volume'].transform(lambda x: x.rolling(20, min_periods=20).mean())
+    df['adv20'] = panel.to_long(op.ts_mean(panel['volume'], 20))
     # volume/adv20
     df['volume_over_adv20'] = df['volume'] / df['adv20']
     # 条件判断
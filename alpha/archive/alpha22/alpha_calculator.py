@@ -1,34 +1,36 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-def format_float_to_2_sig_figs(val):
-    if pd.isna(val):
-        return ""
-    if val == 0:
-        return "0.00"
-    try:
-        float_val = float(val)
-        return f"{float_val:.2g}"
-    except (ValueError, TypeError):
-        return str(val)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+from engine.output import format_significant, write_csv
+
+def format_float_to_2_sig_figs(values):
+    return format_significant(values, 2, na_rep="", zero_rep="0.00")
 
 def calculate_alpha22(df):
     required_cols = ['high', 'close', 'volume']
     for col in required_cols:
         if col not in df.columns:
             raise ValueError(f"数据缺少必要列: {col}")
-    df = df.sort_values(['asset_id', 'date']).copy()
+    # 只排序一次，面板同时服务时间序列与截面计算
+    df = df.sort_values(['date', 'asset_id']).reset_index(drop=True)
+    panel = Panel.from_long(df, required_cols)
     # 5日相关性
-    def rolling_corr(x):
-        return x['high'].rolling(5, min_periods=5).corr(x['volume'])
-    df['corr_high_vol_5'] = df.groupby('asset_id', group_keys=False).apply(rolling_corr).reset_index(level=0, drop=True)
+    corr_high_vol_5 = op.ts_correlation(panel['high'], panel['volume'], 5)
     # 5日delta
-    df['delta_corr_5'] = df.groupby('asset_id')['corr_high_vol_5'].diff(5)
+    delta_corr_5 = op.ts_delta(corr_high_vol_5, 5)
     # 20日收盘价波动率
-    df['stddev_close_20'] = df.groupby('asset_id')['close'].transform(lambda x: x.rolling(20, min_periods=20).std())
+    stddev_close_20 = op.ts_stddev(panel['close'], 20)
     # 截面排名
-    df = df.sort_values(['date', 'asset_id'])
-    df['rank_stddev_close_20'] = df.groupby('date')['stddev_close_20'].rank(method='average', pct=True)
+    rank_stddev_close_20 = op.cs_rank(stddev_close_20)
+    df['corr_high_vol_5'] = panel.to_long(corr_high_vol_5)
+    df['delta_corr_5'] = panel.to_long(delta_corr_5)
+    df['stddev_close_20'] = panel.to_long(stddev_close_20)
+    df['rank_stddev_close_20'] = panel.to_long(rank_stddev_close_20)
     # 公式实现
     df['alpha22'] = -1 * (df['delta_corr_5'] * df['rank_stddev_close_20'])
     # 输出列
@@ -39,7 +41,7 @@ def calculate_alpha22(df):
     # 保留两位有效数字
     for col in ['corr_high_vol_5', 'delta_corr_5', 'stddev_close_20', 'rank_stddev_close_20', 'alpha22']:
         if col in df_out.columns:
-            df_out[col] = df_out[col].apply(format_float_to_2_sig_figs)
+            df_out[col] = format_float_to_2_sig_figs(df_out[col])
     return df_out
 
 if __name__ == "__main__":
@@ -59,7 +61,7 @@ if __name__ == "__main__":
         print(f"计算失败: {e}")
         exit(1)
     try:
-        alpha_df.to_csv(OUTPUT_FILE_PATH, index=False)
+        write_csv(alpha_df, OUTPUT_FILE_PATH)
         print(f"结果已保存到 {OUTPUT_FILE_PATH}")
     except Exception as e:
         print(f"保存失败: {e}")
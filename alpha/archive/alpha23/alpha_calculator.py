@@ -1,7 +1,13 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+
 def calculate_alpha23(df: pd.DataFrame) -> pd.DataFrame:
     """
     计算 Alpha#23: (((sum(high, 20) / 20) < high) ? (-1 * delta(high, 2)) : 0)
@@ -12,18 +18,15 @@ def calculate_alpha23(df: pd.DataFrame) -> pd.DataFrame:
     返回:
         pd.DataFrame: 包含原始数据和计算得到的Alpha#23值的DataFrame
     """
-    # 按资产分组进行计算
+    # 按资产、按日期计算 (日期 × 资产矩阵)，结果按原行序写回
     result_df = df.copy()
+    panel = Panel.from_long(df, ['high'])
     
     # 计算20日高价移动平均
-    result_df['high_ma_20'] = df.groupby('asset_id')['high'].transform(
-        lambda x: x.rolling(window=20, min_periods=20).mean()
-    )
+    result_df['high_ma_20'] = panel.to_long(op.ts_mean(panel['high'], 20))
     
     # 计算2日价格差分
-    result_df['delta_high_2'] = df.groupby('asset_id')['high'].transform(
-        lambda x: x.diff(2)
-    )
+    result_df['delta_high_2'] = panel.to_long(op.ts_delta(panel['high'], 2))
     
     # 计算Alpha#23
     # 当high > high_ma_20时，返回-1 * delta_high_2；否则返回0
@@ -1,7 +1,13 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+
 def calculate_alpha24(df: pd.DataFrame) -> pd.DataFrame:
     """
     计算 Alpha#24:
@@ -15,48 +21,43 @@ def calculate_alpha24(df: pd.DataFrame) -> pd.DataFrame:
     返回:
         pd.DataFrame: 包含原始数据和计算得到的Alpha#24值的DataFrame
     """
-    # 按资产分组进行计算
+    # 按资产、按日期计算 (日期 × 资产矩阵)，结果按原行序写回
     result_df = df.copy()
+    panel = Panel.from_long(df, ['close'])
+    close = panel['close']
     
-    # 对每个资产进行分组计算
-    for asset_id in result_df['asset_id'].unique():
-        asset_data = result_df[result_df['asset_id'] == asset_id].copy()
-        
-        # 计算100日移动平均
-        ma_100 = asset_data['close'].rolling(window=100, min_periods=100).mean()
-        
-        # 计算移动平均的100日差分
-        delta_ma_100 = ma_100 - ma_100.shift(100)
-        
-        # 计算100日前的收盘价
-        delay_close_100 = asset_data['close'].shift(100)
-        
-        # 计算变化率
-        change_rate = delta_ma_100 / delay_close_100
-        
-        # 计算100日最小值
-        min_close_100 = asset_data['close'].rolling(window=100, min_periods=100).min()
-        
-        # 计算当前价格与最小值的差
-        price_min_diff = asset_data['close'] - min_close_100
-        
-        # 计算3日价格差分
-        delta_close_3 = asset_data['close'] - asset_data['close'].shift(3)
-        
-        # 根据条件计算Alpha#24
-        alpha24 = np.where(
-            (change_rate <= 0.05),
-            -1 * price_min_diff,
-            -1 * delta_close_3
-        )
-        
-        # 更新结果DataFrame
-        result_df.loc[result_df['asset_id'] == asset_id, 'ma_100'] = ma_100
-        result_df.loc[result_df['asset_id'] == asset_id, 'delta_ma_100'] = delta_ma_100
-        result_df.loc[result_df['asset_id'] == asset_id, 'change_rate'] = change_rate
-        result_df.loc[result_df['asset_id'] == asset_id, 'min_close_100'] = min_close_100
-        result_df.loc[result_df['asset_id'] == asset_id, 'delta_close_3'] = delta_close_3
-        result_df.loc[result_df['asset_id'] == asset_id, 'alpha24'] = alpha24
+    # 计算100日移动平均
+    ma_100 = op.ts_mean(close, 100)
+    
+    # 计算移动平均的100日差分
+    delta_ma_100 = op.ts_delta(ma_100, 100)
+    
+    # 计算100日前的收盘价
+    delay_close_100 = op.ts_delay(close, 100)
+    
+    # 计算变化率
+    change_rate = delta_ma_100 / delay_close_100
+    
+    # 计算100日最小值
+    min_close_100 = op.ts_min(close, 100)
+    
+    # 计算当前价格与最小值的差
+    price_min_diff = close - min_close_100
+    
+    # 计算3日价格差分
+    delta_close_3 = op.ts_delta(close, 3)
+    
+    # 根据条件计算Alpha#24 (变化率为 NaN 时取 -1 * delta_close_3)
+    alpha24 = np.where(
+        (change_rate <= 0.05),
+        -1 * price_min_diff,
+        -1 * delta_close_3
+    )
+    
+    # 写回结果DataFrame
+    for name, values in [('ma_100', ma_100), ('delta_ma_100', delta_ma_100), ('change_rate', change_rate),
+                         ('min_close_100', min_close_100), ('delta_close_3', delta_close_3), ('alpha24', alpha24)]:
+        result_df[name] = panel.to_long(values)
     
     # 保留两位有效数字
     result_df['alpha24'] = result_df['alpha24'].round(2)
@@ -1,7 +1,13 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+
 def calculate_alpha25(df: pd.DataFrame) -> pd.DataFrame:
     """
     计算 Alpha#25: rank(((((-1 * returns) * adv20) * vwap) * (high - close)))
@@ -12,27 +18,24 @@ def calculate_alpha25(df: pd.DataFrame) -> pd.DataFrame:
     返回:
         pd.DataFrame: 包含原始数据和计算得到的Alpha#25值的DataFrame
     """
-    # 按资产分组进行计算
+    # 按资产、按日期计算 (日期 × 资产矩阵)，结果按原行序写回
     result_df = df.copy()
+    panel = Panel.from_long(df, ['returns', 'volume', 'vwap', 'high', 'close'])
     
     # 计算20日平均成交量
-    result_df['adv20'] = df.groupby('asset_id')['volume'].transform(
-        lambda x: x.rolling(window=20, min_periods=20).mean()
-    )
+    adv20 = op.ts_mean(panel['volume'], 20)
     
     # 计算日内价格差值
-    result_df['high_close_diff'] = df['high'] - df['close']
+    high_close_diff = panel['high'] - panel['close']
     
     # 计算因子乘积
-    result_df['factor'] = ((-1 * df['returns']) * 
-                          result_df['adv20'] * 
-                          df['vwap'] * 
-                          result_df['high_close_diff'])
+    factor = (-1 * panel['returns']) * adv20 * panel['vwap'] * high_close_diff
     
-    # 按日期分组计算排名
-    result_df['alpha25'] = result_df.groupby('date')['factor'].transform(
-        lambda x: x.rank(pct=True)
-    )
+    # 每日截面排名
+    result_df['adv20'] = panel.to_long(adv20)
+    result_df['high_close_diff'] = panel.to_long(high_close_diff)
+    result_df['factor'] = panel.to_long(factor)
+    result_df['alpha25'] = panel.to_long(op.cs_rank(factor))
     
     # 保留两位有效数字
     result_df['alpha25'] = result_df['alpha25'].round(2)
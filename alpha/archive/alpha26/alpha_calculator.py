@@ -1,13 +1,50 @@
+import os
+import sys
+
 import pandas as pd
-import numpy as np
 from typing import Union, Optional
 from pathlib import Path
 import logging
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def calculate_alpha26(df: pd.DataFrame) -> pd.DataFrame:
+    """计算 Alpha#26: (-1 * ts_max(correlation(ts_rank(volume, 5), ts_rank(high, 5), 5), 3))
+
+    时序算子按资产分别计算 (日期 × 资产矩阵)，结果按原行序写回。
+
+    Args:
+        df: 长表数据，需包含 'date', 'asset_id', 'volume', 'high' 列
+
+    Returns:
+        包含 date, asset_id, volume, high 与 alpha26 (保留两位小数) 的 DataFrame
+    """
+    required_cols = ['volume', 'high']
+    missing = [col for col in required_cols if col not in df.columns]
+    if missing:
+        raise ValueError(f"缺少必需列: {missing}")
+    panel = Panel.from_long(df, required_cols)
+
+    # 计算成交量和最高价的5日排名
+    volume_rank = op.ts_rank(panel['volume'], 5)
+    high_rank = op.ts_rank(panel['high'], 5)
+
+    # 计算5日相关系数 (任一排名序列在窗口内不变时为 NaN)
+    correlation = op.ts_correlation(volume_rank, high_rank, 5)
+
+    # 计算3日最大值
+    max_correlation = op.ts_max(correlation, 3)
+
+    # 取负值并保留两位小数
+    result_df = df[['date', 'asset_id'] + required_cols].copy()
+    result_df['alpha26'] = panel.to_long(-1 * max_correlation).round(2)
+    return result_df
+
 class Alpha26Calculator:
     """Alpha#26 因子计算器
     
@@ -28,53 +65,19 @@ class Alpha26Calculator:
         """加载数据"""
         logger.info(f"正在从 {self.data_path} 加载数据...")
         try:
-            self.data = pd.read_csv(self.data_path, index_col=0)
-            self.data.index = pd.to_datetime(self.data.index)
+            self.data = pd.read_csv(self.data_path, parse_dates=['date'])
             logger.info(f"数据加载完成，共 {len(self.data)} 条记录")
         except Exception as e:
             logger.error(f"数据加载失败: {e}")
             raise
             
-    def ts_rank(self, series: pd.Series, window: int) -> pd.Series:
-        """计算时序排名
-        
-        Args:
-            series: 输入序列
-            window: 窗口大小
-            
-        Returns:
-            排名序列
-        """
-        return series.rolling(window).rank(pct=True)
-        
     def calculate_alpha(self) -> None:
         """计算 Alpha#26 因子值"""
         try:
             # 确保数据已加载
             if self.data is None:
                 self.load_data()
-                
-            # 计算成交量和最高价的5日排名
-            volume_rank = self.ts_rank(self.data['volume'], 5)
-            high_rank = self.ts_rank(self.data['high'], 5)
-            
-            # 计算5日相关系数
-            correlation = volume_rank.rolling(5).corr(high_rank)
-            
-            # 计算3日最大值
-            max_correlation = correlation.rolling(3).max()
-            
-            # 取负值并保留两位小数
-            self.result = (-1 * max_correlation).round(2)
-            
-            # 添加原始数据列
-            result_df = pd.DataFrame({
-                'volume': self.data['volume'],
-                'high': self.data['high'],
-                'alpha26': self.result
-            })
-            
-            self.result = result_df
+            self.result = calculate_alpha26(self.data)
             logger.info("Alpha#26 因子计算完成")
             
         except Exception as e:
@@ -93,7 +96,7 @@ class Alpha26Calculator:
             
         save_path = Path(save_path) if save_path else Path('alpha26_results.csv')
         try:
-            self.result.to_csv(save_path)
+            self.result.to_csv(save_path, index=False)
             logger.info(f"结果已保存至 {save_path}")
         except Exception as e:
             logger.error(f"结果保存失败: {e}")
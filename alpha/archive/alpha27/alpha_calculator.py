@@ -1,13 +1,55 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 from typing import Union, Optional
 from pathlib import Path
 import logging
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+
 # 设置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def calculate_alpha27(df: pd.DataFrame) -> pd.DataFrame:
+    """计算 Alpha#27: ((0.5 < rank((sum(correlation(rank(volume), rank(vwap), 6), 2) / 2.0))) ? (-1 * 1) : 1)
+
+    rank 按日期横截面计算，correlation 与 sum 按资产分别计算 (日期 × 资产矩阵)，
+    结果按原行序写回。
+
+    Args:
+        df: 长表数据，需包含 'date', 'asset_id', 'volume', 'vwap' 列
+
+    Returns:
+        包含 date, asset_id, volume, vwap 与 alpha27 (保留两位小数) 的 DataFrame
+    """
+    required_cols = ['volume', 'vwap']
+    missing = [col for col in required_cols if col not in df.columns]
+    if missing:
+        raise ValueError(f"缺少必需列: {missing}")
+    panel = Panel.from_long(df, required_cols)
+
+    # 计算成交量和VWAP的排名
+    volume_rank = op.cs_rank(panel['volume'])
+    vwap_rank = op.cs_rank(panel['vwap'])
+
+    # 计算6日相关系数 (任一排名序列在窗口内不变时为 NaN)
+    correlation = op.ts_correlation(volume_rank, vwap_rank, 6)
+
+    # 计算2日求和并除以2
+    corr_sum_mean = op.ts_sum(correlation, 2) / 2.0
+
+    # 计算排名并与0.5比较 (排名为 NaN 时返回 1)
+    final_rank = op.cs_rank(corr_sum_mean)
+
+    # 生成信号并保留两位小数
+    result_df = df[['date', 'asset_id'] + required_cols].copy()
+    result_df['alpha27'] = panel.to_long(np.where(final_rank > 0.5, -1.0, 1.0)).round(2)
+    return result_df
+
 class Alpha27Calculator:
     """Alpha#27 因子计算器
     
@@ -28,55 +70,19 @@ class Alpha27Calculator:
         """加载数据"""
         logger.info(f"正在从 {self.data_path} 加载数据...")
         try:
-            self.data = pd.read_csv(self.data_path, index_col=0)
-            self.data.index = pd.to_datetime(self.data.index)
+            self.data = pd.read_csv(self.data_path, parse_dates=['date'])
             logger.info(f"数据加载完成，共 {len(self.data)} 条记录")
         except Exception as e:
             logger.error(f"数据加载失败: {e}")
             raise
             
-    def rank(self, series: pd.Series) -> pd.Series:
-        """计算横截面排名
-        
-        Args:
-            series: 输入序列
-            
-        Returns:
-            排名序列
-        """
-        return series.rank(pct=True)
-        
     def calculate_alpha(self) -> None:
         """计算 Alpha#27 因子值"""
         try:
             # 确保数据已加载
             if self.data is None:
                 self.load_data()
-                
-            # 计算成交量和VWAP的排名
-            volume_rank = self.rank(self.data['volume'])
-            vwap_rank = self.rank(self.data['vwap'])
-            
-            # 计算6日相关系数
-            correlation = volume_rank.rolling(6).corr(vwap_rank)
-            
-            # 计算2日求和并除以2
-            corr_sum_mean = correlation.rolling(2).sum() / 2.0
-            
-            # 计算排名并与0.5比较
-            final_rank = self.rank(corr_sum_mean)
-            
-            # 生成信号并保留两位小数
-            self.result = np.where(final_rank > 0.5, -1, 1).astype(float).round(2)
-            
-            # 添加原始数据列
-            result_df = pd.DataFrame({
-                'volume': self.data['volume'],
-                'vwap': self.data['vwap'],
-                'alpha27': self.result
-            })
-            
-            self.result = result_df
+            self.result = calculate_alpha27(self.data)
             logger.info("Alpha#27 因子计算完成")
             
         except Exception as e:
@@ -95,7 +101,7 @@ class Alpha27Calculator:
             
         save_path = Path(save_path) if save_path else Path('alpha27_results.csv')
         try:
-            self.result.to_csv(save_path)
+            self.result.to_csv(save_path, index=False)
             logger.info(f"结果已保存至 {save_path}")
         except Exception as e:
             logger.error(f"结果保存失败: {e}")
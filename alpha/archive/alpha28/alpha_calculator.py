@@ -1,38 +1,38 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-def scale(df):
-    """
-    Standardize a series to have zero mean and unit variance
-    """
-    return (df - df.mean()) / df.std()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
 
 def calculate_alpha28(df):
     """
     Calculates Alpha#28 based on the given formula:
     scale(((correlation(adv20, low, 5) + ((high + low) / 2)) - close))
+
+    scale here standardises each date to zero mean and unit variance (ddof=1);
+    a date with one value or no dispersion is NaN.
     """
     # Ensure data is sorted by date for rolling calculations
     df = df.sort_values(by=['asset_id', 'date'])
+    panel = Panel.from_long(df, ['volume', 'high', 'low', 'close'])
     
     # Calculate 20-day average volume (adv20)
-    df['adv20'] = df.groupby('asset_id')['volume'].transform(
-        lambda x: x.rolling(window=20, min_periods=1).mean()
-    )
+    adv20 = op.ts_mean(panel['volume'], 20, min_periods=1)
     
     # Calculate mid price
-    df['mid_price'] = (df['high'] + df['low']) / 2
+    mid_price = (panel['high'] + panel['low']) / 2
     
     # Calculate correlation between adv20 and low price
-    df['correlation'] = df.groupby('asset_id').apply(
-        lambda x: x['adv20'].rolling(window=5, min_periods=5).corr(x['low'])
-    ).reset_index(level=0, drop=True)
+    correlation = op.ts_correlation(adv20, panel['low'], 5, min_periods=5)
     
     # Calculate combined result before scaling
-    df['result'] = df['correlation'] + df['mid_price'] - df['close']
+    result = correlation + mid_price - panel['close']
     
-    # Apply scaling by group (date)
-    df['alpha28'] = df.groupby('date')['result'].transform(lambda x: scale(x))
+    # Apply scaling by date
+    df['alpha28'] = panel.to_long(op.cs_scale(result, min_count=2, fill=np.nan))
     
     # Round to 2 decimal places
     df['alpha28'] = round(df['alpha28'], 2)
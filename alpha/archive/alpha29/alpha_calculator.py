@@ -1,23 +1,11 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-def scale(df):
-    """
-    Standardize a series to have zero mean and unit variance
-    """
-    return (df - df.mean()) / df.std()
-
-def delta(series, window):
-    """
-    Calculate the difference between the current value and the value 'window' days ago
-    """
-    return series - series.shift(window)
-
-def ts_rank(series, window):
-    """
-    Calculate the rolling rank for a time series
-    """
-    return series.rolling(window=window).rank(pct=True)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
 
 def calculate_alpha29(df):
     """
@@ -27,54 +15,45 @@ def calculate_alpha29(df):
     """
     # Ensure data is sorted by date for rolling calculations
     df = df.sort_values(by=['asset_id', 'date'])
-    
+    panel = Panel.from_long(df, ['close', 'returns'])
+
     # Part 1 calculation
     # Calculate initial difference
-    df['diff'] = df.groupby('asset_id').apply(
-        lambda x: delta(x['close'] - 1, 5)
-    ).reset_index(level=0, drop=True)
-    
+    diff = op.ts_delta(panel['close'] - 1, 5)
+
     # Multiple rank operations
-    df['part1'] = df.groupby('date')['diff'].rank(pct=True)  # First rank
-    df['part1'] = -1 * df['part1']  # Negative
-    df['part1'] = df.groupby('date')['part1'].rank(pct=True)  # Second rank
-    df['part1'] = df.groupby('date')['part1'].rank(pct=True)  # Third rank
-    
+    part1 = op.cs_rank(diff)  # First rank
+    part1 = -1 * part1  # Negative
+    part1 = op.cs_rank(part1)  # Second rank
+    part1 = op.cs_rank(part1)  # Third rank
+
     # Time series operations
-    df['part1'] = df.groupby('asset_id')['part1'].transform(
-        lambda x: x.rolling(window=2, min_periods=2).min()  # ts_min
-    )
-    df['part1'] = df.groupby('asset_id')['part1'].transform(
-        lambda x: x.rolling(window=1, min_periods=1).sum()  # sum
-    )
-    
+    part1 = op.ts_min(part1, 2)  # ts_min
+    part1 = op.ts_sum(part1, 1)  # sum
+
     # Mathematical transformations
-    df['part1'] = np.log(df['part1'].abs())  # log of absolute value to handle negative numbers
-    df['part1'] = df.groupby('date')['part1'].transform(lambda x: scale(x))  # scale
-    
+    part1 = np.log(np.abs(part1))  # log of absolute value to handle negative numbers
+    part1 = op.cs_scale(part1, fill=np.nan)  # scale
+
     # Final transformations for part1
-    df['part1'] = df.groupby('date')['part1'].rank(pct=True)  # rank
-    df['part1'] = df.groupby('date')['part1'].rank(pct=True)  # rank again
-    df['part1'] = df.groupby('asset_id')['part1'].transform(
-        lambda x: x.rolling(window=1, min_periods=1).apply(np.prod)  # product
-    )
-    df['part1'] = df.groupby('asset_id')['part1'].transform(
-        lambda x: x.rolling(window=5, min_periods=5).min()  # min
-    )
-    
+    part1 = op.cs_rank(part1)  # rank
+    part1 = op.cs_rank(part1)  # rank again
+    part1 = op.ts_product(part1, 1)  # product
+    part1 = op.ts_min(part1, 5)  # min
+
     # Part 2 calculation
-    df['part2'] = -1 * df['returns']  # Negative returns
-    df['part2'] = df.groupby('asset_id')['part2'].shift(6)  # delay
-    df['part2'] = df.groupby('asset_id')['part2'].transform(
-        lambda x: ts_rank(x, 5)  # ts_rank
-    )
-    
+    part2 = -1 * panel['returns']  # Negative returns
+    part2 = op.ts_delay(part2, 6)  # delay
+    part2 = op.ts_rank(part2, 5)  # ts_rank
+
     # Combine parts and calculate final alpha
+    df['part1'] = panel.to_long(part1)
+    df['part2'] = panel.to_long(part2)
     df['alpha29'] = df['part1'] + df['part2']
-    
+
     # Round to 2 decimal places
     df['alpha29'] = round(df['alpha29'], 2)
-    
+
     # Select and return relevant columns
     return df[['date', 'asset_id', 'close', 'returns', 'alpha29']]
 
@@ -1,14 +1,11 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-def rolling_correlation(x, y, window):
-    """
-    Computes rolling correlation between two series over a specified window.
-    """
-    correlation = x.rolling(window=window, min_periods=1).corr(y)
-    # Handle infinite values and replace with 0
-    correlation = correlation.replace([np.inf, -np.inf], 0)
-    return correlation
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
 
 def calculate_alpha3(df, correlation_window=10):
     """
@@ -31,29 +28,21 @@ def calculate_alpha3(df, correlation_window=10):
     missing_columns = [col for col in required_columns if col not in df.columns]
     if missing_columns:
         raise ValueError(f"Missing required columns: {missing_columns}")
-    
+
+    panel = Panel.from_long(df, ['open', 'volume'])
+
     # Calculate daily cross-sectional ranks
     # rank(open): rank of opening price across all assets on each day
-    df['rank_open'] = df.groupby('date')['open'].rank(pct=True, method='average')
+    rank_open = op.cs_rank(panel['open'])
     
     # rank(volume): rank of volume across all assets on each day  
-    df['rank_volume'] = df.groupby('date')['volume'].rank(pct=True, method='average')
-    
-    # Calculate rolling correlation for each asset
-    def calculate_correlation_for_group(group):
-        correlation = rolling_correlation(
-            group['rank_open'], 
-            group['rank_volume'], 
-            correlation_window
-        )
-        return correlation
-    
-    df['correlation'] = df.groupby('asset_id', group_keys=False).apply(
-        calculate_correlation_for_group
-    )
+    rank_volume = op.cs_rank(panel['volume'])
     
+    # Calculate rolling correlation for each asset; a constant window gives NaN
+    correlation = op.ts_correlation(rank_open, rank_volume, correlation_window, min_periods=1)
+
     # Final Alpha#3: -1 * correlation
-    df['alpha3'] = -1 * df['correlation']
+    df['alpha3'] = panel.to_long(-1 * correlation)
     
     # Handle infinite and NaN values
     df['alpha3'] = df['alpha3'].replace([np.inf, -np.inf], 0)
@@ -61,6 +50,8 @@ def calculate_alpha3(df, correlation_window=10):
     
     # Round to 4 decimal places for better readability
     df['alpha3'] = df['alpha3'].round(4)
+    # Handle -0.0 from -1 * correlation (and rounding) by converting to 0.0
+    df['alpha3'] = df['alpha3'] + 0.0
     
     return df[['date', 'asset_id', 'open', 'volume', 'alpha3']]
 
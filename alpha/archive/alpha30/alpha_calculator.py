@@ -1,6 +1,12 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+
 def calculate_alpha30(df):
     """
     Calculates Alpha#30 based on the given formula:
@@ -9,36 +15,27 @@ def calculate_alpha30(df):
     """
     # Ensure data is sorted by date for rolling calculations
     df = df.sort_values(by=['asset_id', 'date'])
+    panel = Panel.from_long(df, ['close', 'volume'])
+    close = panel['close']
     
     # Calculate price differences
-    df['diff1'] = df.groupby('asset_id')['close'].transform(lambda x: x - x.shift(1))
-    df['diff2'] = df.groupby('asset_id')['close'].transform(lambda x: x.shift(1) - x.shift(2))
-    df['diff3'] = df.groupby('asset_id')['close'].transform(lambda x: x.shift(2) - x.shift(3))
-    
-    # Calculate signs
-    df['sign1'] = np.sign(df['diff1'])
-    df['sign2'] = np.sign(df['diff2'])
-    df['sign3'] = np.sign(df['diff3'])
+    diff1 = close - op.ts_delay(close, 1)
+    diff2 = op.ts_delay(close, 1) - op.ts_delay(close, 2)
+    diff3 = op.ts_delay(close, 2) - op.ts_delay(close, 3)
     
     # Sum signs and calculate rank
-    df['sign_sum'] = df['sign1'] + df['sign2'] + df['sign3']
-    df['rank_result'] = 1.0 - df.groupby('date')['sign_sum'].rank(pct=True)
+    sign_sum = np.sign(diff1) + np.sign(diff2) + np.sign(diff3)
+    rank_result = 1.0 - op.cs_rank(sign_sum)
     
     # Calculate volume sums
-    df['vol_5'] = df.groupby('asset_id')['volume'].transform(
-        lambda x: x.rolling(window=5, min_periods=5).sum()
-    )
-    df['vol_20'] = df.groupby('asset_id')['volume'].transform(
-        lambda x: x.rolling(window=20, min_periods=20).sum()
-    )
+    vol_5 = op.ts_sum(panel['volume'], 5)
+    vol_20 = op.ts_sum(panel['volume'], 20)
     
     # Calculate final alpha
     # Handle potential division by zero
-    df['alpha30'] = np.where(
-        df['vol_20'] != 0,
-        (df['rank_result'] * df['vol_5']) / df['vol_20'],
-        0
-    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        alpha30 = np.where(vol_20 != 0, (rank_result * vol_5) / vol_20, 0)
+    df['alpha30'] = panel.to_long(alpha30)
     
     # Round to 2 decimal places
     df['alpha30'] = round(df['alpha30'], 2)
@@ -1,34 +1,36 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-def ts_rank(series, window):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+
+def ts_rank(x, window):
     """
     Computes the time-series rank of the current value within the past 'window' days.
     Returns the percentile rank of the current value among the past window values.
     
     Args:
-        series: pandas Series with time series data
+        x: (n_dates, n_assets) matrix with time series data
         window: int, number of periods to look back
         
     Returns:
-        pandas Series with time-series rank values (0-1)
+        Matrix with time-series rank values (0-1): the values below the current
+        one plus half the values equal to it (itself included), over the window
+        length. The first window - 1 dates use the dates available so far.
+        NaN values count toward the length but never compare; an all-NaN
+        window is NaN.
     """
-    def compute_ts_rank(x):
-        if len(x) < 1:
-            return np.nan
-        current_value = x.iloc[-1]  # Current value (most recent)
-        window_values = x.values    # All values in the window
-        
-        # Count how many values are less than current value
-        rank_position = np.sum(window_values < current_value)
-        # Add 0.5 for ties (average rank)
-        rank_position += 0.5 * np.sum(window_values == current_value)
-        
-        # Convert to percentile rank (0-1)
-        percentile_rank = rank_position / len(window_values)
-        return percentile_rank
-    
-    return series.rolling(window=window, min_periods=1).apply(compute_ts_rank, raw=False)
+    padded = np.concatenate([np.full((window - 1, x.shape[1]), np.nan), x], axis=0)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=0)
+    current_value = x[:, :, None]
+    rank_position = (windows < current_value).sum(axis=-1) + 0.5 * (windows == current_value).sum(axis=-1)
+    length = np.minimum(np.arange(1, len(x) + 1), window)[:, None]
+    percentile_rank = rank_position / length
+    percentile_rank[(~np.isnan(windows)).sum(axis=-1) == 0] = np.nan
+    return percentile_rank
 
 
 def calculate_alpha4(df, ts_rank_window=9):
@@ -46,14 +48,15 @@ def calculate_alpha4(df, ts_rank_window=9):
     """
     # Ensure data is sorted by date for rolling calculations
     df = df.sort_values(by=['asset_id', 'date'])
+    panel = Panel.from_long(df, ['low'])
     
     # Step 1: rank(low) - Cross-sectional ranking of low prices each day
-    df['rank_low'] = df.groupby('date')['low'].rank(pct=True, method='average')
+    rank_low = op.cs_rank(panel['low'])
+    df['rank_low'] = panel.to_long(rank_low)
     
     # Step 2: Ts_Rank(rank(low), 9) - Time-series ranking for each asset
-    df['ts_rank_value'] = df.groupby('asset_id')['rank_low'].transform(
-        lambda x: ts_rank(x, window=ts_rank_window).round(2)
-    )
+    df['ts_rank_value'] = panel.to_long(ts_rank(rank_low, window=ts_rank_window))
+    df['ts_rank_value'] = df['ts_rank_value'].round(2)
     
     # Step 3: (-1 * Ts_Rank(...)) - Apply negative sign
     df['alpha4'] = -1 * df['ts_rank_value']
@@ -1,6 +1,12 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+
 def calculate_alpha5(df, vwap_window=10):
     """
     Calculates Alpha#5 based on the given formula.
@@ -16,28 +22,32 @@ def calculate_alpha5(df, vwap_window=10):
     """
     # Ensure data is sorted by date for rolling calculations
     df = df.sort_values(by=['asset_id', 'date'])
+    panel = Panel.from_long(df, ['open', 'close', 'vwap'])
     
     # Step 1: Calculate VWAP moving average (sum(vwap, 10) / 10)
-    df['vwap_ma_10'] = df.groupby('asset_id')['vwap'].transform(
-        lambda x: x.rolling(window=vwap_window, min_periods=1).mean().round(2)
-    )
+    vwap_ma_10 = np.round(op.ts_mean(panel['vwap'], vwap_window, min_periods=1), 2)
     
     # Step 2: Calculate open price difference from VWAP moving average
-    df['open_vwap_diff'] = (df['open'] - df['vwap_ma_10']).round(2)
+    open_vwap_diff = np.round(panel['open'] - vwap_ma_10, 2)
     
     # Step 3: Calculate close price difference from current VWAP
-    df['close_vwap_diff'] = (df['close'] - df['vwap']).round(2)
+    close_vwap_diff = np.round(panel['close'] - panel['vwap'], 2)
     
     # Step 4: Cross-sectional ranking for each component
     # rank(open - vwap_ma_10)
-    df['rank_open_diff'] = df.groupby('date')['open_vwap_diff'].rank(pct=True, method='average')
+    rank_open_diff = op.cs_rank(open_vwap_diff)
     
     # rank(close - vwap)
-    df['rank_close_diff'] = df.groupby('date')['close_vwap_diff'].rank(pct=True, method='average')
+    rank_close_diff = op.cs_rank(close_vwap_diff)
     
     # Step 5: Calculate Alpha#5
     # (rank(open_diff) * (-1 * abs(rank(close_diff))))
-    df['alpha5'] = df['rank_open_diff'] * (-1 * np.abs(df['rank_close_diff']))
+    alpha5 = rank_open_diff * (-1 * np.abs(rank_close_diff))
+
+    for name, values in [('vwap_ma_10', vwap_ma_10), ('open_vwap_diff', open_vwap_diff),
+                         ('close_vwap_diff', close_vwap_diff), ('rank_open_diff', rank_open_diff),
+                         ('rank_close_diff', rank_close_diff), ('alpha5', alpha5)]:
+        df[name] = panel.to_long(values)
     
     # Round to 4 decimal places for clarity
     df['alpha5'] = df['alpha5'].round(4)
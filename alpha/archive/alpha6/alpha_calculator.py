@@ -1,14 +1,19 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+
 # 定义Alpha函数
 def calculate_alpha6(df, window=10):
     """
     Calculate Alpha#6: (-1 * correlation(open, volume, 10))
 
     Args:
-        df (pd.DataFrame): DataFrame with 'asset_id', 'date', 'open', 'volume'.
-                           It's assumed that the DataFrame is sorted by 'asset_id' and 'date'.
+        df (pd.DataFrame): DataFrame with 'asset_id', 'date', 'open', 'volume', in any row order.
         window (int): Rolling window size for correlation calculation.
 
     Returns:
@@ -21,11 +26,12 @@ def calculate_alpha6(df, window=10):
         if col not in df.columns:
             raise ValueError(f"Required column '{col}' not found in DataFrame.")
 
+    panel = Panel.from_long(df, required_cols)
+
     # Calculate rolling correlation between 'open' and 'volume' for each asset
     # The min_periods ensures that we have enough data points to calculate correlation
-    df['correlation_open_volume'] = df.groupby('asset_id', group_keys=False)[['open', 'volume']].apply(
-        lambda x: x['open'].rolling(window=window, min_periods=window).corr(x['volume'])
-    )
+    correlation_open_volume = op.ts_correlation(panel['open'], panel['volume'], window, min_periods=window)
+    df['correlation_open_volume'] = panel.to_long(correlation_open_volume)
     
     # Calculate alpha6
     df['alpha6'] = -1 * df['correlation_open_volume']
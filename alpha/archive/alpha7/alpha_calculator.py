@@ -1,25 +1,12 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
-def calculate_adv(series, window):
-    """Helper to calculate rolling average, ensuring enough periods or NaN."""
-    if len(series) < window:
-        return pd.Series([np.nan] * len(series), index=series.index)
-    return series.rolling(window=window, min_periods=window).mean()
-
-def calculate_delta(series, period):
-    """Helper to calculate difference, ensuring enough periods or NaN."""
-    if len(series) < period:
-        return pd.Series([np.nan] * len(series), index=series.index)
-    return series.diff(periods=period)
-
-def ts_rank(series, window):
-    """Helper for time-series rank (percentile) over a rolling window."""
-    if len(series) < window:
-        return pd.Series([np.nan] * len(series), index=series.index)
-    # rank(pct=True) ranks from 0 to 1. Formula requires 1-N, then scaled.
-    # We use pct=True to get percentile rank directly (0 to 1)
-    return series.rolling(window=window, min_periods=window).apply(lambda x: pd.Series(x).rank(pct=True).iloc[-1], raw=True)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+from engine.output import write_csv
 
 def calculate_alpha7(df, adv_window=20, delta_period=7, ts_rank_window=60):
     """
@@ -35,26 +22,23 @@ def calculate_alpha7(df, adv_window=20, delta_period=7, ts_rank_window=60):
     Returns:
         pd.DataFrame: DataFrame with Alpha#7 values and intermediate calculations.
     """
-    df = df.sort_values(by=['asset_id', 'date']).copy()
+    df = df.sort_values(by=['asset_id', 'date']).reset_index(drop=True)
+    panel = Panel.from_long(df, ['close', 'volume'])
 
     # Calculate adv20 (average daily volume over 20 days)
-    # Using .transform() to align results properly after groupby
-    df['adv20'] = df.groupby('asset_id')['volume'].transform(
-        lambda x: calculate_adv(x, adv_window)
-    )
-
-    # Calculate delta(close, 7)
-    df['delta_close_7'] = df.groupby('asset_id')['close'].transform(
-        lambda x: calculate_delta(x, delta_period)
-    )
+    adv20 = op.ts_mean(panel['volume'], adv_window)
 
-    # Calculate abs(delta(close, 7))
-    df['abs_delta_close_7'] = np.abs(df['delta_close_7'])
+    # Calculate delta(close, 7) and abs(delta(close, 7))
+    delta_close_7 = op.ts_delta(panel['close'], delta_period)
+    abs_delta_close_7 = np.abs(delta_close_7)
 
     # Calculate ts_rank(abs(delta(close, 7)), 60)
-    df['ts_rank_abs_delta_close_7'] = df.groupby('asset_id')['abs_delta_close_7'].transform(
-        lambda x: ts_rank(x, ts_rank_window)
-    )
+    ts_rank_abs_delta_close_7 = op.ts_rank(abs_delta_close_7, ts_rank_window)
+
+    df['adv20'] = panel.to_long(adv20)
+    df['delta_close_7'] = panel.to_long(delta_close_7)
+    df['abs_delta_close_7'] = panel.to_long(abs_delta_close_7)
+    df['ts_rank_abs_delta_close_7'] = panel.to_long(ts_rank_abs_delta_close_7)
 
     # Calculate sign(delta(close, 7))
     df['sign_delta_close_7'] = np.sign(df['delta_close_7'])
@@ -71,12 +55,9 @@ def calculate_alpha7(df, adv_window=20, delta_period=7, ts_rank_window=60):
 
     df['alpha7'] = np.where(condition, alpha_part1, alpha_part2)
     
-    # Handle cases where intermediate values might be NaN, leading to NaN in alpha7
-    # If adv20 is NaN, condition is False, so alpha7 becomes -1. This is acceptable by formula.
-    # If ts_rank or sign is NaN, alpha_part1 is NaN. np.where handles this by assigning NaN.
-    # We want to ensure that if any component of alpha_part1 is NaN, alpha7 is NaN IF the condition was true.
     # If the condition is true AND alpha_part1 is NaN, then alpha7 should be NaN.
     # If the condition is false, alpha7 is always -1, regardless of other NaNs.
+    # (If adv20 is NaN, condition is False, so alpha7 becomes -1. This is acceptable by formula.)
     mask_condition_true_and_nan = condition & (df['ts_rank_abs_delta_close_7'].isna() | df['sign_delta_close_7'].isna())
     df.loc[mask_condition_true_and_nan, 'alpha7'] = np.nan
 
@@ -120,7 +101,7 @@ if __name__ == "__main__":
     alpha_df = calculate_alpha7(input_df.copy()) 
     # .copy() is used to avoid SettingWithCopyWarning on the original DataFrame
 
-    alpha_df.to_csv(OUTPUT_FILE_PATH, index=False, float_format='%.2f') # Ensure alpha7 is saved with 2 decimal places
+    write_csv(alpha_df, OUTPUT_FILE_PATH, float_format='%.2f') # Ensure alpha7 is saved with 2 decimal places
     print(f"Alpha#7 计算完成，结果已保存到 {OUTPUT_FILE_PATH}")
 
     print("\nAlpha#7 结果预览:")
@@ -1,5 +1,11 @@
+import os
+import sys
+
 import pandas as pd
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+
 # 读取数据
 def load_data():
     # 假设数据存储在data文件夹下的某个CSV文件中
@@ -13,20 +19,26 @@ def load_data():
 def calculate_alpha8(df):
     # 确保数据按 asset_id 和 date 排序
     df = df.sort_values(by=['asset_id', 'date']).reset_index(drop=True)
+    panel = Panel.from_long(df, ['open', 'returns'])
 
-    # 按 asset_id 分组计算时间序列相关的指标
-    df['sum_open_5'] = df.groupby('asset_id')['open'].rolling(window=5).sum().reset_index(level=0, drop=True).round(2)
-    df['sum_returns_5'] = df.groupby('asset_id')['returns'].rolling(window=5).sum().reset_index(level=0, drop=True).round(2)
+    # 按资产计算时间序列相关的指标 (日期 × 资产矩阵)
+    sum_open_5 = op.ts_sum(panel['open'], 5).round(2)
+    sum_returns_5 = op.ts_sum(panel['returns'], 5).round(2)
     
-    df['open_returns_product'] = (df['sum_open_5'] * df['sum_returns_5']).round(2)
+    open_returns_product = (sum_open_5 * sum_returns_5).round(2)
     
-    # 按 asset_id 分组进行 shift 操作
-    df['delayed_product'] = df.groupby('asset_id')['open_returns_product'].transform(lambda x: x.shift(10)).round(2)
+    # 每个资产向后平移 10 天
+    delayed_product = op.ts_delay(open_returns_product, 10).round(2)
     
-    df['product_diff'] = (df['open_returns_product'] - df['delayed_product']).round(2)
+    product_diff = (open_returns_product - delayed_product).round(2)
     
-    # 按 date 分组进行截面排名
-    df['rank_diff'] = df.groupby('date')['product_diff'].rank(method='average', ascending=True, pct=True, na_option='keep')
+    # 每日截面排名
+    rank_diff = op.cs_rank(product_diff)
+
+    for name, values in [('sum_open_5', sum_open_5), ('sum_returns_5', sum_returns_5),
+                         ('open_returns_product', open_returns_product), ('delayed_product', delayed_product),
+                         ('product_diff', product_diff), ('rank_diff', rank_diff)]:
+        df[name] = panel.to_long(values)
     
     # 对排名结果取负值，得到Alpha#8，并保留两位小数
     df['alpha8'] = (-1 * df['rank_diff']).round(2)
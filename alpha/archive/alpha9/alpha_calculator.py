@@ -1,6 +1,13 @@
+import os
+import sys
+
 import pandas as pd
 import numpy as np
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from engine import Panel, operators as op
+from engine.output import write_csv
+
 # 定义Alpha函数
 def calculate_alpha9(df, window=5):
     """
@@ -25,19 +32,17 @@ def calculate_alpha9(df, window=5):
             raise ValueError(f"Required column '{col}' not found in DataFrame.")
 
     df = df.sort_values(by=['asset_id', 'date']).copy()
+    panel = Panel.from_long(df, required_cols)
 
     # Calculate delta(close, 1)
-    df['delta_close_1'] = df.groupby('asset_id')['close'].diff(1)
+    delta_close_1 = op.ts_delta(panel['close'], 1)
+    df['delta_close_1'] = panel.to_long(delta_close_1)
 
     # Calculate ts_min(delta(close, 1), window)
-    df['ts_min_delta_close_1_5'] = df.groupby('asset_id')['delta_close_1'].transform(
-        lambda x: x.rolling(window=window, min_periods=window).min()
-    )
+    df['ts_min_delta_close_1_5'] = panel.to_long(op.ts_min(delta_close_1, window))
 
     # Calculate ts_max(delta(close, 1), window)
-    df['ts_max_delta_close_1_5'] = df.groupby('asset_id')['delta_close_1'].transform(
-        lambda x: x.rolling(window=window, min_periods=window).max()
-    )
+    df['ts_max_delta_close_1_5'] = panel.to_long(op.ts_max(delta_close_1, window))
 
     # Conditions for Alpha#9 calculation
     cond1 = 0 < df['ts_min_delta_close_1_5']
@@ -113,7 +118,7 @@ if __name__ == "__main__":
 
     # --- Save Results ---
     try:
-        alpha_df.to_csv(OUTPUT_FILE_PATH, index=False, float_format='%.2f')
+        write_csv(alpha_df, OUTPUT_FILE_PATH, float_format='%.2f')
         print(f"Alpha#9 results saved to {OUTPUT_FILE_PATH}")
     except Exception as e:
         print(f"Error saving results to CSV: {e}")
@@ -0,0 +1,38 @@
+"""
+Vectorized panel engine shared by the alpha calculators.
+
+Usage from a calculator script (alpha/alphaNN/alpha_calculator.py):
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+    from engine import Panel, operators as op
+
+    panel = Panel.from_long(df, ['close', 'volume'])
+    df['alpha'] = panel.to_long(op.cs_rank(op.ts_delta(panel['close'], 7)))
+
+or from a formula string in the notation of doc/functions.md:
+
+    formula = compile_formula(FORMULAS['alpha42'])
+    panel = Panel.from_long(df, formula.fields)
+    df['alpha42'] = panel.to_long(formula.evaluate(panel))
+
+and, to append one date at a time without recomputing the history:
+
+    stream = FormulaStream(compile_formulas(FORMULAS))
+    stream.start(Panel.from_long(df, stream.fields))
+    today = stream.update(df_today)
+
+and to keep results by date and asset instead of per-alpha CSVs:
+
+    factors = FactorStore('factors/')
+    factors.append(df_today['date'].iloc[0], today, stream.assets)
+    factors.at('2024-12-01', ['alpha31', 'alpha41'], assets)
+"""
+
+from . import operators
+from .alpha101 import FORMULAS
+from .factors import FactorStore
+from .formula import Formula, FormulaSet, compile_formula, compile_formulas
+from .incremental import FormulaStream
+from .panel import Panel
+
+__all__ = ['FORMULAS', 'FactorStore', 'Formula', 'FormulaSet', 'FormulaStream', 'Panel', 'compile_formula', 'compile_formulas', 'operators']
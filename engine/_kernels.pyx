@@ -0,0 +1,610 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True, initializedcheck=False
+"""
+Compiled loops for the hot time-series operators in engine.operators.
+
+    cythonize -i engine/_kernels.pyx      # builds engine/_kernels.*.so in place
+
+Every kernel reads a C-contiguous (n_dates, n_assets) float32 or float64
+panel, accumulates in double precision and writes its result into `out`
+(float32 or float64), for the asset columns [start, stop) only; the loops
+run without the GIL, so engine.operators splits the columns of one call
+across threads. Dates are the outer loop and assets the inner one, so every
+pass walks whole rows of the row-major panel, with one state slot per asset.
+
+Semantics are those of the NumPy / pandas implementations in
+engine.operators, which are used when this module is not built.
+"""
+
+from libc.math cimport isnan, isfinite, signbit, sqrt, NAN
+from libc.stdlib cimport malloc, free
+
+ctypedef fused floating:
+    float
+    double
+
+ctypedef fused result_t:
+    float
+    double
+
+# Windows up to this long are summed directly, window by window, which is
+# exact; longer ones are updated as they slide, in O(1) per cell
+cdef enum:
+    SCAN_WINDOW = 32
+
+# --- Running moments ---
+
+def rolling_moments(const floating[:, ::1] x, result_t[:, ::1] out, Py_ssize_t window,
+                    Py_ssize_t min_periods, int stat, Py_ssize_t start, Py_ssize_t stop):
+    """
+    Trailing-window sum (stat 0), mean (1) or sample standard deviation (2)
+    of the finite values, NaN where fewer than min_periods are finite
+    (pandas treats infinities as missing).
+
+    Step for step the arithmetic of pandas' roll_sum, roll_mean and roll_var
+    on one asset's series, so the result is bit-identical to
+    series.rolling(window, min_periods).sum() / .mean() / .std(): values
+    enter and leave through Kahan-compensated sums (separate compensations
+    for additions and removals) or Welford updates, and a window of one
+    repeated value is exact.
+    """
+    cdef Py_ssize_t n_dates = x.shape[0], width = stop - start
+    cdef Py_ssize_t t, a, j
+    cdef double val, y, s, prev_mean, delta, result
+    cdef double *total
+    cdef double *comp_add
+    cdef double *comp_remove
+    cdef double *ssqdm
+    cdef double *last
+    cdef Py_ssize_t *nobs
+    cdef Py_ssize_t *same
+    cdef Py_ssize_t *negative
+    if width <= 0:
+        return
+    with nogil:
+        total = <double *> malloc(5 * width * sizeof(double))
+        nobs = <Py_ssize_t *> malloc(3 * width * sizeof(Py_ssize_t))
+        comp_add, comp_remove, ssqdm, last = total + width, total + 2 * width, total + 3 * width, total + 4 * width
+        same, negative = nobs + width, nobs + 2 * width
+        for t in range(n_dates):
+            for j in range(width):
+                a = start + j
+                if t == 0 or window == 1:
+                    # pandas starts afresh on every window that does not overlap the last
+                    total[j] = comp_add[j] = comp_remove[j] = ssqdm[j] = 0.0
+                    last[j] = x[t, a]
+                    nobs[j] = same[j] = negative[j] = 0
+                elif t >= window:
+                    val = x[t - window, a]
+                    if isfinite(val):
+                        nobs[j] -= 1
+                        if stat == 2:
+                            # total holds the running mean
+                            if nobs[j] > 0:
+                                prev_mean = total[j] - comp_remove[j]
+                                y = val - comp_remove[j]
+                                s = y - total[j]
+                                comp_remove[j] = s + total[j] - y
+                                delta = s
+                                total[j] = total[j] - delta / nobs[j]
+                                ssqdm[j] = ssqdm[j] - (val - prev_mean) * (val - total[j])
+                            else:
+                                total[j] = ssqdm[j] = 0.0
+                        else:
+                            y = -val - comp_remove[j]
+                            s = total[j] + y
+                            comp_remove[j] = s - total[j] - y
+                            total[j] = s
+                            if signbit(val):
+                                negative[j] -= 1
+
+                val = x[t, a]
+                if isfinite(val):
+                    nobs[j] += 1
+                    if val == last[j]:
+                        same[j] += 1
+                    else:
+                        same[j] = 1
+                    last[j] = val
+                    if stat == 2:
+                        prev_mean = total[j] - comp_add[j]
+                        y = val - comp_add[j]
+                        s = y - total[j]
+                        comp_add[j] = s + total[j] - y
+                        delta = s
+                        total[j] = total[j] + delta / nobs[j]
+                        ssqdm[j] = ssqdm[j] + (val - prev_mean) * (val - total[j])
+                    else:
+                        y = val - comp_add[j]
+                        s = total[j] + y
+                        comp_add[j] = s - total[j] - y
+                        total[j] = s
+                        if signbit(val):
+                            negative[j] += 1
+
+                if stat == 0:
+                    if nobs[j] == 0 and min_periods == 0:
+                        result = 0.0
+                    elif nobs[j] >= min_periods:
+                        result = last[j] * nobs[j] if same[j] >= nobs[j] else total[j]
+                    else:
+                        result = NAN
+                elif stat == 1:
+                    if nobs[j] >= min_periods and nobs[j] > 0:
+                        result = total[j] / nobs[j]
+                        if same[j] >= nobs[j]:
+                            result = last[j]
+                        elif negative[j] == 0 and result < 0:
+                            # A mean of values of one sign keeps that sign
+                            result = 0.0
+                        elif negative[j] == nobs[j] and result > 0:
+                            result = 0.0
+                    else:
+                        result = NAN
+                elif nobs[j] >= min_periods and nobs[j] > 1:
+                    result = 0.0 if same[j] >= nobs[j] else ssqdm[j] / (nobs[j] - 1)
+                    result = 0.0 if result < 0 else sqrt(result)
+                else:
+                    result = NAN
+                out[t, a] = result
+        free(total)
+        free(nobs)
+
+# --- Windowed passes ---
+
+def rolling_product(const floating[:, ::1] x, result_t[:, ::1] out, Py_ssize_t window,
+                    Py_ssize_t min_periods, Py_ssize_t start, Py_ssize_t stop):
+    """
+    Product of the valid values in each trailing window, NaN where fewer
+    than min_periods are valid.
+
+    Up to SCAN_WINDOW the window is multiplied out oldest first. Longer
+    windows use blocks of `window` dates: a running product from the start
+    of the current block, and the products from each date to the end of the
+    previous block, filled in once when a block ends; every window is one
+    of each.
+    """
+    cdef Py_ssize_t n_dates = x.shape[0], width = stop - start
+    cdef Py_ssize_t t, k, a, j, first, phase
+    cdef double val
+    cdef double *acc
+    cdef double *tail
+    cdef Py_ssize_t *count
+    if width <= 0:
+        return
+    with nogil:
+        acc = <double *> malloc(width * sizeof(double))
+        count = <Py_ssize_t *> malloc(width * sizeof(Py_ssize_t))
+        tail = <double *> malloc(width * window * sizeof(double)) if window > SCAN_WINDOW else NULL
+        for j in range(width):
+            count[j] = 0
+        for t in range(n_dates):
+            phase = t % window
+            for j in range(width):
+                a = start + j
+                if not isnan(x[t, a]):
+                    count[j] += 1
+                if t >= window and not isnan(x[t - window, a]):
+                    count[j] -= 1
+            if window <= SCAN_WINDOW:
+                for j in range(width):
+                    acc[j] = 1.0
+                for k in range(max(t - window + 1, 0), t + 1):
+                    for j in range(width):
+                        val = x[k, start + j]
+                        if not isnan(val):
+                            acc[j] *= val
+            else:
+                if phase == 0:
+                    # A block starts: products from each date of the last one to its end
+                    if t > 0:
+                        for j in range(width):
+                            acc[j] = 1.0
+                        for k in range(window - 1, -1, -1):
+                            for j in range(width):
+                                val = x[t - window + k, start + j]
+                                if not isnan(val):
+                                    acc[j] *= val
+                                tail[j * window + k] = acc[j]
+                    for j in range(width):
+                        acc[j] = 1.0
+                for j in range(width):
+                    val = x[t, start + j]
+                    if not isnan(val):
+                        acc[j] *= val
+            first = t - window + 1
+            for j in range(width):
+                a = start + j
+                if count[j] < min_periods:
+                    out[t, a] = NAN
+                elif window <= SCAN_WINDOW or first <= 0 or phase == window - 1:
+                    out[t, a] = acc[j]
+                else:
+                    out[t, a] = tail[j * window + phase + 1] * acc[j]
+        free(acc)
+        free(count)
+        free(tail)
+
+def rolling_extreme(const floating[:, ::1] x, result_t[:, ::1] out, Py_ssize_t window,
+                    Py_ssize_t min_periods, bint largest, bint position, Py_ssize_t start, Py_ssize_t stop):
+    """
+    Trailing-window max (largest) or min of the valid values, or with
+    `position` the slot it occurred in (0 oldest, window - 1 today); the
+    most recent day wins ties. NaN where fewer than max(min_periods, 1)
+    values are valid.
+
+    Every asset keeps a monotonic deque of the dates still able to become
+    the extreme, in a ring buffer of `window` slots: a new value drops the
+    ones it matches or beats from the back, the date leaving the window
+    drops from the front, and the front is the extreme. O(1) amortised per
+    cell, whatever the window.
+    """
+    cdef Py_ssize_t n_dates = x.shape[0], width = stop - start
+    cdef Py_ssize_t t, a, j, back, front
+    cdef double val, other
+    cdef Py_ssize_t *ring
+    cdef Py_ssize_t *head
+    cdef Py_ssize_t *size
+    cdef Py_ssize_t *count
+    if width <= 0:
+        return
+    min_periods = max(min_periods, 1)
+    with nogil:
+        ring = <Py_ssize_t *> malloc(width * window * sizeof(Py_ssize_t))
+        head = <Py_ssize_t *> malloc(3 * width * sizeof(Py_ssize_t))
+        size, count = head + width, head + 2 * width
+        for j in range(width):
+            head[j] = size[j] = count[j] = 0
+        for t in range(n_dates):
+            for j in range(width):
+                a = start + j
+                if t >= window and not isnan(x[t - window, a]):
+                    count[j] -= 1
+                if size[j] > 0 and ring[j * window + head[j]] <= t - window:
+                    head[j] = (head[j] + 1) % window
+                    size[j] -= 1
+                val = x[t, a]
+                if not isnan(val):
+                    count[j] += 1
+                    while size[j] > 0:
+                        back = ring[j * window + (head[j] + size[j] - 1) % window]
+                        other = x[back, a]
+                        if (other <= val) if largest else (other >= val):
+                            size[j] -= 1
+                        else:
+                            break
+                    ring[j * window + (head[j] + size[j]) % window] = t
+                    size[j] += 1
+                if count[j] < min_periods:
+                    out[t, a] = NAN
+                else:
+                    front = ring[j * window + head[j]]
+                    out[t, a] = (front - (t - window + 1)) if position else x[front, a]
+        free(ring)
+        free(head)
+
+def rolling_rank(const floating[:, ::1] x, result_t[:, ::1] out, Py_ssize_t window,
+                 Py_ssize_t min_periods, Py_ssize_t start, Py_ssize_t stop):
+    """
+    Percentile rank of today's value among the valid values of its trailing
+    window, ties averaged, as pandas' rolling rank(method='average',
+    pct=True), which treats infinities as missing. NaN where today is
+    missing or fewer than min_periods are valid.
+    """
+    cdef Py_ssize_t n_dates = x.shape[0], width = stop - start
+    cdef Py_ssize_t t, k, a, j
+    cdef double val, today
+    cdef Py_ssize_t *less
+    cdef Py_ssize_t *equal
+    cdef Py_ssize_t *count
+    if width <= 0:
+        return
+    with nogil:
+        less = <Py_ssize_t *> malloc(3 * width * sizeof(Py_ssize_t))
+        equal, count = less + width, less + 2 * width
+        for t in range(n_dates):
+            for j in range(width):
+                less[j] = equal[j] = count[j] = 0
+            for k in range(max(t - window + 1, 0), t + 1):
+                for j in range(width):
+                    val = x[k, start + j]
+                    if not isfinite(val):
+                        continue
+                    today = x[t, start + j]
+                    count[j] += 1
+                    if val < today:
+                        less[j] += 1
+                    elif val == today:
+                        equal[j] += 1
+            for j in range(width):
+                a = start + j
+                if not isfinite(x[t, a]) or count[j] < min_periods or count[j] == 0:
+                    out[t, a] = NAN
+                else:
+                    out[t, a] = (less[j] + (equal[j] + 1) / 2.0) / count[j]
+        free(less)
+
+def decay_linear(const floating[:, ::1] x, result_t[:, ::1] out, Py_ssize_t window,
+                 bint skipna, Py_ssize_t start, Py_ssize_t stop):
+    """
+    Linearly decaying weighted average (today's weight `window`), weights
+    summing to 1. Non-finite values weigh nothing; a window with one is NaN
+    unless skipna, which only makes an all-invalid window NaN. The first
+    window - 1 dates are NaN. Windows longer than SCAN_WINDOW follow the
+    recurrence WMA_t = WMA_{t-1} + window * x_t - S_{t-1}, S the plain
+    window sum.
+    """
+    cdef Py_ssize_t n_dates = x.shape[0], width = stop - start
+    cdef Py_ssize_t t, k, a, j
+    cdef double val, weight, norm = window * (window + 1) / 2.0
+    cdef double *acc
+    cdef double *total
+    cdef Py_ssize_t *count
+    if width <= 0:
+        return
+    with nogil:
+        acc = <double *> malloc(2 * width * sizeof(double))
+        total = acc + width
+        count = <Py_ssize_t *> malloc(width * sizeof(Py_ssize_t))
+        for j in range(width):
+            acc[j] = total[j] = 0.0
+            count[j] = 0
+        for t in range(n_dates):
+            if window > SCAN_WINDOW:
+                for j in range(width):
+                    val = x[t, start + j]
+                    if not isfinite(val):
+                        val = 0.0
+                    else:
+                        count[j] += 1
+                    acc[j] += window * val - total[j]
+                    total[j] += val
+                    if t >= window:
+                        val = x[t - window, start + j]
+                        if isfinite(val):
+                            total[j] -= val
+                            count[j] -= 1
+            elif t >= window - 1:
+                for j in range(width):
+                    acc[j] = 0.0
+                    count[j] = 0
+                for k in range(t - window + 1, t + 1):
+                    weight = window - (t - k)
+                    for j in range(width):
+                        val = x[k, start + j]
+                        if isfinite(val):
+                            acc[j] += weight * val
+                            count[j] += 1
+            for j in range(width):
+                if t < window - 1 or count[j] == 0 or (not skipna and count[j] < window):
+                    out[t, start + j] = NAN
+                else:
+                    out[t, start + j] = acc[j] / norm
+        free(acc)
+        free(count)
+
+def rolling_pair(const floating[:, ::1] x, const floating[:, ::1] y, result_t[:, ::1] out, Py_ssize_t window,
+                 Py_ssize_t min_periods, bint correlation, Py_ssize_t start, Py_ssize_t stop):
+    """
+    Sample covariance (ddof=1), or with `correlation` the Pearson
+    correlation, of x and y over the dates where both are valid in each
+    trailing window. NaN where fewer than max(min_periods, 2) pairs are
+    valid, and correlations of a constant window.
+    """
+    with nogil:
+        if window > SCAN_WINDOW:
+            _pair_sliding(x, y, out, window, max(min_periods, 2), correlation, start, stop)
+        else:
+            _pair_scan(x, y, out, window, max(min_periods, 2), correlation, start, stop)
+
+cdef void _pair_scan(const floating[:, ::1] x, const floating[:, ::1] y, result_t[:, ::1] out, Py_ssize_t window,
+                     Py_ssize_t min_periods, bint correlation, Py_ssize_t start, Py_ssize_t stop) noexcept nogil:
+    """rolling_pair as an exact two-pass sum over every window, means first."""
+    cdef Py_ssize_t n_dates = x.shape[0], width = stop - start
+    cdef Py_ssize_t t, k, a, j
+    cdef double u, v, du, dv
+    cdef double *sx
+    cdef double *sy
+    cdef double *cxy
+    cdef double *cxx
+    cdef double *cyy
+    cdef double *lo_x
+    cdef double *hi_x
+    cdef double *lo_y
+    cdef double *hi_y
+    cdef Py_ssize_t *count
+    if width <= 0:
+        return
+    sx = <double *> malloc(9 * width * sizeof(double))
+    sy, cxy, cxx, cyy = sx + width, sx + 2 * width, sx + 3 * width, sx + 4 * width
+    lo_x, hi_x, lo_y, hi_y = sx + 5 * width, sx + 6 * width, sx + 7 * width, sx + 8 * width
+    count = <Py_ssize_t *> malloc(width * sizeof(Py_ssize_t))
+    for t in range(n_dates):
+        for j in range(width):
+            sx[j] = sy[j] = cxy[j] = cxx[j] = cyy[j] = 0.0
+            count[j] = 0
+        for k in range(max(t - window + 1, 0), t + 1):
+            for j in range(width):
+                u = x[k, start + j]
+                v = y[k, start + j]
+                if isnan(u) or isnan(v):
+                    continue
+                if count[j] == 0:
+                    lo_x[j] = hi_x[j] = u
+                    lo_y[j] = hi_y[j] = v
+                else:
+                    lo_x[j] = min(lo_x[j], u)
+                    hi_x[j] = max(hi_x[j], u)
+                    lo_y[j] = min(lo_y[j], v)
+                    hi_y[j] = max(hi_y[j], v)
+                sx[j] += u
+                sy[j] += v
+                count[j] += 1
+        for j in range(width):
+            if count[j] >= min_periods:
+                sx[j] /= count[j]
+                sy[j] /= count[j]
+        for k in range(max(t - window + 1, 0), t + 1):
+            for j in range(width):
+                if count[j] < min_periods:
+                    continue
+                u = x[k, start + j]
+                v = y[k, start + j]
+                if isnan(u) or isnan(v):
+                    continue
+                # A constant window has no spread at all, whatever the mean rounds to
+                du = 0.0 if lo_x[j] == hi_x[j] else u - sx[j]
+                dv = 0.0 if lo_y[j] == hi_y[j] else v - sy[j]
+                cxy[j] += du * dv
+                cxx[j] += du * du
+                cyy[j] += dv * dv
+        for j in range(width):
+            a = start + j
+            if count[j] < min_periods:
+                out[t, a] = NAN
+            elif not correlation:
+                out[t, a] = cxy[j] / (count[j] - 1)
+            elif cxx[j] * cyy[j] > 0:
+                out[t, a] = cxy[j] / sqrt(cxx[j] * cyy[j])
+            else:
+                out[t, a] = NAN
+    free(sx)
+    free(count)
+
+cdef inline void _pair_window(const floating[:, ::1] x, const floating[:, ::1] y, Py_ssize_t a,
+                              Py_ssize_t first, Py_ssize_t last, double *moments) noexcept nogil:
+    """
+    The arithmetic of _pair_scan for asset `a` over the dates [first, last]:
+    moments receives count, mean_x, mean_y, cxy, cxx and cyy.
+    """
+    cdef Py_ssize_t k, count = 0
+    cdef double u, v, du, dv, sx = 0.0, sy = 0.0, lo_x = 0.0, hi_x = 0.0, lo_y = 0.0, hi_y = 0.0
+    cdef double cxy = 0.0, cxx = 0.0, cyy = 0.0
+    for k in range(first, last + 1):
+        u = x[k, a]
+        v = y[k, a]
+        if isnan(u) or isnan(v):
+            continue
+        if count == 0:
+            lo_x = hi_x = u
+            lo_y = hi_y = v
+        else:
+            lo_x = min(lo_x, u)
+            hi_x = max(hi_x, u)
+            lo_y = min(lo_y, v)
+            hi_y = max(hi_y, v)
+        sx += u
+        sy += v
+        count += 1
+    sx /= count
+    sy /= count
+    for k in range(first, last + 1):
+        u = x[k, a]
+        v = y[k, a]
+        if isnan(u) or isnan(v):
+            continue
+        du = 0.0 if lo_x == hi_x else u - sx
+        dv = 0.0 if lo_y == hi_y else v - sy
+        cxy += du * dv
+        cxx += du * du
+        cyy += dv * dv
+    moments[0] = count
+    moments[1] = sx
+    moments[2] = sy
+    moments[3] = cxy
+    moments[4] = cxx
+    moments[5] = cyy
+
+cdef void _pair_sliding(const floating[:, ::1] x, const floating[:, ::1] y, result_t[:, ::1] out, Py_ssize_t window,
+                        Py_ssize_t min_periods, bint correlation, Py_ssize_t start, Py_ssize_t stop) noexcept nogil:
+    """
+    rolling_pair from running sums of x - shift_x, y - shift_y and their
+    squares and product as pairs enter and leave the window, the shift being
+    the first pair of the asset. Where the co-moments cancel more than six
+    significant digits of those sums, as _pair_moments tests, the window is
+    recomputed with the exact two-pass arithmetic of _pair_scan, and the
+    sums restart from it, shifted by its means.
+    """
+    cdef Py_ssize_t n_dates = x.shape[0], width = stop - start
+    cdef Py_ssize_t t, k, a, j
+    cdef double u, v, du, dv, n, cxy, cxx, cyy
+    cdef double moments[6]
+    cdef double *sums
+    cdef double *sx
+    cdef double *sy
+    cdef double *sxx
+    cdef double *syy
+    cdef double *sxy
+    cdef double *shift_x
+    cdef double *shift_y
+    cdef Py_ssize_t *count
+    if width <= 0:
+        return
+    sums = <double *> malloc(7 * width * sizeof(double))
+    sx, sy, sxx, syy, sxy = sums, sums + width, sums + 2 * width, sums + 3 * width, sums + 4 * width
+    shift_x, shift_y = sums + 5 * width, sums + 6 * width
+    count = <Py_ssize_t *> malloc(width * sizeof(Py_ssize_t))
+    for j in range(width):
+        count[j] = 0
+    for t in range(n_dates):
+        for j in range(width):
+            a = start + j
+            if t >= window:
+                u = x[t - window, a]
+                v = y[t - window, a]
+                if not isnan(u) and not isnan(v):
+                    count[j] -= 1
+                    du = u - shift_x[j]
+                    dv = v - shift_y[j]
+                    sx[j] -= du
+                    sy[j] -= dv
+                    sxx[j] -= du * du
+                    syy[j] -= dv * dv
+                    sxy[j] -= du * dv
+            u = x[t, a]
+            v = y[t, a]
+            if not isnan(u) and not isnan(v):
+                if count[j] == 0:
+                    shift_x[j] = u
+                    shift_y[j] = v
+                    sx[j] = sy[j] = sxx[j] = syy[j] = sxy[j] = 0.0
+                count[j] += 1
+                du = u - shift_x[j]
+                dv = v - shift_y[j]
+                sx[j] += du
+                sy[j] += dv
+                sxx[j] += du * du
+                syy[j] += dv * dv
+                sxy[j] += du * dv
+
+            if count[j] < min_periods:
+                out[t, a] = NAN
+                continue
+            n = count[j]
+            cxx = sxx[j] - sx[j] * sx[j] / n
+            cyy = syy[j] - sy[j] * sy[j] / n
+            cxy = sxy[j] - sx[j] * sy[j] / n
+            if cxx <= 1e-6 * sxx[j] or cyy <= 1e-6 * syy[j]:
+                _pair_window(x, y, a, max(t - window + 1, 0), t, moments)
+                cxy, cxx, cyy = moments[3], moments[4], moments[5]
+                shift_x[j] = moments[1]
+                shift_y[j] = moments[2]
+                sx[j] = sy[j] = sxx[j] = syy[j] = sxy[j] = 0.0
+                for k in range(max(t - window + 1, 0), t + 1):
+                    u = x[k, a]
+                    v = y[k, a]
+                    if not isnan(u) and not isnan(v):
+                        du = u - shift_x[j]
+                        dv = v - shift_y[j]
+                        sx[j] += du
+                        sy[j] += dv
+                        sxx[j] += du * du
+                        syy[j] += dv * dv
+                        sxy[j] += du * dv
+            if not correlation:
+                out[t, a] = cxy / (n - 1)
+            elif cxx * cyy > 0:
+                out[t, a] = cxy / sqrt(cxx * cyy)
+            else:
+                out[t, a] = NAN
+    free(sums)
+    free(count)
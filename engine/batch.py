@@ -0,0 +1,905 @@
+"""
+Run many alpha calculators in one go.
+
+    python -m engine.batch                 # every calculate_alphaN under alpha/
+    python -m engine.batch 31 39 7 -w 4    # a selection, on 4 worker processes
+    python -m engine.batch --start 2025-03-20   # recent dates only, plus the history they need
+    python -m engine.batch --chunk 250 -w 8     # long backfill, 250 dates per worker at a time
+
+The dataset is read once, and only the columns the selected calculators
+declare in `required_cols` are read, with date and asset_id as integer codes
+plus dictionaries (load_frame(codes=True)) so workers receive and pivot codes
+rather than strings. Every `calculate_alphaN` function found in
+alpha/alphaNN/alpha_calculator.py and alpha/archive/alphaNN/alpha_calculator.py
+is run on it in a pool of worker processes, which attach the data in shared
+memory and write their results into shared output matrices, the alpha
+columns are written together to one CSV (date, asset_id, alpha1, alpha2, ...), and per-alpha
+and per-operator timing tables are printed.
+
+The timings are kept in a cost history (--costs, in the user's cache
+directory by default) from run to run. Alphas are submitted slowest first,
+by recorded cost or, for an alpha not run before, by the recorded costs of
+the operators in its formula. Once no alpha is left to start, idle workers
+steal blocks of asset columns from the long time-series operator calls of
+the alphas still running (see _shared_call); every column is computed by
+the same function either way, so the results do not change.
+
+With --chunk the output dates are split into chunks that are processed
+independently: each worker loads one chunk plus a halo of earlier dates
+as warm-up (the alphas' longest lookback, or --halo), runs every
+calculator on it and drops the halo rows. Cross-sectional operations see
+whole dates and the halo covers every window, so the chunks concatenate to
+the single-pass result while no process holds more than one chunk of data.
+Every operator works window by window except ts_sum, ts_mean and
+ts_stddev, which follow pandas' compensated running sums over the loaded
+history and may differ from a single pass in the last bit; a calculator
+that rounds those (alpha8's .round(2)) can then land on the other side of
+a cent.
+"""
+
+import argparse
+import contextlib
+import functools
+import glob
+import importlib.util
+import inspect
+import io
+import json
+import multiprocessing
+import os
+import pickle
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from . import operators as op
+from .alpha101 import FORMULAS
+from .factors import FactorStore
+from .formula import compile_formulas
+from .output import write_csv
+from .store import load_frame
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATA_PATH = os.path.join(REPO_ROOT, 'data', 'mock_data.csv')
+DEFAULT_OUTPUT_PATH = 'alpha_results.csv'
+DEFAULT_COSTS_PATH = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                                  'alpha-mining', 'alpha_costs.json')
+# Weight of the latest run in the recorded cost of an alpha or operator
+_COST_SMOOTHING = 0.5
+
+_REQUIRED = re.compile(r'required_col(?:umn)?s\s*=\s*\[([^\]]*)\]')
+_QUOTED = re.compile(r"['\"](\w+)['\"]")
+_GROUPBY = re.compile(r'\.groupby\(')
+
+# --- Discovery ---
+
+def discover_alphas(root: str = REPO_ROOT) -> dict:
+    """
+    Find the calculators under alpha/ and alpha/archive/.
+
+    Returns:
+        dict: {alpha number: calculator path}, sorted by number. Modules
+              without a calculate_alphaN function are skipped.
+    """
+    pattern = re.compile(r'^def (calculate_alpha(\d+))\(', re.MULTILINE)
+    found = {}
+    paths = glob.glob(os.path.join(root, 'alpha', 'alpha*', 'alpha_calculator.py'))
+    paths += glob.glob(os.path.join(root, 'alpha', 'archive', 'alpha*', 'alpha_calculator.py'))
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for match in pattern.finditer(f.read()):
+                found[int(match.group(2))] = path
+    return dict(sorted(found.items()))
+
+def required_fields(paths) -> list:
+    """
+    Union of the columns the calculators at `paths` declare in their
+    required_cols / required_columns lists, so the loader can skip the rest.
+
+    Returns:
+        list: Column names, or None if some calculator declares nothing and
+              may need every column.
+    """
+    fields = set()
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            declared = _REQUIRED.findall(f.read())
+        if not declared:
+            return None
+        for names in declared:
+            fields.update(_QUOTED.findall(names))
+    fields -= {'date', 'asset_id'}
+    return sorted(fields)
+
+def lookback_days(numbers) -> int:
+    """
+    Warm-up history, in dates, that the alphas `numbers` need before the first
+    output date, from their formulas in engine.alpha101.
+
+    Returns:
+        int: The longest lookback, or None if an alpha has no formula there.
+    """
+    names = [f'alpha{number}' for number in numbers]
+    if any(name not in FORMULAS for name in names):
+        return None
+    return compile_formulas({name: FORMULAS[name] for name in names}).lookback
+
+def _load_function(path: str, number: int):
+    # Every calculator module is called alpha_calculator; load each under a unique name
+    spec = importlib.util.spec_from_file_location(f'alpha_calculator_{number}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, f'calculate_alpha{number}')
+
+def _alpha_column(result, number: int, df: pd.DataFrame) -> pd.Series:
+    """Pull the alpha values out of a calculator result, indexed by (date, asset_id)."""
+    if isinstance(result, pd.Series):
+        # Series results are aligned to the input rows
+        keys = df.loc[result.index, ['date', 'asset_id']]
+        values = result.to_numpy()
+    else:
+        names = [col for col in result.columns if col.lower().replace('#', '') == f'alpha{number}']
+        if not names:
+            raise ValueError(f"Result has no 'alpha{number}' column.")
+        keys = result[['date', 'asset_id']]
+        values = result[names[0]].to_numpy()
+    index = pd.MultiIndex.from_arrays([pd.to_datetime(keys['date']), keys['asset_id']])
+    return pd.Series(values, index=index, name=f'alpha{number}')
+
+# --- Shared memory ---
+
+def _share(shape: tuple, dtype, blocks: list) -> tuple:
+    """
+    Allocate a shared memory block for an array; the block is appended to
+    `blocks` for the caller to release. Returns (writable view, spec a worker
+    attaches it by).
+    """
+    dtype = np.dtype(dtype)
+    block = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+    blocks.append(block)
+    return np.ndarray(shape, dtype=dtype, buffer=block.buf), (block.name, shape, dtype.str)
+
+def _release(blocks: list):
+    """Free blocks made by _share, once no view into them is left."""
+    while blocks:
+        block = blocks.pop()
+        block.close()
+        block.unlink()
+
+def _attach(spec: tuple, writeable: bool = False) -> np.ndarray:
+    """Zero-copy view of a block made by _share; the block stays attached for the worker's lifetime."""
+    name, shape, dtype = spec
+    block = shared_memory.SharedMemory(name=name)
+    _worker_blocks.append(block)
+    view = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    view.flags.writeable = writeable
+    return view
+
+def _share_frame(df: pd.DataFrame, blocks: list) -> dict:
+    """
+    Copy the columns of `df` into shared memory: numeric and datetime columns
+    as they are, categorical keys as their codes. Anything else (str ids) is
+    left to be pickled. Returns {column: (kind, ...)} for _attach_frame.
+    """
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.to_numpy()
+            view, spec = _share(codes.shape, codes.dtype, blocks)
+            view[:] = codes
+            columns[col] = ('codes', spec, series.cat.categories, series.cat.ordered)
+        elif isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufM':
+            view, spec = _share(series.shape, series.dtype, blocks)
+            view[:] = series.to_numpy()
+            columns[col] = ('array', spec)
+        else:
+            columns[col] = ('pickled', series.to_numpy())
+    return columns
+
+def _attach_frame(columns: dict, index: pd.Index) -> pd.DataFrame:
+    """Rebuild the frame shared by _share_frame on read-only views of its blocks."""
+    data = {}
+    for col, (kind, *spec) in columns.items():
+        if kind == 'codes':
+            data[col] = pd.Categorical.from_codes(_attach(spec[0]), categories=spec[1], ordered=spec[2])
+        elif kind == 'array':
+            data[col] = _attach(spec[0])
+        else:
+            data[col] = spec[0]
+    return pd.DataFrame(data, index=index, copy=False)
+
+def _key_grid(df: pd.DataFrame) -> tuple:
+    """
+    Sorted dates and asset ids the output matrices are indexed by, and the
+    cell date * n_assets + asset of every row of `df`.
+    """
+    grid, codes = [], []
+    for col in ('date', 'asset_id'):
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            grid.append(df[col].cat.categories)
+            codes.append(df[col].cat.codes.to_numpy(dtype=np.int64))
+        else:
+            keys, inverse = np.unique(df[col].to_numpy(), return_inverse=True)
+            grid.append(pd.Index(keys))
+            codes.append(inverse.astype(np.int64))
+    return tuple(grid), codes[0] * len(grid[1]) + codes[1]
+
+# --- Workers ---
+
+_worker_df = None
+_worker_plain_df = None
+_worker_output = None   # (alpha, date, asset) matrices calculators' values are written into
+_worker_slots = {}      # {alpha number: its matrix in _worker_output}
+_worker_grid = None     # (dates, assets) the matrices are indexed by
+_worker_blocks = []     # attached shared memory; must outlive the views into it
+_worker_shared = False
+_worker_board = None    # work-stealing board shared by the pool, see _share_board
+_worker_lock = None     # guards _worker_board
+_worker_prefix = None   # shared memory name prefix of the board's jobs
+_worker_costs = {}      # {operator: recorded seconds per million input cells}
+
+def _init_worker(df: pd.DataFrame, grid: tuple, output: np.ndarray, slots: dict):
+    """Hand a worker its dataset and the output matrices, once per worker process instead of once per task."""
+    global _worker_df, _worker_plain_df, _worker_output, _worker_slots, _worker_grid
+    _worker_df = df
+    _worker_plain_df = None
+    _worker_output, _worker_slots, _worker_grid = output, slots, grid
+
+def _init_shared_worker(columns: dict, index: pd.Index, grid: tuple, output: tuple, slots: dict,
+                        board: tuple, lock, operators: dict):
+    """
+    _init_worker for a pool worker: attach the dataset and output matrices
+    in shared memory, and the work-stealing board with the recorded
+    operator costs that decide which operator calls are offered on it.
+    """
+    global _worker_shared, _worker_board, _worker_lock, _worker_prefix, _worker_costs
+    _worker_shared = True
+    _init_worker(_attach_frame(columns, index), grid, _attach(output, writeable=True), slots)
+    _worker_board, _worker_prefix = _attach(board[0], writeable=True), board[1]
+    _worker_lock, _worker_costs = lock, operators
+
+def _frame_for(path: str) -> pd.DataFrame:
+    """
+    The worker's dataset as the calculator at `path` expects it. Calculators
+    built on Panel take the integer-coded keys as they are; those still
+    written with groupby get datetime / str keys, decoded once per worker.
+    """
+    global _worker_plain_df
+    if not isinstance(_worker_df['asset_id'].dtype, pd.CategoricalDtype):
+        return _worker_df
+    with open(path, encoding='utf-8') as f:
+        if not _GROUPBY.search(f.read()):
+            return _worker_df
+    if _worker_plain_df is None:
+        # Only the keys are new; the value columns stay shared
+        _worker_plain_df = _worker_df.copy(deep=False)
+        _worker_plain_df['date'] = _worker_df['date'].astype('datetime64[ns]')
+        _worker_plain_df['asset_id'] = _worker_df['asset_id'].astype(str)
+    return _worker_plain_df
+
+def _write_output(number: int, values: pd.Series) -> bool:
+    """
+    Scatter float alpha values into the alpha's output matrix. Returns False,
+    writing nothing, for other dtypes (calculators that return preformatted
+    strings), whose values go back to the parent as a Series.
+
+    Raises:
+        ValueError: If a (date, asset_id) pair appears twice in `values`.
+    """
+    if values.dtype != np.float64:
+        return False
+    dates, assets = _worker_grid
+    date_idx = dates.get_indexer(values.index.get_level_values(0))
+    ids = values.index.get_level_values(1)
+    if isinstance(ids, pd.CategoricalIndex):
+        asset_idx = assets.get_indexer(ids.categories)[ids.codes]
+    else:
+        asset_idx = assets.get_indexer(ids)
+    keep = (date_idx >= 0) & (asset_idx >= 0)
+    cells = date_idx[keep].astype(np.int64) * len(assets) + asset_idx[keep]
+    if np.bincount(cells, minlength=1).max(initial=0) > 1:
+        raise ValueError('cannot reindex on an axis with duplicate labels')
+    _worker_output[_worker_slots[number]].reshape(-1)[cells] = values.to_numpy()[keep]
+    return True
+
+def _run_alpha(number: int, path: str) -> tuple:
+    """
+    Run one calculator on the worker's dataset: (number, values or None,
+    seconds, error, valid count, {operator: [seconds, input cells]}). Float
+    values are written to the output matrices rather than returned. Seconds
+    leave out waiting for other workers' share of its operator calls.
+    """
+    start = time.perf_counter()
+    waited = [0.0]
+    operators = {}
+    try:
+        func = _load_function(path, number)
+        # Calculators print progress notes; keep them out of the summary.
+        # The shared dataset is read-only, so a shallow copy is safe there:
+        # an in-place write fails instead of reaching the other calculators.
+        with contextlib.redirect_stdout(io.StringIO()), _operator_clock(number, waited) as operators:
+            result = func(_frame_for(path).copy(deep=not _worker_shared))
+        values = _alpha_column(result, number, _worker_df)
+        valid = int(values.notna().sum())
+        if _write_output(number, values):
+            values = None
+        return number, values, time.perf_counter() - start - waited[0], '', valid, operators
+    except Exception as e:
+        return number, None, time.perf_counter() - start - waited[0], f'{type(e).__name__}: {e}', 0, operators
+    finally:
+        if _worker_board is not None:
+            with _worker_lock:
+                _worker_board[0, _PENDING] -= 1
+
+# --- Work Stealing ---
+
+# Operators that compute every asset column from that column alone, at a
+# cost above copying their inputs: a call can be cut into blocks of asset
+# columns that idle workers take over (see _shared_call)
+_SPLITTABLE = {
+    'ts_sum', 'ts_mean', 'ts_stddev', 'ts_product', 'ts_min', 'ts_max', 'ts_argmax', 'ts_argmin',
+    'ts_rank', 'ts_correlation', 'ts_covariance', 'decay_linear',
+}
+# Operator calls expected to take less than this, from the recorded
+# operator costs, run where they are
+_STEAL_SECONDS = 0.05
+# Idle workers look for work on the board this often
+_POLL_SECONDS = 0.001
+_JOB_SLOTS = 64
+# Board row 0 holds counters; rows 1.._JOB_SLOTS one offered operator call each
+_IDLE, _PENDING, _LAST_JOB = range(3)
+_JOB, _BLOCKS, _CLAIMED, _DONE, _FAILED = range(5)
+
+def _operator_names() -> list:
+    """Public functions of engine.operators."""
+    return [name for name, func in vars(op).items()
+            if inspect.isfunction(func) and func.__module__ == op.__name__ and not name.startswith('_')]
+
+@contextlib.contextmanager
+def _operator_clock(number: int, waited: list):
+    """
+    Time every engine.operators function the calculator of alpha `number`
+    calls inside the block. Yields {operator: [seconds, input cells]};
+    seconds exclude nested operator calls, which are counted under their
+    own name, and time spent waiting for other workers, which is added to
+    waited[0]. Calls to _SPLITTABLE operators go through _shared_call.
+    """
+    times = {}
+    nested = []    # seconds of nested operator calls, one entry per call in progress
+    originals = {name: getattr(op, name) for name in _operator_names()}
+
+    def timed(name, func):
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            nested.append(0.0)
+            start = time.perf_counter()
+            try:
+                if len(nested) == 1 and name in _SPLITTABLE:
+                    result, idle = _shared_call(number, name, func, args, kwargs)
+                    nested[-1] += idle
+                    waited[0] += idle
+                    return result
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                inner = nested.pop()
+                if nested:
+                    nested[-1] += elapsed
+                entry = times.setdefault(name, [0.0, 0])
+                entry[0] += elapsed - inner
+                entry[1] += int(np.size(args[0])) if args else 0
+        return call
+
+    for name, func in originals.items():
+        setattr(op, name, timed(name, func))
+    try:
+        yield times
+    finally:
+        for name, func in originals.items():
+            setattr(op, name, func)
+
+def _share_board(blocks: list, pending: int) -> tuple:
+    """
+    Allocate the work-stealing board for a pool running `pending` alphas.
+    Returns the (spec, job name prefix) the workers attach it by.
+    """
+    board, spec = _share((_JOB_SLOTS + 1, 5), np.int64, blocks)
+    board.fill(0)
+    board[0, _PENDING] = pending
+    return spec, f'am{os.getpid():x}{os.urandom(3).hex()}_'
+
+def _claim(slot: int) -> tuple:
+    """Take the next unclaimed block of the call in board row `slot`: (job, block), or None."""
+    with _worker_lock:
+        row = _worker_board[slot]
+        if row[_JOB] == 0 or row[_CLAIMED] >= row[_BLOCKS]:
+            return None
+        row[_CLAIMED] += 1
+        return int(row[_JOB]), int(row[_CLAIMED] - 1)
+
+def _job_views(block: shared_memory.SharedMemory) -> tuple:
+    """The header and (inputs..., output) matrices of a job block written by _shared_call."""
+    size = int(np.frombuffer(block.buf, dtype=np.int64, count=1)[0])
+    header = pickle.loads(bytes(block.buf[8:8 + size]))
+    _, _, _, _, n_inputs, shape = header
+    offset = -(-(8 + size) // 64) * 64
+    matrices = np.ndarray((n_inputs + 1, *shape), dtype=np.float64, buffer=block.buf, offset=offset)
+    return header, matrices
+
+def _run_block(func, header: tuple, matrices: np.ndarray, index: int, n_blocks: int):
+    """Compute block `index` of `n_blocks` asset-column blocks of a job into its output matrix."""
+    _, _, rest, kwargs, n_inputs, shape = header
+    bounds = np.linspace(0, shape[1], n_blocks + 1).astype(int)
+    columns = slice(bounds[index], bounds[index + 1])
+    with np.errstate(all='ignore'):
+        matrices[n_inputs][:, columns] = func(*[x[:, columns] for x in matrices[:n_inputs]], *rest, **kwargs)
+
+def _shared_call(number: int, name: str, func, args: tuple, kwargs: dict) -> tuple:
+    """
+    Run an operator call for alpha `number`, offering blocks of its asset
+    columns to idle workers when its recorded cost says the copy pays off:
+    the inputs are copied to a shared block, and this worker and the
+    thieves claim column blocks until none is left. Every block is computed
+    by the same function on the same columns, so the result is the one a
+    single call gives.
+
+    Returns:
+        tuple: (result, seconds spent waiting for blocks run elsewhere).
+    """
+    inputs = []
+    for arg in args:
+        if not (isinstance(arg, np.ndarray) and arg.ndim == 2):
+            break
+        inputs.append(arg)
+    rest = args[len(inputs):]
+    cost = _worker_costs.get(name)
+    if (_worker_board is None or not inputs or cost is None
+            or cost * inputs[0].size / 1e6 < _STEAL_SECONDS or _worker_board[0, _IDLE] == 0
+            or any(x.shape != inputs[0].shape or x.dtype != np.float64 for x in inputs)
+            or any(isinstance(value, np.ndarray) for value in (*rest, *kwargs.values()))):
+        return func(*args, **kwargs), 0.0
+
+    with _worker_lock:
+        free = np.flatnonzero(_worker_board[1:, _JOB] == 0)
+        if not len(free):
+            slot = None
+        else:
+            slot = int(free[0]) + 1
+            _worker_board[0, _LAST_JOB] += 1
+            job = int(_worker_board[0, _LAST_JOB])
+            # Reserved: no blocks to claim until the inputs are in place
+            _worker_board[slot] = (job, 0, 0, 0, 0)
+    if slot is None:
+        return func(*args, **kwargs), 0.0
+
+    shape = inputs[0].shape
+    payload = pickle.dumps((number, name, rest, kwargs, len(inputs), shape))
+    offset = -(-(8 + len(payload)) // 64) * 64
+    block = shared_memory.SharedMemory(name=f'{_worker_prefix}{job}', create=True,
+                                       size=offset + (len(inputs) + 1) * int(np.prod(shape)) * 8)
+    matrices = None
+    try:
+        np.frombuffer(block.buf, dtype=np.int64, count=1)[:] = len(payload)
+        block.buf[8:8 + len(payload)] = payload
+        header, matrices = _job_views(block)
+        matrices[:len(inputs)] = inputs
+        n_blocks = min(shape[1], 2 * (int(_worker_board[0, _IDLE]) + 1))
+        with _worker_lock:
+            _worker_board[slot, _BLOCKS] = n_blocks
+
+        while (claim := _claim(slot)) is not None:
+            try:
+                _run_block(func, header, matrices, claim[1], n_blocks)
+            except Exception:
+                with _worker_lock:
+                    _worker_board[slot, _FAILED] = 1
+            with _worker_lock:
+                _worker_board[slot, _DONE] += 1
+        start = time.perf_counter()
+        while _worker_board[slot, _DONE] < n_blocks:
+            time.sleep(_POLL_SECONDS)
+        waited = time.perf_counter() - start
+        # A failed block is recomputed here, where its error surfaces
+        result = func(*args, **kwargs) if _worker_board[slot, _FAILED] else np.array(matrices[len(inputs)])
+        return result, waited
+    finally:
+        with _worker_lock:
+            _worker_board[slot] = 0
+        matrices = None
+        block.close()
+        block.unlink()
+
+def _steal() -> dict:
+    """
+    Pool task queued behind every alpha: until the last alpha has finished,
+    take blocks of the operator calls other workers offer (see _shared_call).
+
+    Returns:
+        dict: {alpha number: {operator: seconds}} of the blocks computed.
+    """
+    stolen = {}
+    with _worker_lock:
+        _worker_board[0, _IDLE] += 1
+    try:
+        while True:
+            claim = None
+            # Read without the lock; _claim checks again under it
+            jobs = _worker_board[1:]
+            for slot in np.flatnonzero((jobs[:, _JOB] != 0) & (jobs[:, _CLAIMED] < jobs[:, _BLOCKS])) + 1:
+                claim = _claim(int(slot))
+                if claim is not None:
+                    break
+            if claim is None:
+                if _worker_board[0, _PENDING] <= 0:
+                    return stolen
+                time.sleep(_POLL_SECONDS)
+                continue
+            job, index = claim
+            start = time.perf_counter()
+            block = shared_memory.SharedMemory(name=f'{_worker_prefix}{job}')
+            matrices, failed = None, False
+            try:
+                header, matrices = _job_views(block)
+                number, name = header[:2]
+                _run_block(getattr(op, name), header, matrices, index, int(_worker_board[slot, _BLOCKS]))
+                spent = stolen.setdefault(number, {})
+                spent[name] = spent.get(name, 0.0) + time.perf_counter() - start
+            except Exception:
+                failed = True
+            finally:
+                # No view may outlive the block
+                matrices = None
+                block.close()
+                with _worker_lock:
+                    # The owner frees the row only once every block is done
+                    if _worker_board[slot, _JOB] == job:
+                        _worker_board[slot, _FAILED] |= failed
+                        _worker_board[slot, _DONE] += 1
+    finally:
+        with _worker_lock:
+            _worker_board[0, _IDLE] -= 1
+
+# --- Cost Model ---
+
+def load_costs(path: str) -> dict:
+    """
+    Recorded costs, see record_costs.
+
+    Returns:
+        dict: {'alphas': {alpha name: seconds per million input rows},
+               'operators': {operator: seconds per million input cells}};
+              both empty when nothing has been recorded at `path`.
+    """
+    costs = {'alphas': {}, 'operators': {}}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            recorded = json.load(f)
+        # Histories written before operators were timed hold the alphas alone
+        costs.update(recorded if 'alphas' in recorded else {'alphas': recorded})
+    return costs
+
+def _merge_operators(timings) -> dict:
+    """{operator: [seconds, input cells]} summed over several such dicts."""
+    totals = {}
+    for operators in timings:
+        for name, (seconds, cells) in operators.items():
+            total = totals.setdefault(name, [0.0, 0])
+            total[0] += seconds
+            total[1] += cells
+    return totals
+
+def _operator_totals(summary: pd.DataFrame) -> dict:
+    """Operator timings summed over the successful alphas of a summary."""
+    return _merge_operators(summary.loc[summary['status'] == 'ok', 'operators'])
+
+def record_costs(path: str, summary: pd.DataFrame, rows: int):
+    """
+    Fold the timings of a run_batch summary over `rows` input rows into the
+    costs at `path`: per alpha in seconds per million rows, and per
+    operator in seconds per million input cells over all the calls the
+    calculators made. Each is a moving average, so that the estimate
+    follows changes to the code. Failed alphas are not recorded.
+    """
+    costs = load_costs(path)
+
+    def fold(recorded: dict, name: str, cost: float):
+        previous = recorded.get(name)
+        recorded[name] = cost if previous is None else _COST_SMOOTHING * cost + (1 - _COST_SMOOTHING) * previous
+
+    for alpha, seconds, status in summary[['alpha', 'seconds', 'status']].itertuples(index=False):
+        if status == 'ok' and rows:
+            fold(costs['alphas'], alpha, seconds / rows * 1e6)
+    for name, (seconds, cells) in _operator_totals(summary).items():
+        if cells:
+            fold(costs['operators'], name, seconds / cells * 1e6)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({kind: dict(sorted(recorded.items())) for kind, recorded in costs.items()}, f, indent=2)
+    os.replace(tmp, path)
+
+def _estimated_cost(number: int, operators: dict):
+    """
+    Cost of an alpha not run before, in seconds per million rows, as the sum
+    of the recorded costs of the operators in its formula; None if it has
+    no formula in engine.alpha101 or one of them has no recorded cost.
+    Element-wise arithmetic is not timed and counted as free.
+    """
+    name = f'alpha{number}'
+    if name not in FORMULAS:
+        return None
+    timed = set(_operator_names())
+    names = [node.name if node.kind == 'op' else 'ts_mean'
+             for node in compile_formulas({name: FORMULAS[name]}).nodes
+             if node.kind == 'adv' or (node.kind == 'op' and node.name in timed)]
+    if any(name not in operators for name in names):
+        return None
+    return sum(operators[name] for name in names)
+
+def _longest_first(alphas: dict, costs: dict) -> list:
+    """
+    Alpha numbers in submission order: alphas with neither a recorded nor
+    an estimated cost first, as they may be the slowest, then by cost,
+    highest first. The pool's workers take the next task as they become
+    free, so this is longest-processing-time-first list scheduling.
+    """
+    recorded, operators = costs.get('alphas', {}), costs.get('operators', {})
+    known = {}
+    for number in alphas:
+        cost = recorded.get(f'alpha{number}')
+        known[number] = _estimated_cost(number, operators) if cost is None else cost
+    unknown = [number for number in alphas if known[number] is None]
+    return unknown + sorted((n for n in alphas if known[n] is not None), key=known.get, reverse=True)
+
+# --- Batch ---
+
+def run_batch(df: pd.DataFrame, alphas: dict, workers: int = None, costs: dict = None) -> tuple:
+    """
+    Run calculators on one dataset.
+
+    With more than one worker, the dataset's columns are placed in shared
+    memory once and every worker attaches zero-copy, read-only views of
+    them; calculators write float results straight into preallocated
+    shared (date x asset) output matrices. Neither the data nor the results
+    are pickled between processes.
+
+    Args:
+        df (pd.DataFrame): Long-format data with 'date' (datetime) and 'asset_id',
+                           or both categorical as from load_frame(codes=True).
+        alphas (dict): {alpha number: calculator path}, as from discover_alphas.
+        workers (int): Worker processes. Defaults to the CPU count; 1 runs
+                       everything in this process.
+        costs (dict): Recorded costs, as from load_costs. Calculators are
+                      handed to the workers most expensive first, so that a
+                      slow one does not start last and leave the others
+                      idle, and operator calls whose recorded cost makes
+                      it worthwhile are split into blocks of asset columns
+                      that workers left without an alpha steal (see
+                      _shared_call). Results are the same and in `alphas`
+                      order either way.
+
+    Returns:
+        tuple: (DataFrame of date, asset_id and one column per successful
+               alpha; DataFrame summary with one row per alpha: its
+               seconds of work in any worker, valid count, status and
+               {operator: [seconds, input cells]} of its operator calls).
+    """
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, max(len(alphas), 1))
+    grid, cells = _key_grid(df)
+    slots = {number: slot for slot, number in enumerate(alphas)}
+    shape = (len(alphas), len(grid[0]), len(grid[1]))
+    costs = costs or {}
+    inputs, outputs = [], []
+    try:
+        if workers == 1:
+            output = np.full(shape, np.nan)
+            _init_worker(df, grid, output, slots)
+            outcomes = [_run_alpha(number, path) for number, path in alphas.items()]
+            _init_worker(None, None, None, {})
+        else:
+            columns = _share_frame(df, inputs)
+            output, spec = _share(shape, np.float64, outputs)
+            output.fill(np.nan)
+            board = _share_board(inputs, len(alphas))
+            initargs = (columns, df.index, grid, spec, slots, board, multiprocessing.Lock(), costs.get('operators', {}))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_shared_worker, initargs=initargs) as pool:
+                futures = {number: pool.submit(_run_alpha, number, alphas[number])
+                           for number in _longest_first(alphas, costs)}
+                # Queued behind every alpha: a worker only gets one once no alpha is left to start
+                thieves = [pool.submit(_steal) for _ in range(workers - 1)]
+                outcomes = [futures[number].result() for number in alphas]
+                stolen = [thief.result() for thief in thieves]
+            _release(inputs)
+            outcomes = [_add_stolen(outcome, stolen) for outcome in outcomes]
+
+        order = np.argsort(cells, kind='stable')
+        cells = cells[order]
+        keys = df[['date', 'asset_id']].iloc[order].reset_index(drop=True)
+        columns, index, rows = {}, None, []
+        for number, values, seconds, error, valid, operators in outcomes:
+            if not error:
+                if values is None:
+                    columns[f'alpha{number}'] = output[slots[number]].reshape(-1)[cells]
+                else:
+                    index = pd.MultiIndex.from_frame(keys) if index is None else index
+                    columns[values.name] = values.reindex(index).to_numpy()
+            rows.append({
+                'alpha': f'alpha{number}',
+                'source': os.path.relpath(os.path.dirname(alphas[number]), REPO_ROOT),
+                'seconds': round(seconds, 3),
+                'valid': valid,
+                'status': error or 'ok',
+                'operators': operators,
+            })
+        del output
+    finally:
+        _release(inputs + outputs)
+
+    results = keys
+    for name, column in columns.items():
+        results[name] = column
+    return results, pd.DataFrame(rows)
+
+def _add_stolen(outcome: tuple, stolen: list) -> tuple:
+    """A _run_alpha outcome with the seconds other workers spent on its operator calls added."""
+    number, values, seconds, error, valid, operators = outcome
+    for spent in stolen:
+        for name, extra in spent.get(number, {}).items():
+            seconds += extra
+            operators.setdefault(name, [0.0, 0])[0] += extra
+    return number, values, seconds, error, valid, operators
+
+def date_chunks(dates, size: int) -> list:
+    """
+    Split sorted output `dates` into consecutive chunks of `size` dates.
+
+    Returns:
+        list: (first date, last date) of every chunk, in order.
+    """
+    if size < 1:
+        raise ValueError(f"Chunk size must be at least 1, got {size}.")
+    return [(dates[i], dates[min(i + size, len(dates)) - 1]) for i in range(0, len(dates), size)]
+
+def _run_chunk(path: str, fields: list, alphas: dict, first, last, halo: int) -> tuple:
+    """
+    Load one chunk of output dates with `halo` dates of warm-up before it,
+    run the calculators on it in this process and drop the warm-up rows.
+    The summary's valid counts cover the chunk's own dates only.
+    """
+    df = load_frame(path, fields, start=first, end=last, lookback=halo, codes=True)
+    results, summary = run_batch(df, alphas, workers=1)
+    dates = results['date'].to_numpy(dtype='datetime64[ns]')
+    # Chunks carry their own dictionaries; plain dates concatenate cleanly
+    results = results[dates >= first].assign(date=dates[dates >= first])
+    # Warm-up rows are counted by run_batch but belong to the previous chunk
+    summary['valid'] = [int(results[alpha].notna().sum()) if alpha in results else 0
+                        for alpha in summary['alpha']]
+    return results, summary
+
+def run_chunks(path: str, fields: list, alphas: dict, chunks: list, halo: int, workers: int = None) -> tuple:
+    """
+    Run calculators chunk by chunk over the date axis, see date_chunks.
+
+    Args:
+        path (str): Store or CSV, as for load_frame; every chunk is loaded
+                    on its own.
+        fields (list): Columns to load, as from required_fields.
+        alphas (dict): {alpha number: calculator path}.
+        chunks (list): (first, last) output dates of every chunk.
+        halo (int): Dates of history loaded before each chunk, at least
+                    the alphas' lookback.
+        workers (int): Worker processes, one chunk each at a time. Defaults
+                       to the CPU count.
+
+    Returns:
+        tuple: (results as run_batch, with the chunks in date order;
+               summary with one row per alpha, seconds, valid counts and
+               operator times summed over the chunks).
+    """
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, max(len(chunks), 1))
+    if workers == 1:
+        outcomes = [_run_chunk(path, fields, alphas, first, last, halo) for first, last in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run_chunk, path, fields, alphas, first, last, halo) for first, last in chunks]
+            outcomes = [future.result() for future in futures]
+
+    results = pd.concat([outcome[0] for outcome in outcomes], ignore_index=True)
+    summary = pd.concat([outcome[1] for outcome in outcomes]).groupby('alpha', sort=False).agg(
+        source=('source', 'first'),
+        seconds=('seconds', 'sum'),
+        valid=('valid', 'sum'),
+        status=('status', lambda s: next((status for status in s if status != 'ok'), 'ok')),
+        operators=('operators', _merge_operators),
+    ).reset_index()
+    return results, summary
+
+def _parse_selection(selection: list, available: dict) -> dict:
+    if not selection:
+        return available
+    chosen = {}
+    for item in selection:
+        number = int(re.sub(r'^alpha', '', item.lower()))
+        if number not in available:
+            raise ValueError(f"No calculate_alpha{number} found under alpha/.")
+        chosen[number] = available[number]
+    return chosen
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(prog='python -m engine.batch', description='Run alpha calculators on one dataset load.')
+    parser.add_argument('alphas', nargs='*', help='Alpha numbers to run, e.g. 31 alpha39 (default: all).')
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH, help='Input CSV (default: data/mock_data.csv).')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT_PATH, help='Combined results CSV.')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='Worker processes (default: CPU count).')
+    parser.add_argument('--start', default=None, help='First output date; earlier history is loaded only as far back as the alphas look.')
+    parser.add_argument('--end', default=None, help='Last output date (default: the last date in the data).')
+    parser.add_argument('--factors', default=None, help='Also store the results in this factor store directory (see engine.factors).')
+    parser.add_argument('--chunk', type=int, default=None, help='Output dates per chunk: backfill chunk by chunk, each with its own warm-up, one chunk per worker.')
+    parser.add_argument('--halo', type=int, default=None, help='Warm-up dates loaded before --start or each chunk (default: the longest lookback of the alphas\' formulas).')
+    parser.add_argument('--costs', default=DEFAULT_COSTS_PATH, help='Alpha and operator cost history, used to start the slowest alphas first and to share long operator calls with idle workers; updated by every run without --chunk (default: ~/.cache/alpha-mining/alpha_costs.json).')
+    args = parser.parse_args(argv)
+
+    try:
+        alphas = _parse_selection(args.alphas, discover_alphas())
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    fields = required_fields(alphas.values())
+    lookback = args.halo
+    if lookback is None:
+        lookback = lookback_days(alphas) if args.start or args.chunk is not None else 0
+    if args.chunk is not None and lookback is None:
+        parser.error("--chunk needs --halo: some selected alphas have no formula in engine.alpha101 to take a lookback from.")
+    try:
+        if args.chunk is not None:
+            # Only the date column is read here; every chunk loads its own data
+            dates = load_frame(args.data, [], start=args.start, end=args.end, codes=True)['date'].cat.categories
+            chunks = date_chunks(dates, args.chunk)
+            load_seconds = time.perf_counter() - start
+            print(f"Backfilling {len(dates)} dates from {args.data} in {len(chunks)} chunks of {args.chunk} "
+                  f"with {lookback} dates of warm-up each.")
+            results, summary = run_chunks(args.data, fields, alphas, chunks, lookback, args.workers)
+        else:
+            # Without a known lookback every date before --start is loaded
+            df = load_frame(args.data, fields, start=args.start if lookback is not None else None, end=args.end,
+                            lookback=lookback or 0, codes=True)
+            load_seconds = time.perf_counter() - start
+            print(f"Loaded {len(df)} rows from {args.data} in {load_seconds:.2f}s.")
+            results, summary = run_batch(df, alphas, args.workers, load_costs(args.costs))
+            record_costs(args.costs, summary, len(df))
+    except FileNotFoundError:
+        print(f"Error: Data file not found at {args.data}. Please run data/generate_mock_data.py first.")
+        exit(1)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.start:
+        results = results[results['date'].to_numpy(dtype='datetime64[ns]') >= pd.Timestamp(args.start)]
+    write_csv(results, args.output, float_format='%.2f')
+    if args.factors:
+        # Calculators that return preformatted strings are stored as numbers
+        values = results.drop(columns=['date', 'asset_id']).apply(pd.to_numeric, errors='coerce')
+        FactorStore(args.factors).write(pd.concat([results[['date', 'asset_id']], values], axis=1))
+    total_seconds = time.perf_counter() - start
+
+    print(summary.drop(columns='operators').to_string(index=False))
+    operators = pd.DataFrame([(name, seconds, cells) for name, (seconds, cells) in _operator_totals(summary).items()],
+                             columns=['operator', 'seconds', 'cells'])
+    if len(operators):
+        operators['seconds'] = operators['seconds'].round(3)
+        print('\n' + operators.sort_values('seconds', ascending=False).to_string(index=False))
+    failed = (summary['status'] != 'ok').sum()
+    print(f"\n{len(summary) - failed}/{len(summary)} alphas written to {args.output}; "
+          f"total {total_seconds:.2f}s (load {load_seconds:.2f}s, calculators {summary['seconds'].sum():.2f}s).")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+"""
+Date-partitioned binary store for computed factors, instead of one results
+CSV per alpha rewritten on every run.
+
+    factors = FactorStore('factors/')
+    factors.write(results)                          # long frame: date, asset_id, alpha31, alpha32, ...
+    factors.append('2025-04-01', stream.update(df_today), stream.assets)
+    factors.at('2024-12-01', ['alpha31', 'alpha41'], assets)   # assets x factors
+    factors.read('alpha31', start='2024-12-01')                 # dates x assets
+
+Each factor is a directory of monthly partitions. A partition is a raw
+row-major (dates x assets) float matrix, one row per date, with as many
+columns as there were assets when the partition was last written:
+
+    assets.json              asset ids in code order; new ids are appended, so codes never change
+    <factor>/index.json      dtype, and per partition its file, dates and width
+    <factor>/<YYYY-MM>-<version>.bin
+
+A date later than every date of its month is appended to the partition file
+in place; only a backfill into the middle of a month, or an asset universe
+that has grown, rewrites that one partition, into a new file version.
+index.json is replaced atomically after the data is on disk, so a crash
+leaves the previous state readable. Lookups go through the index and a memory map of the partition:
+a date is one row, an asset one column, and nothing else is read.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .panel import Panel
+
+# --- Layout ---
+
+def _partition(date: pd.Timestamp) -> str:
+    return date.strftime('%Y-%m')
+
+def _write_json(path: str, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+# --- Store ---
+
+class FactorStore:
+    """
+    Factors by date and asset under one directory.
+
+    Args:
+        directory (str): Store root; created on the first write.
+        dtype: Storage type of factors created by this object, float32 or
+               float64. Existing factors keep the type they were created with.
+    """
+
+    def __init__(self, directory: str, dtype='float64'):
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        if self.dtype.kind != 'f':
+            raise ValueError(f"Factors are stored as float32 or float64, not {self.dtype}.")
+        path = os.path.join(directory, 'assets.json')
+        assets = []
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                assets = json.load(f)
+        self._assets = list(assets)
+        self._codes = {asset: code for code, asset in enumerate(self._assets)}
+        self._indexes = {}
+        self._maps = {}
+
+    # --- Index ---
+
+    @property
+    def assets(self) -> pd.Index:
+        """Every asset id seen, in code order."""
+        return pd.Index(self._assets, dtype=object)
+
+    @property
+    def factors(self) -> list:
+        """Names of the stored factors."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory)
+                      if os.path.exists(os.path.join(self.directory, name, 'index.json')))
+
+    def _index(self, factor: str) -> dict:
+        """{'dtype', 'partitions': {key: {'file', 'dates', 'width'}}, 'rows': {date: (key, row)}}, cached."""
+        if factor not in self._indexes:
+            path = os.path.join(self.directory, factor, 'index.json')
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    index = json.load(f)
+            else:
+                index = {'dtype': self.dtype.str, 'partitions': {}}
+            index['rows'] = {date: (key, row) for key, part in index['partitions'].items()
+                             for row, date in enumerate(part['dates'])}
+            self._indexes[factor] = index
+        return self._indexes[factor]
+
+    def dates(self, factor: str) -> pd.DatetimeIndex:
+        """Dates stored for `factor`, sorted."""
+        return pd.DatetimeIndex(sorted(self._index(factor)['rows']))
+
+    def _matrix(self, factor: str, key: str) -> np.ndarray:
+        """Read-only memory map of one partition."""
+        if (factor, key) not in self._maps:
+            index = self._index(factor)
+            part = index['partitions'][key]
+            self._maps[factor, key] = np.memmap(os.path.join(self.directory, factor, part['file']), mode='r',
+                                                dtype=index['dtype'], shape=(len(part['dates']), part['width']))
+        return self._maps[factor, key]
+
+    def _asset_codes(self, assets) -> np.ndarray:
+        """Codes of `assets`, -1 for ids never stored."""
+        return np.array([self._codes.get(asset, -1) for asset in assets], dtype=np.int64)
+
+    # --- Writing ---
+
+    def _register(self, assets) -> np.ndarray:
+        """Codes of `assets`, adding unseen ids to the dictionary."""
+        new = [asset for asset in dict.fromkeys(assets) if asset not in self._codes]
+        if new:
+            for asset in new:
+                self._codes[asset] = len(self._assets)
+                self._assets.append(asset)
+            os.makedirs(self.directory, exist_ok=True)
+            _write_json(os.path.join(self.directory, 'assets.json'), self._assets)
+        return self._asset_codes(assets)
+
+    def _write_factor(self, factor: str, dates: pd.DatetimeIndex, matrix: np.ndarray, codes: np.ndarray = None):
+        """
+        Store rows of `matrix` (dates x every asset code) under their dates,
+        month by month. A date already stored is replaced as a whole, or with
+        `codes` only in those columns, keeping the other assets' values.
+        """
+        index = self._index(factor)
+        dtype = np.dtype(index['dtype'])
+        width = matrix.shape[1]
+        os.makedirs(os.path.join(self.directory, factor), exist_ok=True)
+        keys = np.array([_partition(date) for date in dates])
+        stale = []
+        for key in dict.fromkeys(keys):
+            rows = np.flatnonzero(keys == key)
+            new_dates = [date.strftime('%Y-%m-%d') for date in dates[rows]]
+            part = index['partitions'].get(key)
+            self._maps.pop((factor, key), None)
+            if part is not None and part['width'] == width and min(new_dates) > part['dates'][-1]:
+                # Later dates only: append, dropping any bytes a crashed write left past the index
+                with open(os.path.join(self.directory, factor, part['file']), 'r+b') as f:
+                    f.truncate(len(part['dates']) * width * dtype.itemsize)
+                    f.seek(0, os.SEEK_END)
+                    f.write(matrix[rows].astype(dtype).tobytes())
+                part['dates'] = part['dates'] + new_dates
+            else:
+                # Merge with what the partition holds and rewrite it at the current width
+                merged, version = {}, 0
+                if part is not None:
+                    version = int(part['file'][len(key) + 1:-len('.bin')]) + 1
+                    stale.append(part['file'])
+                    old = np.full((len(part['dates']), width), np.nan, dtype=dtype)
+                    old[:, :part['width']] = self._matrix(factor, key)
+                    self._maps.pop((factor, key), None)
+                    merged = dict(zip(part['dates'], old))
+                for date, row in zip(new_dates, matrix[rows].astype(dtype)):
+                    if codes is not None and date in merged:
+                        merged[date][codes] = row[codes]
+                    else:
+                        merged[date] = row
+                order = sorted(merged)
+                name = f'{key}-{version}.bin'
+                with open(os.path.join(self.directory, factor, name), 'wb') as f:
+                    f.write(np.stack([merged[date] for date in order]).tobytes())
+                part = index['partitions'][key] = {'file': name, 'dates': order, 'width': width}
+            for row, date in enumerate(part['dates']):
+                index['rows'][date] = (key, row)
+
+        index['partitions'] = dict(sorted(index['partitions'].items()))
+        _write_json(os.path.join(self.directory, factor, 'index.json'),
+                    {'dtype': index['dtype'], 'partitions': index['partitions']})
+        # Rewritten partitions' old versions are unreferenced once the index is in place
+        for name in stale:
+            os.remove(os.path.join(self.directory, factor, name))
+
+    def write(self, df: pd.DataFrame, factors: list = None):
+        """
+        Store factor values from a long-format frame. A date already stored
+        for a factor is replaced as a whole by the frame's rows for it.
+
+        Args:
+            df (pd.DataFrame): Rows with 'date', 'asset_id' and one column
+                               per factor, e.g. engine.batch results.
+            factors (list): Columns to store. Defaults to every column other
+                            than date and asset_id.
+
+        Raises:
+            ValueError: If a factor column is not numeric.
+        """
+        factors = factors or [col for col in df.columns if col not in ('date', 'asset_id')]
+        for col in factors:
+            if not pd.api.types.is_numeric_dtype(df[col]):
+                raise ValueError(f"Column '{col}' is not numeric and cannot be stored.")
+        if not isinstance(df['date'].dtype, pd.CategoricalDtype):
+            df = df.assign(date=pd.to_datetime(df['date']))
+        panel = Panel.from_long(df, factors)
+        codes = self._register(list(panel.assets))
+        for col in factors:
+            matrix = np.full((len(panel.dates), len(self._assets)), np.nan)
+            matrix[:, codes] = panel[col]
+            self._write_factor(col, panel.dates, matrix)
+
+    def write_block(self, dates, values: dict, assets):
+        """
+        Store a block of dates given as matrices, e.g. a date range of
+        engine.sharded results, without building a long frame. On a date
+        already stored only the given assets are overwritten; the others
+        keep their values.
+
+        Args:
+            dates: The block's dates.
+            values (dict): {factor: (len(dates) x len(assets)) matrix}.
+            assets: Asset ids the matrix columns are aligned to.
+        """
+        codes = self._register(list(assets))
+        dates = pd.DatetimeIndex(dates)
+        for factor, array in values.items():
+            matrix = np.full((len(dates), len(self._assets)), np.nan)
+            matrix[:, codes] = np.asarray(array, dtype=np.float64).reshape(len(dates), len(codes))
+            self._write_factor(factor, dates, matrix, codes)
+
+    def append(self, date, values: dict, assets):
+        """
+        Store one date of factor values, e.g. the result of
+        FormulaStream.update. Assets not given keep any value already
+        stored for the date.
+
+        Args:
+            date: The date.
+            values (dict): {factor: array of values over `assets`}.
+            assets: Asset ids the arrays are aligned to.
+        """
+        self.write_block([pd.Timestamp(date)], values, assets)
+
+    # --- Reading ---
+
+    def at(self, date, factors: list = None, assets=None) -> pd.DataFrame:
+        """
+        Point-in-time lookup: factor values of some assets on one date.
+
+        Args:
+            date: The date.
+            factors (list): Factor names. Defaults to all.
+            assets: Asset ids. Defaults to every stored asset.
+
+        Returns:
+            pd.DataFrame: One row per asset (index asset_id) and one column
+                          per factor; NaN where a factor has no value for
+                          the date or the asset.
+        """
+        day = pd.Timestamp(date).strftime('%Y-%m-%d')
+        factors = self.factors if factors is None else list(factors)
+        assets = self.assets if assets is None else pd.Index(assets, dtype=object)
+        codes = self._asset_codes(assets)
+        columns = {}
+        for factor in factors:
+            column = np.full(len(assets), np.nan)
+            location = self._index(factor)['rows'].get(day)
+            if location is not None:
+                row = self._matrix(factor, location[0])[location[1]]
+                present = (codes >= 0) & (codes < len(row))
+                column[present] = row[codes[present]]
+            columns[factor] = column
+        return pd.DataFrame(columns, index=pd.Index(assets, name='asset_id'), columns=factors)
+
+    def read(self, factor: str, start=None, end=None, assets=None) -> pd.DataFrame:
+        """
+        One factor over a date range.
+
+        Args:
+            factor (str): Factor name.
+            start, end: First and last dates (inclusive); None is open-ended.
+            assets: Asset ids. Defaults to every stored asset.
+
+        Returns:
+            pd.DataFrame: Dates x assets, only the stored dates in range.
+        """
+        index = self._index(factor)
+        first = None if start is None else pd.Timestamp(start).strftime('%Y-%m-%d')
+        last = None if end is None else pd.Timestamp(end).strftime('%Y-%m-%d')
+        assets = self.assets if assets is None else pd.Index(assets, dtype=object)
+        codes = self._asset_codes(assets)
+        dates, blocks = [], []
+        for key, part in index['partitions'].items():
+            if (first is not None and key < first[:7]) or (last is not None and key > last[:7]):
+                continue
+            rows = [row for row, date in enumerate(part['dates'])
+                    if (first is None or date >= first) and (last is None or date <= last)]
+            if not rows:
+                continue
+            present = (codes >= 0) & (codes < part['width'])
+            block = np.full((len(rows), len(assets)), np.nan, dtype=index['dtype'])
+            block[:, present] = self._matrix(factor, key)[rows][:, codes[present]]
+            dates += [part['dates'][row] for row in rows]
+            blocks.append(block)
+        values = np.vstack(blocks) if blocks else np.empty((0, len(assets)), dtype=index['dtype'])
+        return pd.DataFrame(values, index=pd.DatetimeIndex(dates, name='date'), columns=pd.Index(assets, name='asset_id'))
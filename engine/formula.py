@@ -0,0 +1,709 @@
+"""
+Compiler for the formula language of doc/functions.md (the Alpha101 notation).
+
+    formula = compile_formula('(-1 * correlation(open, volume, 10))')
+    panel = Panel.from_long(df, formula.fields)
+    df['alpha6'] = panel.to_long(formula.evaluate(panel))
+
+A formula string is parsed straight into a DAG of operator nodes that run on
+the engine's (date x asset) matrices. While the DAG is built:
+
+- constant sub-expressions are folded and windows are floored to integers
+  (functions.md: "non-integer number of days d is converted to floor(d)");
+- structurally identical sub-expressions become one shared node, with the
+  operands of commutative operators put in a canonical order first;
+- exact identities are dropped (x * 1, x / 1, x ^ 1, -(-x), window-1
+  ts_min / ts_max / product).
+
+Evaluation walks the nodes in dependency order and frees every intermediate
+as soon as its last consumer has run. evaluate(panel, workers=8) runs
+independent nodes (the five terms of alpha36, say) concurrently on a thread
+pool and splits large column-wise operators into asset blocks; the results
+are the same as sequentially. compile_formulas builds several formulas
+into one DAG, so sub-expressions shared between alphas are computed once:
+
+    batch = compile_formulas({'alpha39': FORMULAS['alpha39'], 'alpha19': FORMULAS['alpha19']})
+    results = batch.evaluate(Panel.from_long(df, batch.fields))
+"""
+
+import heapq
+import math
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from . import operators as op
+
+# --- Operator Table ---
+
+def _truthy(x):
+    """Condition values: non-zero is true, NaN is false."""
+    return (x != 0) & ~np.isnan(x)
+
+def _comparison(func):
+    def compare(x, y):
+        return func(x, y).astype(np.float64)
+    return compare
+
+def _logical(func):
+    def combine(x, y):
+        return func(_truthy(x), _truthy(y)).astype(np.float64)
+    return combine
+
+def _where(cond, x, y):
+    return np.where(_truthy(cond), x, y)
+
+# name: (implementation, argument kinds). Kinds: 'x' expression, 'd' window
+# (constant, floored to int), 'a' scalar constant, 'g' group field.
+_OPERATORS = {
+    # Arithmetic, comparison and logic (element-wise, accept scalars)
+    'add': (np.add, 'xx'),
+    'sub': (np.subtract, 'xx'),
+    'mul': (np.multiply, 'xx'),
+    'div': (np.divide, 'xx'),
+    'pow': (np.power, 'xx'),
+    'neg': (np.negative, 'x'),
+    'lt': (_comparison(np.less), 'xx'),
+    'gt': (_comparison(np.greater), 'xx'),
+    'le': (_comparison(np.less_equal), 'xx'),
+    'ge': (_comparison(np.greater_equal), 'xx'),
+    'eq': (_comparison(np.equal), 'xx'),
+    'ne': (_comparison(np.not_equal), 'xx'),
+    'or': (_logical(np.logical_or), 'xx'),
+    'and': (_logical(np.logical_and), 'xx'),
+    'where': (_where, 'xxx'),
+    'abs': (np.abs, 'x'),
+    'log': (np.log, 'x'),
+    'sign': (np.sign, 'x'),
+    'minimum': (np.minimum, 'xx'),
+    'maximum': (np.maximum, 'xx'),
+    'signed_power': (op.signed_power, 'xx'),
+    # Cross-sectional
+    'cs_rank': (op.cs_rank, 'x'),
+    'scale': (op.scale, 'xa'),
+    'indneutralize': (op.indneutralize, 'xg'),
+    # Time-series
+    'ts_delay': (op.ts_delay, 'xd'),
+    'ts_delta': (op.ts_delta, 'xd'),
+    'ts_sum': (op.ts_sum, 'xd'),
+    'ts_mean': (op.ts_mean, 'xd'),
+    'ts_stddev': (op.ts_stddev, 'xd'),
+    'ts_product': (op.ts_product, 'xd'),
+    'ts_min': (op.ts_min, 'xd'),
+    'ts_max': (op.ts_max, 'xd'),
+    'ts_argmax': (op.ts_argmax, 'xd'),
+    'ts_argmin': (op.ts_argmin, 'xd'),
+    'ts_rank': (op.ts_rank, 'xd'),
+    'ts_correlation': (op.ts_correlation, 'xxd'),
+    'ts_covariance': (op.ts_covariance, 'xxd'),
+    'decay_linear': (op.decay_linear, 'xd'),
+}
+
+# Operators that broadcast scalars and can be folded when every input is constant
+_ELEMENTWISE = {
+    'add', 'sub', 'mul', 'div', 'pow', 'neg', 'lt', 'gt', 'le', 'ge', 'eq', 'ne',
+    'or', 'and', 'where', 'abs', 'log', 'sign', 'minimum', 'maximum', 'signed_power',
+}
+# Operators that combine assets on a date; every other operator computes each
+# asset's column from that asset's columns alone
+_CROSS_SECTIONAL = {'cs_rank', 'scale', 'indneutralize'}
+_COMMUTATIVE = {'add', 'mul', 'eq', 'ne', 'or', 'and', 'minimum', 'maximum'}
+# Window-1 forms that return their input unchanged
+_WINDOW_ONE_IDENTITY = {'ts_min', 'ts_max', 'ts_product'}
+
+# Function names as written in formulas -> operator names
+_ALIASES = {
+    'rank': 'cs_rank',
+    'delay': 'ts_delay',
+    'delta': 'ts_delta',
+    'sum': 'ts_sum',
+    'product': 'ts_product',
+    'stddev': 'ts_stddev',
+    'correlation': 'ts_correlation',
+    'covariance': 'ts_covariance',
+    'ts_corr': 'ts_correlation',
+    'ts_cov': 'ts_covariance',
+    'signedpower': 'signed_power',
+}
+
+_BINARY = {
+    '+': 'add', '-': 'sub', '*': 'mul', '/': 'div', '^': 'pow',
+    '<': 'lt', '>': 'gt', '<=': 'le', '>=': 'ge', '==': 'eq', '!=': 'ne',
+    '||': 'or', '&&': 'and',
+}
+
+_ADV = re.compile(r'adv(\d+)$')
+# What adv{d} averages: 'dollar' is close * volume, as in doc/functions.md;
+# 'shares' is volume alone, as the calculators under alpha/ compute adv20
+_ADV_VOLUMES = ('dollar', 'shares')
+
+# --- DAG ---
+
+class Node:
+    """
+    One operation of a compiled formula: a constant, an input field, or an
+    operator applied to child nodes with constant parameters (windows etc.).
+    """
+
+    __slots__ = ('kind', 'name', 'args', 'params', 'index')
+
+    def __init__(self, kind: str, name, args: tuple, params: tuple, index: int):
+        self.kind = kind        # 'const', 'field', 'adv' or 'op'
+        self.name = name        # constant value, field name or operator name
+        self.args = args
+        self.params = params
+        self.index = index      # creation order, a valid evaluation order
+
+    def __repr__(self) -> str:
+        if self.kind == 'const':
+            return repr(self.name)
+        if self.kind == 'field':
+            return self.name
+        if self.kind == 'adv':
+            return f'adv{self.params[0]}'
+        return f"{self.name}({', '.join([repr(a) for a in self.args] + [repr(p) for p in self.params])})"
+
+
+class _Builder:
+    """Creates nodes, folding constants and sharing identical sub-expressions."""
+
+    def __init__(self, adv: str = 'dollar'):
+        if adv not in _ADV_VOLUMES:
+            raise ValueError(f"adv must be one of {_ADV_VOLUMES}, got {adv!r}.")
+        self.adv = adv
+        self.table = {}
+        self.nodes = []
+
+    def _intern(self, kind: str, name, args: tuple = (), params: tuple = ()) -> Node:
+        key = (kind, name, tuple(a.index for a in args), params)
+        node = self.table.get(key)
+        if node is None:
+            node = Node(kind, name, args, params, len(self.nodes))
+            self.table[key] = node
+            self.nodes.append(node)
+        return node
+
+    def const(self, value: float) -> Node:
+        value = float(value)
+        # The sign parameter keeps 0.0 and -0.0 apart; they are equal as dict keys
+        return self._intern('const', value, params=(math.copysign(1.0, value),))
+
+    def field(self, name: str) -> Node:
+        match = _ADV.match(name)
+        if match:
+            # adv{d}: average daily dollar (or share) volume over d days,
+            # unless the panel already carries an adv{d} field
+            window = int(match.group(1))
+            if self.adv == 'dollar':
+                volume = self.apply('mul', [self.field('close'), self.field('volume')])
+            else:
+                volume = self.field('volume')
+            return self._intern('adv', name, (volume,), (window,))
+        return self._intern('field', name)
+
+    def apply(self, name: str, args: list) -> Node:
+        func, kinds = _OPERATORS[name]
+        if name == 'scale' and len(args) == 1:
+            args = args + [self.const(1.0)]
+        if len(args) != len(kinds):
+            raise ValueError(f"{name} expects {len(kinds)} arguments, got {len(args)}.")
+
+        inputs, params = [], []
+        for arg, kind in zip(args, kinds):
+            if kind in 'da':
+                if arg.kind != 'const':
+                    raise ValueError(f"Argument {arg!r} of {name} must be a constant.")
+                value = arg.name
+                if kind == 'd':
+                    value = int(math.floor(value))
+                    if value < 1:
+                        raise ValueError(f"Window of {name} must be at least 1, got {arg.name}.")
+                params.append(value)
+            elif kind == 'g':
+                if arg.kind != 'field':
+                    raise ValueError(f"Group argument of {name} must be a field, got {arg!r}.")
+                inputs.append(arg)
+            else:
+                inputs.append(arg)
+        params = tuple(params)
+
+        simplified = self._simplify(name, inputs, params)
+        if simplified is not None:
+            return simplified
+        if name in _ELEMENTWISE and all(a.kind == 'const' for a in inputs):
+            with np.errstate(all='ignore'):
+                return self.const(func(*[np.float64(a.name) for a in inputs]))
+        if name in _COMMUTATIVE:
+            inputs.sort(key=lambda a: a.index)
+        return self._intern('op', name, tuple(inputs), params)
+
+    def _simplify(self, name: str, inputs: list, params: tuple):
+        """Exact rewrites that return an existing node, or None."""
+        def is_const(node, value):
+            return node.kind == 'const' and node.name == value
+
+        if name == 'mul':
+            if is_const(inputs[1], 1.0):
+                return inputs[0]
+            if is_const(inputs[0], 1.0):
+                return inputs[1]
+        if name in ('div', 'pow') and is_const(inputs[1], 1.0):
+            return inputs[0]
+        if name == 'neg' and inputs[0].kind == 'op' and inputs[0].name == 'neg':
+            return inputs[0].args[0]
+        if name in _WINDOW_ONE_IDENTITY and params == (1,):
+            return inputs[0]
+        return None
+
+    def call(self, name: str, args: list) -> Node:
+        """Resolve a function as written in a formula to an operator node."""
+        name = _ALIASES.get(name, name)
+        if name in ('min', 'max'):
+            # min(x, d) is ts_min; with an expression second argument it is element-wise
+            if len(args) == 2 and args[1].kind == 'const':
+                name = 'ts_' + name
+            else:
+                name = 'minimum' if name == 'min' else 'maximum'
+        if name not in _OPERATORS:
+            raise ValueError(f"Unknown function '{name}'.")
+        return self.apply(name, args)
+
+# --- Parser ---
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?)
+      | (?P<symbol>\|\||&&|==|!=|<=|>=|[-+*/^<>?:(),])
+    )""", re.VERBOSE)
+
+def _tokenize(source: str) -> list:
+    tokens = []
+    pos = 0
+    source = source.rstrip()
+    while pos < len(source):
+        match = _TOKEN.match(source, pos)
+        if match is None:
+            pos += len(source[pos:]) - len(source[pos:].lstrip())
+            raise ValueError(f"Unexpected character {source[pos]!r} at position {pos} in formula.")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind), match.start(kind)))
+        pos = match.end()
+    tokens.append(('end', '', len(source)))
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive-descent parser. Precedence, loosest first: ?:, ||, &&, == !=,
+    < > <= >=, + -, * /, unary -, ^. The ternary and ^ associate to the right.
+    """
+
+    _LEVELS = [('||',), ('&&',), ('==', '!='), ('<', '>', '<=', '>='), ('+', '-'), ('*', '/')]
+
+    def __init__(self, source: str, builder: _Builder):
+        self.tokens = _tokenize(source)
+        self.pos = 0
+        self.builder = builder
+
+    def peek(self) -> tuple:
+        return self.tokens[self.pos]
+
+    def take(self, value: str = None) -> tuple:
+        token = self.tokens[self.pos]
+        if value is not None and token[1] != value:
+            found = token[1] or 'end of formula'
+            raise ValueError(f"Expected '{value}' at position {token[2]} in formula, found '{found}'.")
+        self.pos += 1
+        return token
+
+    def parse(self) -> Node:
+        node = self.ternary()
+        self.take('')
+        return node
+
+    def ternary(self) -> Node:
+        cond = self.binary(0)
+        if self.peek()[1] != '?':
+            return cond
+        self.take('?')
+        if_true = self.ternary()
+        self.take(':')
+        if_false = self.ternary()
+        return self.builder.apply('where', [cond, if_true, if_false])
+
+    def binary(self, level: int) -> Node:
+        if level == len(self._LEVELS):
+            return self.unary()
+        node = self.binary(level + 1)
+        while self.peek()[0] == 'symbol' and self.peek()[1] in self._LEVELS[level]:
+            symbol = self.take()[1]
+            node = self.builder.apply(_BINARY[symbol], [node, self.binary(level + 1)])
+        return node
+
+    def unary(self) -> Node:
+        if self.peek()[1] == '-':
+            self.take()
+            return self.builder.apply('neg', [self.unary()])
+        if self.peek()[1] == '+':
+            self.take()
+            return self.unary()
+        return self.power()
+
+    def power(self) -> Node:
+        base = self.primary()
+        if self.peek()[1] == '^':
+            self.take()
+            return self.builder.apply('pow', [base, self.unary()])
+        return base
+
+    def primary(self) -> Node:
+        kind, value, position = self.take()
+        if kind == 'number':
+            return self.builder.const(float(value))
+        if value == '(':
+            node = self.ternary()
+            self.take(')')
+            return node
+        if kind == 'name':
+            name = value.lower()
+            if self.peek()[1] == '(':
+                self.take('(')
+                args = []
+                if self.peek()[1] != ')':
+                    args.append(self.ternary())
+                    while self.peek()[1] == ',':
+                        self.take(',')
+                        args.append(self.ternary())
+                self.take(')')
+                return self.builder.call(name, args)
+            if name.startswith('indclass.'):
+                # IndClass.level refers to a group field named after the level
+                name = name.split('.', 1)[1]
+            return self.builder.field(name)
+        raise ValueError(f"Unexpected '{value or 'end of formula'}' at position {position} in formula.")
+
+# --- Evaluation ---
+
+# Nodes with at least this many cells are split into asset blocks when
+# evaluating on several threads
+_SPLIT_CELLS = 1 << 18
+
+def _operation(node: Node, values: dict, panel) -> tuple:
+    """(function, arguments, parameters) of an operator node or a computed adv{d}."""
+    if node.kind == 'adv':
+        return op.ts_mean, [values[node.args[0].index]], node.params
+    func, _ = _OPERATORS[node.name]
+    args = [values[arg.index] for arg in node.args]
+    if node.name not in _ELEMENTWISE:
+        args = [np.full(panel.shape, a) if np.ndim(a) == 0 else a for a in args]
+    return func, args, node.params
+
+def _cast(value, dtype: np.dtype):
+    """A node's value in the working precision; float64 values are kept as they are."""
+    if dtype == np.float64:
+        return value
+    return np.asarray(value).astype(dtype, copy=False)
+
+def _run(node: Node, values: dict, panel, dtype: np.dtype = np.dtype(np.float64)):
+    if node.kind == 'const':
+        return dtype.type(node.name)
+    if node.kind == 'field':
+        if node.name not in panel:
+            raise ValueError(f"Required column '{node.name}' not found in panel.")
+        return _cast(panel[node.name], dtype)
+    if node.kind == 'adv' and node.name in panel:
+        return _cast(panel[node.name], dtype)
+    func, args, params = _operation(node, values, panel)
+    return _cast(func(*args, *params), dtype)
+
+def _splittable(node: Node) -> bool:
+    """Whether `node` gives the same result computed block by block of asset columns."""
+    return node.kind == 'adv' or node.name not in _CROSS_SECTIONAL
+
+def _run_task(func, args: list, params: tuple, dtype: np.dtype, out: np.ndarray = None, columns: slice = None):
+    """Thread-pool task: one operation, or its asset `columns` written into `out`."""
+    with np.errstate(all='ignore'):
+        if out is None:
+            return _cast(func(*args, *params), dtype)
+        out[:, columns] = func(*[a[:, columns] if np.ndim(a) == 2 else a for a in args], *params)
+        return out
+
+def _schedule(nodes: list, values: dict, panel, done, workers: int, dtype: np.dtype):
+    """
+    Run `nodes` on `workers` threads, each as soon as its inputs are
+    computed, lowest index first so that intermediates are freed about as
+    early as in a sequential walk. Inputs and constants are read on this
+    thread, and a large column-wise operator runs as one task per block of
+    asset columns. NumPy and the compiled kernels release the GIL, so the
+    threads compute concurrently. `done(node)` is called on this thread once
+    a node's value is in `values`.
+    """
+    waiting = {node.index: len({arg.index for arg in node.args}) for node in nodes}
+    consumers = {}
+    for node in nodes:
+        for index in {arg.index for arg in node.args}:
+            consumers.setdefault(index, []).append(node)
+    by_index = {node.index: node for node in nodes}
+    ready = [node.index for node in nodes if waiting[node.index] == 0]
+    heapq.heapify(ready)
+    running = {}   # future -> node
+    blocks = {}    # node index -> number of its blocks still running
+
+    def finish(node):
+        done(node)
+        for consumer in consumers.get(node.index, ()):
+            waiting[consumer.index] -= 1
+            if waiting[consumer.index] == 0:
+                heapq.heappush(ready, consumer.index)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while ready or running:
+            while ready and len(running) < workers:
+                node = by_index[heapq.heappop(ready)]
+                if node.kind in ('const', 'field') or (node.kind == 'adv' and node.name in panel):
+                    values[node.index] = _run(node, values, panel, dtype)
+                    finish(node)
+                    continue
+                operation = _operation(node, values, panel)
+                if panel.shape[0] * panel.shape[1] >= _SPLIT_CELLS and _splittable(node):
+                    out = np.empty(panel.shape, dtype=dtype)
+                    parts = min(workers, panel.shape[1])
+                    bounds = np.linspace(0, panel.shape[1], parts + 1).astype(int)
+                    blocks[node.index] = parts
+                    for lo, hi in zip(bounds[:-1], bounds[1:]):
+                        running[pool.submit(_run_task, *operation, dtype, out, slice(lo, hi))] = node
+                else:
+                    running[pool.submit(_run_task, *operation, dtype)] = node
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                node = running.pop(future)
+                result = future.result()
+                if node.index in blocks:
+                    blocks[node.index] -= 1
+                    if blocks[node.index]:
+                        continue
+                    del blocks[node.index]
+                values[node.index] = result
+                finish(node)
+
+def _execute(nodes: list, roots: list, panel, workers: int = 1, dtype='float64') -> dict:
+    """
+    Evaluate `nodes` (in index order) and return {root index: matrix}. Each
+    node runs once however many consumers it has, and is freed as soon as the
+    last of them has run unless it is a root. With workers > 1, independent
+    nodes run concurrently on a thread pool (see _schedule); the results are
+    the same matrices in the same layout. With dtype float32, input fields,
+    constants and every intermediate are held in float32.
+
+    Raises:
+        ValueError: If dtype is not float32 or float64.
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError(f"Formulas are evaluated in float32 or float64, not {dtype}.")
+    # Number of pending consumers per node, so intermediates can be freed
+    pending = {}
+    for node in nodes:
+        for arg in node.args:
+            pending[arg.index] = pending.get(arg.index, 0) + 1
+    keep = {root.index for root in roots}
+
+    values = {}
+
+    def done(node):
+        for arg in node.args:
+            pending[arg.index] -= 1
+            if pending[arg.index] == 0 and arg.index not in keep:
+                del values[arg.index]
+
+    if workers > 1:
+        _schedule(nodes, values, panel, done, workers, dtype)
+    else:
+        with np.errstate(all='ignore'):
+            for node in nodes:
+                values[node.index] = _run(node, values, panel, dtype)
+                done(node)
+
+    results = {}
+    for root in roots:
+        result = values[root.index]
+        if np.ndim(result) == 0:
+            result = np.full(panel.shape, result, dtype=dtype)
+        elif root.kind in ('field', 'adv'):
+            # Never hand out the panel's own matrix
+            result = np.array(result, dtype=dtype)
+        results[root.index] = np.asarray(result, dtype=dtype)
+    return results
+
+def _prune(roots: list) -> list:
+    """Nodes reachable from any of `roots`, in evaluation order."""
+    seen = {}
+    stack = list(roots)
+    while stack:
+        node = stack.pop()
+        if node.index not in seen:
+            seen[node.index] = node
+            stack.extend(node.args)
+    return [seen[i] for i in sorted(seen)]
+
+def _lookback(nodes: list) -> int:
+    """
+    Trading days of history before a date that the result on that date can
+    depend on: a d-day window reaches back d - 1 days, a d-day delay d days,
+    and nested operators add up along the longest path.
+    """
+    reach = {}
+    for node in nodes:
+        days = max((reach[arg.index] for arg in node.args), default=0)
+        if node.kind == 'adv':
+            days += node.params[0] - 1
+        elif node.kind == 'op' and node.name in ('ts_delay', 'ts_delta'):
+            days += node.params[0]
+        elif node.kind == 'op' and 'd' in _OPERATORS[node.name][1]:
+            days += node.params[0] - 1
+        reach[node.index] = days
+    return max(reach.values(), default=0)
+
+def _fields(nodes: list) -> list:
+    names = []
+    for node in nodes:
+        if node.kind == 'field' and node.name not in names:
+            names.append(node.name)
+    return names
+
+# --- Compiled Formulas ---
+
+class Formula:
+    """A formula compiled to an operator DAG, ready to run on a Panel."""
+
+    def __init__(self, source: str, root: Node, nodes: list):
+        self.source = source
+        self.root = root
+        self.nodes = nodes
+
+    @property
+    def fields(self) -> list:
+        """Input fields the formula reads, for Panel.from_long."""
+        return _fields(self.nodes)
+
+    @property
+    def lookback(self) -> int:
+        """Days of history needed before the first date to evaluate."""
+        return _lookback(self.nodes)
+
+    def __repr__(self) -> str:
+        return f"Formula({self.root!r})"
+
+    def evaluate(self, panel, workers: int = 1, dtype='float64') -> np.ndarray:
+        """
+        Run the formula on a panel.
+
+        Args:
+            panel (Panel): Panel holding every field in `self.fields`. An
+                           adv{d} field is used as is when present.
+            workers (int): Threads to run independent operators on, and to
+                           split large column-wise operators across.
+            dtype: float64, or float32 to hold inputs and intermediates in
+                   half the memory; running sums are still accumulated in
+                   float64 (see engine.precision for the deviation).
+
+        Returns:
+            np.ndarray: (n_dates, n_assets) matrix of `dtype`.
+        """
+        return _execute(self.nodes, [self.root], panel, workers, dtype)[self.root.index]
+
+
+class FormulaSet:
+    """
+    Several formulas compiled into one DAG. A sub-expression that appears in
+    more than one formula (adv20, delta(close, 7), ...) is a single node and is
+    computed once per evaluation.
+    """
+
+    def __init__(self, formulas: dict, nodes: list, adv: str = 'dollar'):
+        self.formulas = formulas
+        self.nodes = nodes
+        self.adv = adv
+
+    @property
+    def fields(self) -> list:
+        """Input fields read by any of the formulas, for Panel.from_long."""
+        return _fields(self.nodes)
+
+    @property
+    def lookback(self) -> int:
+        """Longest lookback of any of the formulas."""
+        return _lookback(self.nodes)
+
+    def __len__(self) -> int:
+        return len(self.formulas)
+
+    def __repr__(self) -> str:
+        separate = sum(len(f.nodes) for f in self.formulas.values())
+        return f"FormulaSet({len(self.formulas)} formulas, {len(self.nodes)} nodes, {separate} if compiled separately)"
+
+    def evaluate(self, panel, workers: int = 1, dtype='float64') -> dict:
+        """
+        Run every formula on a panel.
+
+        Args:
+            panel (Panel): Panel holding every field in `self.fields`.
+            workers (int), dtype: As for Formula.evaluate.
+
+        Returns:
+            dict: {name: (n_dates, n_assets) matrix of `dtype`}, in input order.
+        """
+        roots = [f.root for f in self.formulas.values()]
+        results = _execute(self.nodes, roots, panel, workers, dtype)
+        return {name: results[f.root.index] for name, f in self.formulas.items()}
+
+
+def compile_formula(source: str, adv: str = 'dollar') -> Formula:
+    """
+    Compile a formula written in the notation of doc/functions.md.
+
+    Names are case-insensitive. Bare names are input fields (open, close,
+    returns, vwap, ...), adv{d} is the d-day average of close * volume, and
+    IndClass.level reads the group codes of field `level` for indneutralize.
+    min(x, d) / max(x, d) are ts_min / ts_max when d is a constant and
+    element-wise otherwise. Comparisons and ||, && return 1.0 / 0.0; NaN
+    conditions count as false.
+
+    Args:
+        source (str): The formula.
+        adv (str): 'dollar' for the paper's adv{d} (dollar volume), or
+                   'shares' to average volume alone, as the calculators under
+                   alpha/ compute adv20.
+
+    Raises:
+        ValueError: On a syntax error, an unknown function, a wrong number of
+                    arguments, a non-constant window or an unknown `adv`.
+    """
+    builder = _Builder(adv)
+    root = _Parser(source, builder).parse()
+    return Formula(source, root, _prune([root]))
+
+def compile_formulas(sources: dict, adv: str = 'dollar') -> FormulaSet:
+    """
+    Compile several formulas into one shared DAG (see compile_formula).
+
+    Args:
+        sources (dict): {name: formula string}, e.g. engine.FORMULAS.
+        adv (str): What adv{d} averages, as for compile_formula.
+
+    Raises:
+        ValueError: If any formula fails to compile; the message names it.
+    """
+    builder = _Builder(adv)
+    formulas = {}
+    for name, source in sources.items():
+        try:
+            root = _Parser(source, builder).parse()
+        except ValueError as e:
+            raise ValueError(f"{name}: {e}") from e
+        formulas[name] = Formula(source, root, _prune([root]))
+    return FormulaSet(formulas, _prune([f.root for f in formulas.values()]), adv)
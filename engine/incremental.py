@@ -0,0 +1,595 @@
+"""
+Incremental evaluation of compiled formulas, one new date at a time.
+
+    stream = FormulaStream(compile_formulas(FORMULAS))
+    history = stream.start(Panel.from_long(df, stream.fields))
+    today = stream.update(df_today)       # {name: values per asset}
+
+`start` evaluates the full history once and leaves every time-series node of
+the DAG with compact per-asset state: the last `window` values of its inputs
+in a ring buffer, plus the running state of the batch operator where it has
+one. `update` then computes only the new date, so appending a day costs
+O(assets x operators) instead of O(history), and gives the same bits as
+FormulaSet.evaluate over the extended history:
+
+- ts_delay / ts_delta read the ring directly;
+- ts_sum, ts_mean, ts_stddev (and adv{d}), and decay_linear,
+  ts_correlation and ts_covariance over windows longer than
+  operators._SCAN_WINDOW, step the batch operator's running sums one date
+  on; `start` replays the history to build them;
+- ts_min / ts_max / ts_argmax / ts_argmin keep the current extreme and its
+  age, rescanning an asset's ring only when its extreme leaves the window;
+- ts_rank, ts_product and the short-window decay_linear, ts_correlation
+  and ts_covariance apply the batch operator to the ring.
+
+Element-wise and cross-sectional nodes run unchanged on a one-date panel.
+
+With a checkpoint directory the state is written to disk after `start` and
+after every `update`, and a restarted process resumes from the last
+completed date without replaying any history:
+
+    stream = FormulaStream(compile_formulas(FORMULAS), checkpoint='state/')
+    ...
+    stream = FormulaStream.load('state/')     # after a restart
+    today = stream.update(df_today)
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import operators as op
+from .formula import _OPERATORS, FormulaSet, _run, compile_formulas
+from .panel import Panel
+
+# --- Per-node State ---
+
+class _Ring:
+    """The last `size` rows of an operator input; the oldest row is overwritten first."""
+
+    def __init__(self, history: np.ndarray, size: int):
+        self.values = np.full((size, history.shape[1]), np.nan)
+        tail = history[-size:]
+        self.values[size - len(tail):] = tail
+        self.head = 0   # slot of the oldest row
+
+    def push(self, row: np.ndarray) -> np.ndarray:
+        """Store `row` and return the row it replaces, `size` dates older."""
+        old = self.values[self.head].copy()
+        self.values[self.head] = row
+        self.head = (self.head + 1) % len(self.values)
+        return old
+
+    def ordered(self, cols=slice(None)) -> np.ndarray:
+        """The window oldest first, optionally for some assets only."""
+        return np.concatenate([self.values[self.head:], self.values[:self.head]])[:, cols]
+
+
+class _TimeSeries:
+    """
+    State of one time-series node; `update` takes and returns one row per
+    input. `dates` counts the dates seen, so it is the position of the next
+    one in the full history.
+    """
+
+    def __init__(self, name: str, window: int, inputs: list):
+        self.func = _OPERATORS[name][0]
+        self.window = window
+        self.rings = [_Ring(x, window) for x in inputs]
+        self.dates = len(inputs[0])
+        self.seed(inputs)
+
+    def seed(self, inputs: list):
+        """Build any running state from the full history of the inputs."""
+
+    def exact(self, cols=slice(None)) -> np.ndarray:
+        """The batch operator on the current window, for the assets in `cols`."""
+        windows = [ring.ordered(cols) for ring in self.rings]
+        return self.func(*windows, self.window)[-1]
+
+    def update(self, rows: list) -> np.ndarray:
+        olds = [ring.push(row) for ring, row in zip(self.rings, rows)]
+        result = self.advance(rows, olds)
+        self.dates += 1
+        return result
+
+    def advance(self, rows: list, olds: list) -> np.ndarray:
+        """Today's result; `olds` are the rows that just left the rings."""
+        return self.exact()
+
+    def snapshot(self) -> tuple:
+        """Everything `update` changes: ({key: array}, {key: int})."""
+        arrays = {f'rings.{i}': ring.values for i, ring in enumerate(self.rings)}
+        for key, value in vars(self).items():
+            if isinstance(value, np.ndarray):
+                arrays[key] = value
+            elif isinstance(value, list) and value and isinstance(value[0], np.ndarray):
+                arrays.update({f'{key}.{i}': item for i, item in enumerate(value)})
+        scalars = {'dates': self.dates, 'heads': [ring.head for ring in self.rings]}
+        return arrays, scalars
+
+    def restore(self, arrays: dict, scalars: dict):
+        """Inverse of snapshot, on a state built with the same name and window."""
+        for key, value in arrays.items():
+            name, _, i = key.partition('.')
+            if name == 'rings':
+                self.rings[int(i)].values = value
+            elif i:
+                getattr(self, name)[int(i)] = value
+            else:
+                setattr(self, name, value)
+        self.dates = scalars['dates']
+        for ring, head in zip(self.rings, scalars['heads']):
+            ring.head = head
+
+
+class _Delay(_TimeSeries):
+    """ts_delay / ts_delta: the value leaving the ring is the one `window` dates ago."""
+
+    def __init__(self, name: str, window: int, inputs: list):
+        self.delta = name == 'ts_delta'
+        super().__init__(name, window, inputs)
+
+    def advance(self, rows, olds):
+        return rows[0] - olds[0] if self.delta else olds[0]
+
+
+class _Rolling(_TimeSeries):
+    """
+    ts_sum, ts_mean and ts_stddev, one date of the batch operator's running
+    arithmetic (pandas' roll_sum / roll_mean / roll_var, as the rolling_moments
+    kernel) across all assets: Kahan-compensated sums or Welford updates with
+    separate compensations for values entering and leaving, and the count of
+    trailing repeats that makes a constant window exact.
+    """
+
+    def __init__(self, name: str, window: int, inputs: list):
+        self.stat = ('ts_sum', 'ts_mean', 'ts_stddev').index(name)
+        super().__init__(name, window, inputs)
+
+    def seed(self, inputs):
+        (x,) = inputs
+        n_assets = x.shape[1]
+        self.total, self.comp_add, self.comp_remove, self.ssqdm, self.last = (np.zeros(n_assets) for _ in range(5))
+        self.nobs, self.same, self.negative = (np.zeros(n_assets, dtype=np.int64) for _ in range(3))
+        missing = np.full(n_assets, np.nan)
+        for t in range(len(x)):
+            self._move(t, x[t], x[t - self.window] if t >= self.window else missing)
+
+    def advance(self, rows, olds):
+        self._move(self.dates, rows[0], olds[0])
+        return self.value()
+
+    def _move(self, t: int, x: np.ndarray, old: np.ndarray):
+        """Slide the window to date `t`: `x` enters it and `old` (NaN before `window` dates) leaves."""
+        if t == 0 or self.window == 1:
+            # pandas starts afresh on every window that does not overlap the last
+            for running in (self.total, self.comp_add, self.comp_remove, self.ssqdm):
+                running[:] = 0.0
+            self.last[:] = x
+            for counter in (self.nobs, self.same, self.negative):
+                counter[:] = 0
+        else:
+            gone = np.isfinite(old)
+            self.nobs -= gone
+            if self.stat == 2:
+                # total holds the running mean
+                kept = gone & (self.nobs > 0)
+                prev_mean = self.total - self.comp_remove
+                y = old - self.comp_remove
+                s = y - self.total
+                comp = s + self.total - y
+                total = self.total - s / self.nobs
+                ssqdm = self.ssqdm - (old - prev_mean) * (old - total)
+                self.comp_remove = np.where(kept, comp, self.comp_remove)
+                self.total = np.where(kept, total, np.where(gone, 0.0, self.total))
+                self.ssqdm = np.where(kept, ssqdm, np.where(gone, 0.0, self.ssqdm))
+            else:
+                y = -old - self.comp_remove
+                s = self.total + y
+                self.comp_remove = np.where(gone, s - self.total - y, self.comp_remove)
+                self.total = np.where(gone, s, self.total)
+                self.negative -= gone & np.signbit(old)
+
+        new = np.isfinite(x)
+        self.nobs += new
+        self.same = np.where(new, np.where(x == self.last, self.same + 1, 1), self.same)
+        self.last = np.where(new, x, self.last)
+        if self.stat == 2:
+            prev_mean = self.total - self.comp_add
+            y = x - self.comp_add
+            s = y - self.total
+            comp = s + self.total - y
+            total = self.total + s / self.nobs
+            self.ssqdm = np.where(new, self.ssqdm + (x - prev_mean) * (x - total), self.ssqdm)
+            self.comp_add = np.where(new, comp, self.comp_add)
+            self.total = np.where(new, total, self.total)
+        else:
+            y = x - self.comp_add
+            s = self.total + y
+            self.comp_add = np.where(new, s - self.total - y, self.comp_add)
+            self.total = np.where(new, s, self.total)
+            self.negative += new & np.signbit(x)
+
+    def value(self) -> np.ndarray:
+        nobs = self.nobs
+        if self.stat == 0:
+            result = np.where(self.same >= nobs, self.last * nobs, self.total)
+            ready = nobs >= self.window
+        elif self.stat == 1:
+            result = self.total / nobs
+            # A mean of values of one sign keeps that sign
+            result = np.where((self.negative == 0) & (result < 0), 0.0, result)
+            result = np.where((self.negative == nobs) & (result > 0), 0.0, result)
+            result = np.where(self.same >= nobs, self.last, result)
+            ready = (nobs >= self.window) & (nobs > 0)
+        else:
+            result = np.where(self.same >= nobs, 0.0, self.ssqdm / (nobs - 1))
+            result = np.where(result < 0, 0.0, np.sqrt(result))
+            ready = (nobs >= self.window) & (nobs > 1)
+        return np.where(ready, result, np.nan)
+
+
+class _DecayLinear(_TimeSeries):
+    """
+    decay_linear. Up to op._SCAN_WINDOW the window is summed directly; longer
+    windows keep the batch operator's recurrence
+    WMA_t = WMA_{t-1} + window * x_t - S_{t-1}, replayed over the history.
+    """
+
+    def seed(self, inputs):
+        if self.window <= op._SCAN_WINDOW:
+            return
+        filled = np.where(np.isfinite(inputs[0]), inputs[0], 0.0)
+        self.acc = np.zeros(filled.shape[1])
+        self.total = np.zeros(filled.shape[1])
+        for t in range(len(filled)):
+            self.acc += self.window * filled[t] - self.total
+            self.total += filled[t]
+            if t >= self.window:
+                self.total -= filled[t - self.window]
+
+    def advance(self, rows, olds):
+        if self.window <= op._SCAN_WINDOW:
+            return self.exact()
+        (x,), (old,) = rows, olds
+        self.acc += self.window * np.where(np.isfinite(x), x, 0.0) - self.total
+        self.total += np.where(np.isfinite(x), x, 0.0)
+        if self.dates >= self.window:
+            self.total -= np.where(np.isfinite(old), old, 0.0)
+        result = self.acc / (self.window * (self.window + 1) / 2.0)
+        result[np.isfinite(self.rings[0].values).sum(axis=0) < self.window] = np.nan
+        return result
+
+
+class _Pair(_TimeSeries):
+    """
+    ts_correlation and ts_covariance. Up to op._SCAN_WINDOW the window is
+    scanned directly; longer windows keep the running sums of the batch
+    operator (op._pair_step), replayed over the history.
+    """
+
+    def __init__(self, name: str, window: int, inputs: list):
+        self.correlation = name == 'ts_correlation'
+        super().__init__(name, window, inputs)
+
+    def seed(self, inputs):
+        if self.window <= op._SCAN_WINDOW:
+            return
+        x, y = inputs
+        self.pairs = op._pair_start(x.shape[1])
+        missing = np.full(x.shape[1], np.nan)
+        for t in range(len(x)):
+            old = (x[t - self.window], y[t - self.window]) if t >= self.window else (missing, missing)
+            first = max(t - self.window + 1, 0)
+            op._pair_step(self.pairs, old, (x[t], y[t]),
+                          lambda cols: (x[first:t + 1, cols], y[first:t + 1, cols]), self.window)
+
+    def advance(self, rows, olds):
+        if self.window <= op._SCAN_WINDOW:
+            return self.exact()
+        x, y = self.rings
+        moments = op._pair_step(self.pairs, tuple(olds), tuple(rows),
+                                lambda cols: (x.ordered(cols), y.ordered(cols)), self.window)
+        return op._pair_output(*moments, correlation=self.correlation)
+
+
+class _Extreme(_TimeSeries):
+    """
+    ts_min, ts_max, ts_argmax and ts_argmin from the current extreme and its
+    age. An asset's ring is rescanned only when its extreme drops out of the
+    window; the most recent day wins ties, as in the batch operator.
+    """
+
+    def __init__(self, name: str, window: int, inputs: list):
+        self.largest = name in ('ts_max', 'ts_argmax')
+        self.position = name in ('ts_argmax', 'ts_argmin')
+        self.fill = -np.inf if self.largest else np.inf
+        self.at_least = np.greater_equal if self.largest else np.less_equal
+        super().__init__(name, window, inputs)
+
+    def seed(self, inputs):
+        self.count = (~np.isnan(self.rings[0].values)).sum(axis=0)
+        self.extreme, self.age = self._scan(slice(None))
+
+    def _scan(self, cols) -> tuple:
+        window = self.rings[0].ordered(cols)
+        window = np.where(np.isnan(window), self.fill, window)
+        extreme = window.max(axis=0) if self.largest else window.min(axis=0)
+        # Age of the latest slot holding the extreme
+        age = np.argmax(window[::-1] == extreme, axis=0)
+        return extreme, age
+
+    def advance(self, rows, olds):
+        (x,), (old,) = rows, olds
+        self.count += (~np.isnan(x)).astype(np.int64) - ~np.isnan(old)
+        x = np.where(np.isnan(x), self.fill, x)
+        newer = self.at_least(x, self.extreme)
+        self.extreme = np.where(newer, x, self.extreme)
+        self.age = np.where(newer, 0, self.age + 1)
+        expired = self.age >= self.window
+        if expired.any():
+            self.extreme[expired], self.age[expired] = self._scan(expired)
+        result = (self.window - 1 - self.age).astype(np.float64) if self.position else self.extreme.copy()
+        result[self.count < self.window] = np.nan
+        return result
+
+
+class _Product(_TimeSeries):
+    """
+    ts_product. Longer windows than op._SCAN_WINDOW are multiplied in blocks
+    aligned to the date's position in the history, so the window is padded
+    to the same block boundary before calling the batch operator.
+    """
+
+    def exact(self, cols=slice(None)):
+        window = self.rings[0].ordered(cols)
+        if self.window > op._SCAN_WINDOW:
+            offset = (self.dates + 1) % self.window
+            window = np.concatenate([np.full((offset, window.shape[1]), np.nan), window])
+        return self.func(window, self.window)[-1]
+
+
+_STATES = {
+    'ts_delay': _Delay,
+    'ts_delta': _Delay,
+    'ts_sum': _Rolling,
+    'ts_mean': _Rolling,
+    'ts_stddev': _Rolling,
+    'ts_correlation': _Pair,
+    'ts_covariance': _Pair,
+    'decay_linear': _DecayLinear,
+    'ts_min': _Extreme,
+    'ts_max': _Extreme,
+    'ts_argmax': _Extreme,
+    'ts_argmin': _Extreme,
+    'ts_rank': _TimeSeries,
+    'ts_product': _Product,
+}
+
+# --- Stream ---
+
+class FormulaStream:
+    """
+    Keeps a compiled FormulaSet up to date as new dates arrive.
+
+    Results of `update` match a full recompute over the extended history bit
+    for bit, NaN and infinite inputs included, and so do results after a
+    restart from a checkpoint.
+
+    With `checkpoint` set to a directory, a snapshot of the state is written
+    there after `start` and after every `update` (see `save` and `load`).
+    """
+
+    def __init__(self, formulas: FormulaSet, checkpoint: str = None):
+        self.formulas = formulas
+        self.checkpoint = checkpoint
+        self.states = {}
+        self.assets = None
+        self.last_date = None
+        self.passthrough = set()    # adv nodes read from a panel field
+
+    @property
+    def fields(self) -> list:
+        """Input fields needed by `start` and by every `update`."""
+        return self.formulas.fields + sorted(self.passthrough)
+
+    def _state_name(self, node) -> str:
+        # adv{d} is the d-day mean of its one argument, dollar or share volume
+        return node.name if node.kind == 'op' else 'ts_mean'
+
+    def _is_stateful(self, node) -> bool:
+        if node.kind == 'adv':
+            return node.name not in self.passthrough
+        return node.kind == 'op' and node.name in _STATES
+
+    def start(self, panel: Panel) -> dict:
+        """
+        Evaluate the formulas on the full history and seed the per-node state.
+
+        Args:
+            panel (Panel): History holding every field in `self.fields`; an
+                           adv{d} field is used as is when present, and must
+                           then be supplied to every update.
+
+        Returns:
+            dict: {name: (n_dates, n_assets) float64 matrix}, as FormulaSet.evaluate.
+        """
+        self.passthrough = {n.name for n in self.formulas.nodes if n.kind == 'adv' and n.name in panel}
+        self.assets = panel.assets
+        self.last_date = panel.dates[-1] if len(panel.dates) else None
+        self.states = {}
+
+        def seed(node, values):
+            args = [values[arg.index] for arg in node.args]
+            args = [np.full(panel.shape, a) if np.ndim(a) == 0 else a for a in args]
+            self.states[node.index] = _STATES[self._state_name(node)](self._state_name(node), node.params[0], args)
+
+        results = self._evaluate(panel, seed)
+        if self.checkpoint:
+            self.save(self.checkpoint)
+        return results
+
+    def update(self, day: pd.DataFrame) -> dict:
+        """
+        Append one date and compute the formulas for it.
+
+        Args:
+            day (pd.DataFrame): Long-format rows of a single date later than
+                                every date seen so far. Assets missing from
+                                it are NaN; assets not in the history are an
+                                error.
+
+        Returns:
+            dict: {name: float64 array over `self.assets`}.
+        """
+        if self.assets is None:
+            raise ValueError("Call start() with the history before update().")
+        dates = pd.to_datetime(day['date']).unique()
+        if len(dates) != 1:
+            raise ValueError(f"update() takes the rows of one date, got {len(dates)} dates.")
+        date = dates[0]
+        if self.last_date is not None and date <= self.last_date:
+            raise ValueError(f"Date {date} is not later than the last date {self.last_date}.")
+
+        positions = self.assets.get_indexer(day['asset_id'])
+        if (positions < 0).any():
+            unknown = day['asset_id'][positions < 0].unique()
+            raise ValueError(f"Assets not in the history: {list(unknown)}.")
+        fields = {}
+        for col in self.fields:
+            if col not in day.columns:
+                raise ValueError(f"Required column '{col}' not found in DataFrame.")
+            row = np.full((1, len(self.assets)), np.nan)
+            row[0, positions] = day[col].to_numpy(dtype=np.float64)
+            fields[col] = row
+        panel = Panel(pd.Index([date]), self.assets, fields)
+
+        def step(node, values):
+            args = [values[arg.index] for arg in node.args]
+            rows = [np.full(len(self.assets), a) if np.ndim(a) == 0 else a[0] for a in args]
+            return self.states[node.index].update(rows)[None, :]
+
+        results = self._evaluate(panel, None, step)
+        self.last_date = date
+        if self.checkpoint:
+            self.save(self.checkpoint)
+        return {name: values[0] for name, values in results.items()}
+
+    def save(self, directory: str):
+        """
+        Write a snapshot of the state to `directory`: every array in one flat
+        binary file, indexed by state.json. The index is replaced last and
+        atomically, so a crash mid-save leaves the previous snapshot usable.
+        """
+        if self.assets is None:
+            raise ValueError("Call start() with the history before save().")
+        os.makedirs(directory, exist_ok=True)
+        nodes = {node.index: node for node in self.formulas.nodes}
+
+        entries, blocks, size = [], [], 0
+        for index, state in self.states.items():
+            arrays, scalars = state.snapshot()
+            layout = []
+            for key, value in arrays.items():
+                value = np.ascontiguousarray(value)
+                layout.append([key, value.dtype.str, list(value.shape), size])
+                blocks.append((size, value))
+                # 64-byte alignment keeps every array viewable in place
+                size += -(-value.nbytes // 64) * 64
+            entries.append({'node': index, 'expr': repr(nodes[index]), 'arrays': layout, **scalars})
+
+        # A fresh name each time: the previous file may still be mapped by this process
+        name = f"arrays-{pd.Timestamp(self.last_date):%Y%m%d}-{os.urandom(4).hex()}.npy"
+        blob = np.lib.format.open_memmap(os.path.join(directory, name), mode='w+', dtype=np.uint8, shape=(size,))
+        for offset, value in blocks:
+            blob[offset:offset + value.nbytes] = value.reshape(-1).view(np.uint8)
+        blob.flush()
+        del blob
+
+        index = {
+            'sources': {name: formula.source for name, formula in self.formulas.formulas.items()},
+            'adv': self.formulas.adv,
+            'assets': self.assets.tolist(),
+            'last_date': pd.Timestamp(self.last_date).isoformat(),
+            'passthrough': sorted(self.passthrough),
+            'arrays': name,
+            'states': entries,
+        }
+        tmp = os.path.join(directory, 'state.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(directory, 'state.json'))
+        for old in os.listdir(directory):
+            if old.startswith('arrays-') and old != name:
+                os.remove(os.path.join(directory, old))
+
+    @classmethod
+    def load(cls, directory: str) -> 'FormulaStream':
+        """
+        Resume from the snapshot in `directory`, ready for the next update.
+
+        The arrays are memory-mapped copy-on-write rather than read, so start-up
+        cost does not grow with the window lengths; later snapshots go to the
+        same directory.
+
+        Raises:
+            ValueError: If the snapshot does not match the formulas as the
+                        current compiler builds them.
+        """
+        with open(os.path.join(directory, 'state.json'), encoding='utf-8') as f:
+            index = json.load(f)
+        stream = cls(compile_formulas(index['sources'], index['adv']), checkpoint=directory)
+        stream.assets = pd.Index(index['assets'])
+        stream.last_date = pd.Timestamp(index['last_date'])
+        stream.passthrough = set(index['passthrough'])
+
+        blob = np.load(os.path.join(directory, index['arrays']), mmap_mode='c')
+        nodes = {node.index: node for node in stream.formulas.nodes}
+        empty = np.empty((0, len(stream.assets)))
+        for entry in index['states']:
+            node = nodes.get(entry['node'])
+            if node is None or repr(node) != entry['expr']:
+                raise ValueError(f"Snapshot node {entry['expr']} does not match the compiled formulas.")
+            name = stream._state_name(node)
+            state = _STATES[name](name, node.params[0], [empty] * len(node.args))
+            arrays = {}
+            for key, dtype, shape, offset in entry['arrays']:
+                dtype = np.dtype(dtype)
+                nbytes = dtype.itemsize * int(np.prod(shape))
+                arrays[key] = np.asarray(blob[offset:offset + nbytes]).view(dtype).reshape(shape)
+            state.restore(arrays, entry)
+            stream.states[node.index] = state
+        return stream
+
+    def _evaluate(self, panel: Panel, seed=None, step=None) -> dict:
+        """Walk the DAG like _execute, seeding or stepping the stateful nodes."""
+        pending = {}
+        for node in self.formulas.nodes:
+            for arg in node.args:
+                pending[arg.index] = pending.get(arg.index, 0) + 1
+        roots = {f.root.index for f in self.formulas.formulas.values()}
+
+        values = {}
+        with np.errstate(all='ignore'):
+            for node in self.formulas.nodes:
+                if step is not None and self._is_stateful(node):
+                    values[node.index] = step(node, values)
+                else:
+                    if seed is not None and self._is_stateful(node):
+                        seed(node, values)
+                    values[node.index] = _run(node, values, panel)
+                for arg in node.args:
+                    pending[arg.index] -= 1
+                    if pending[arg.index] == 0 and arg.index not in roots:
+                        del values[arg.index]
+
+        results = {}
+        for name, formula in self.formulas.formulas.items():
+            result = values[formula.root.index]
+            if np.ndim(result) == 0:
+                result = np.full(panel.shape, float(result))
+            results[name] = np.array(result, dtype=np.float64)
+        return results
@@ -0,0 +1,579 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import _kernels
+except ImportError:  # Extension not built (cythonize -i engine/_kernels.pyx): NumPy / pandas code below
+    _kernels = None
+
+# All operators take and return float64 matrices shaped (n_dates, n_assets):
+# time-series operators run down axis 0 independently for every asset,
+# cross-sectional operators run across axis 1 independently for every date.
+# Names and defaults follow doc/functions.md; min_periods defaults to the
+# full window, matching the rolling(window=d, min_periods=d) calls the
+# calculators used before. float32 matrices (the formula engine's float32
+# mode) are accepted too; running sums are accumulated in float64 either way.
+#
+# When the engine._kernels extension is built, the rolling operators run its
+# compiled loops instead, which read float32 panels without a copy and
+# return float32 for them. They release the GIL, so one call is split by
+# asset columns across KERNEL_THREADS threads; a call made from another
+# thread, such as the formula engine's thread pool, stays on its caller's
+# thread. The kernels follow the same arithmetic, in the same order, as the
+# NumPy / pandas code, so both give bit-identical float64 results.
+
+KERNEL_THREADS = os.cpu_count() or 1
+# Below this many cells per thread a call is not worth splitting
+_CELLS_PER_THREAD = 1 << 16
+# Windows up to this length are recomputed from scratch on every date; longer
+# ones are updated as dates enter and leave them. Same as SCAN_WINDOW in
+# _kernels.pyx.
+_SCAN_WINDOW = 32
+
+# --- Internal Helpers ---
+
+def _rolling(x: np.ndarray, window: int, min_periods: int, stat: str, **kwargs) -> np.ndarray:
+    """
+    Apply a pandas rolling statistic (sum, mean, std, rank) per asset. The
+    columns of a DataFrame are rolled independently, so every asset gets the
+    same result as its own Series.rolling call, without the per-group Python
+    overhead.
+    """
+    if min_periods is None:
+        min_periods = window
+    roller = pd.DataFrame(x).rolling(window=window, min_periods=min_periods)
+    return np.ascontiguousarray(getattr(roller, stat)(**kwargs).to_numpy(dtype=np.float64))
+
+def _kernel(name: str, arrays: tuple, *params) -> np.ndarray:
+    """
+    Run the compiled kernel `name` on `arrays` (one or two panels of the same
+    shape), splitting the asset columns across threads. Returns None when the
+    extension is not built.
+    """
+    if _kernels is None:
+        return None
+    dtype = np.float32 if all(a.dtype == np.float32 for a in arrays) else np.float64
+    arrays = [np.ascontiguousarray(a, dtype=dtype) for a in arrays]
+    out = np.empty(arrays[0].shape, dtype=dtype)
+    kernel = getattr(_kernels, name)
+    n_assets = out.shape[1]
+    threads = max(min(KERNEL_THREADS, n_assets, out.size // _CELLS_PER_THREAD), 1)
+    if threads == 1 or threading.current_thread() is not threading.main_thread():
+        kernel(*arrays, out, *params, 0, n_assets)
+        return out
+    bounds = np.linspace(0, n_assets, threads + 1).astype(int)
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(lambda i: kernel(*arrays, out, *params, bounds[i], bounds[i + 1]), range(threads)))
+    return out
+
+def _windows(x: np.ndarray, window: int) -> np.ndarray:
+    """
+    Trailing windows as a (n_dates, n_assets, window) view, oldest value first.
+    The first window-1 dates are padded with NaN.
+    """
+    padded = np.concatenate([np.full((window - 1, x.shape[1]), np.nan), x], axis=0)
+    return np.lib.stride_tricks.sliding_window_view(padded, window, axis=0)
+
+def _window_sum(x: np.ndarray, window: int) -> np.ndarray:
+    """Trailing window sums via cumulative sums; x must not contain NaN."""
+    csum = np.cumsum(x, axis=0, dtype=np.float64 if x.dtype.kind == 'f' else None)
+    result = csum.copy()
+    result[window:] -= csum[:-window]
+    return result
+
+def _valid_count(x: np.ndarray, window: int) -> np.ndarray:
+    """Number of non-NaN values in each trailing window."""
+    return _window_sum((~np.isnan(x)).astype(np.int64), window)
+
+def _mask_rows(result: np.ndarray, x: np.ndarray, min_count: int, fill: float) -> np.ndarray:
+    """Overwrite whole rows of `result` whose source row has fewer than min_count valid values."""
+    thin = (~np.isnan(x)).sum(axis=1) < min_count
+    if thin.any():
+        result[thin] = fill
+    return result
+
+# --- Element-wise Operators ---
+
+def signed_power(x: np.ndarray, a: float) -> np.ndarray:
+    """sign(x) * abs(x)^a."""
+    return np.sign(x) * (np.abs(x) ** a)
+
+# --- Time-series Operators ---
+
+def ts_delay(x: np.ndarray, period: int) -> np.ndarray:
+    """Value of x `period` days ago."""
+    result = np.full_like(x, np.nan, dtype=np.float64)
+    if period == 0:
+        result[:] = x
+    elif period < len(x):
+        result[period:] = x[:-period]
+    return result
+
+def ts_delta(x: np.ndarray, period: int) -> np.ndarray:
+    """Today's value of x minus the value `period` days ago."""
+    return x - ts_delay(x, period)
+
+def ts_sum(x: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    """Time-series sum over the past `window` days."""
+    result = _kernel('rolling_moments', (x,), window, window if min_periods is None else min_periods, 0)
+    return _rolling(x, window, min_periods, 'sum') if result is None else result
+
+def ts_mean(x: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    """Time-series mean over the past `window` days."""
+    result = _kernel('rolling_moments', (x,), window, window if min_periods is None else min_periods, 1)
+    return _rolling(x, window, min_periods, 'mean') if result is None else result
+
+def ts_stddev(x: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    """Moving sample standard deviation (ddof=1) over the past `window` days."""
+    result = _kernel('rolling_moments', (x,), window, window if min_periods is None else min_periods, 2)
+    return _rolling(x, window, min_periods, 'std') if result is None else result
+
+def ts_product(x: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    """
+    Time-series product over the past `window` days.
+
+    Up to _SCAN_WINDOW each window is multiplied out oldest first. Longer
+    windows are cut into blocks of `window` dates: every trailing window is
+    the product of a backward run to the end of the previous block and a
+    forward run from the start of the current one.
+    """
+    if min_periods is None:
+        min_periods = window
+    result = _kernel('rolling_product', (x,), window, min_periods)
+    if result is not None:
+        return result
+    n_dates, n_assets = x.shape
+    filled = np.where(np.isnan(x), 1.0, x).astype(np.float64, copy=False)
+    if window <= _SCAN_WINDOW:
+        windows = _windows(filled, window)
+        result = np.ones(x.shape)
+        for k in range(window):
+            result *= np.where(np.isnan(windows[..., k]), 1.0, windows[..., k])
+    else:
+        n_blocks = -(-n_dates // window)
+        padded = np.ones((n_blocks * window, n_assets))
+        padded[:n_dates] = filled
+        blocks = padded.reshape(n_blocks, window, n_assets)
+        result = np.multiply.accumulate(blocks, axis=1).reshape(-1, n_assets)[:n_dates]
+        backward = np.multiply.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1, n_assets)
+        t = np.arange(window, n_dates)
+        t = t[t % window != window - 1]
+        result[t] = backward[t - window + 1] * result[t]
+    result[_valid_count(x, window) < min_periods] = np.nan
+    return result
+
+def _ts_extreme(x: np.ndarray, window: int, min_periods: int, largest: bool,
+                with_position: bool = True) -> tuple:
+    """
+    Trailing-window max (largest=True) or min together with its position, in
+    the ts_argmax convention, from one O(n) pass. The position is None when
+    with_position is False.
+
+    This is the van Herk / Gil-Werman form of the monotonic-deque algorithm,
+    which vectorises across assets: time is cut into blocks of `window` rows,
+    running extremes are accumulated forwards and backwards inside each
+    block, and every trailing window is the union of one backward run and one
+    forward run. The most recent day wins ties.
+    """
+    if min_periods is None:
+        min_periods = window
+    fill = -np.inf if largest else np.inf
+    accumulate = np.maximum.accumulate if largest else np.minimum.accumulate
+    better = np.greater if largest else np.less
+    n_dates, n_assets = x.shape
+
+    n_blocks = -(-(n_dates + window - 1) // window)
+    padded = np.full((n_blocks * window, n_assets), fill)
+    padded[window - 1:window - 1 + n_dates] = np.where(np.isnan(x), fill, x)
+    blocks = padded.reshape(n_blocks, window, n_assets)
+
+    # Forward runs: extreme of block start .. t. Backward runs: extreme of t .. block end
+    fwd_val = accumulate(blocks, axis=1)
+    bwd_val = accumulate(blocks[:, ::-1], axis=1)[:, ::-1]
+    fwd_today = fwd_val.reshape(-1, n_assets)[window - 1:window - 1 + n_dates]
+    bwd_oldest = bwd_val.reshape(-1, n_assets)[:n_dates]
+
+    # Forward run ends today, so it wins ties with the older backward run
+    use_bwd = better(bwd_oldest, fwd_today)
+    value = np.where(use_bwd, bwd_oldest, fwd_today)
+    thin = _valid_count(x, window) < max(min_periods, 1)
+    value[thin] = np.nan
+    if not with_position:
+        return value, None
+
+    slot = np.arange(window)[None, :, None]
+    block_start = (np.arange(n_blocks) * window)[:, None, None]
+    # Latest slot holding the forward extreme
+    fwd_pos = np.maximum.accumulate(np.where(blocks == fwd_val, slot, -1), axis=1)
+    # Backward position only moves on a strict improvement, so the later slot
+    # is kept on ties
+    rev, rev_val = blocks[:, ::-1], bwd_val[:, ::-1]
+    improved = np.empty(rev.shape, dtype=bool)
+    improved[:, 0] = True
+    improved[:, 1:] = better(rev[:, 1:], rev_val[:, :-1])
+    bwd_pos = (window - 1 - np.maximum.accumulate(np.where(improved, slot, -1), axis=1))[:, ::-1]
+
+    fwd_pos = (fwd_pos + block_start).reshape(-1, n_assets)[window - 1:window - 1 + n_dates]
+    bwd_pos = (bwd_pos + block_start).reshape(-1, n_assets)[:n_dates]
+    # Padded row t is the oldest slot of the window ending on date t
+    position = (np.where(use_bwd, bwd_pos, fwd_pos) - np.arange(n_dates)[:, None]).astype(np.float64)
+    position[thin] = np.nan
+    return value, position
+
+def ts_min(x: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    """Time-series min over the past `window` days."""
+    result = _kernel('rolling_extreme', (x,), window, window if min_periods is None else min_periods, False, False)
+    return _ts_extreme(x, window, min_periods, largest=False, with_position=False)[0] if result is None else result
+
+def ts_max(x: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    """Time-series max over the past `window` days."""
+    result = _kernel('rolling_extreme', (x,), window, window if min_periods is None else min_periods, True, False)
+    return _ts_extreme(x, window, min_periods, largest=True, with_position=False)[0] if result is None else result
+
+def ts_argmax(x: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    """
+    Which day ts_max(x, window) occurred on, counted from the oldest slot of the
+    window: window - 1 is today, 0 is window - 1 days ago. The most recent day
+    wins ties.
+    """
+    result = _kernel('rolling_extreme', (x,), window, window if min_periods is None else min_periods, True, True)
+    return _ts_extreme(x, window, min_periods, largest=True)[1] if result is None else result
+
+def ts_argmin(x: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    """Which day ts_min(x, window) occurred on, same convention as ts_argmax."""
+    result = _kernel('rolling_extreme', (x,), window, window if min_periods is None else min_periods, False, True)
+    return _ts_extreme(x, window, min_periods, largest=False)[1] if result is None else result
+
+def ts_rank(x: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    """
+    Time-series percentile rank of today's value within the past `window` days,
+    equivalent to x.rolling(window).apply(lambda w: w.rank(pct=True).iloc[-1]).
+    Ties take the average rank; NaNs in the window are ignored and today's rank
+    is divided by the number of valid values in the window.
+
+    Up to _SCAN_WINDOW the smaller and equal values of each window are counted
+    directly, in the compiled kernel when it is built. Longer windows use
+    pandas' rolling rank, which keeps each window in a skiplist and updates it
+    incrementally: O(n log window) per asset instead of O(n * window).
+    """
+    if min_periods is None:
+        min_periods = window
+    if window > _SCAN_WINDOW:
+        return _rolling(x, window, min_periods, 'rank', method='average', pct=True)
+    result = _kernel('rolling_rank', (x,), window, min_periods)
+    if result is not None:
+        return result
+    # pandas treats infinities as missing
+    x = np.where(np.isinf(x), np.nan, x)
+    windows = _windows(x, window)
+    today = x[:, :, None]
+    less = (windows < today).sum(axis=-1)
+    equal = (windows == today).sum(axis=-1)
+    count = _valid_count(x, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = (less + (equal + 1) / 2.0) / count
+    result[np.isnan(x) | (count < min_periods) | (count == 0)] = np.nan
+    return result
+
+def decay_linear(x: np.ndarray, window: int, skipna: bool = False) -> np.ndarray:
+    """
+    Weighted moving average over the past `window` days with linearly decaying
+    weights window, window - 1, ..., 1 (today first), rescaled to sum to 1.
+
+    With skipna=False a window containing any NaN yields NaN. With skipna=True
+    NaN values contribute zero weight and only an all-NaN window yields NaN;
+    the divisor stays the full weight sum. The first window-1 dates are NaN
+    either way. Infinite values are treated as NaN.
+
+    Up to _SCAN_WINDOW each window is summed directly. Longer windows follow
+    the O(n) running-sum recurrence
+        WMA_t = WMA_{t-1} + window * x_t - S_{t-1},
+    where S is the plain window sum.
+    """
+    result = _kernel('decay_linear', (x,), window, skipna)
+    if result is not None:
+        return result
+    n_dates = x.shape[0]
+    valid = np.isfinite(x)
+    filled = np.where(valid, x, 0.0).astype(np.float64, copy=False)
+
+    result = np.zeros(x.shape)
+    if window <= _SCAN_WINDOW:
+        # Oldest day first, weight 1
+        for k in range(window):
+            result[window - 1:] += (k + 1) * filled[k:n_dates - window + 1 + k]
+    else:
+        acc = np.zeros(x.shape[1])
+        total = np.zeros(x.shape[1])
+        for t in range(n_dates):
+            acc += window * filled[t] - total
+            total += filled[t]
+            if t >= window:
+                total -= filled[t - window]
+            result[t] = acc
+    result /= window * (window + 1) / 2.0
+
+    count = _valid_count(np.where(valid, x, np.nan), window)
+    result[:window - 1] = np.nan
+    if skipna:
+        result[count == 0] = np.nan
+    else:
+        result[count < window] = np.nan
+    return result
+
+def _pair_scan(x: np.ndarray, y: np.ndarray, valid: np.ndarray, window: int, min_periods: int):
+    """
+    Two-pass windowed co-moments for windows up to _SCAN_WINDOW: the means of
+    each window first, then the sums of products of deviations from them.
+    """
+    xw, yw = _windows(x, window), _windows(y, window)
+    vw = ~np.isnan(xw) & ~np.isnan(yw)
+    count = _valid_count(np.where(valid, x, np.nan), window)
+    sx = np.zeros(x.shape)
+    sy = np.zeros(x.shape)
+    for k in range(window):
+        sx += np.where(vw[..., k], xw[..., k], 0.0)
+        sy += np.where(vw[..., k], yw[..., k], 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sx /= count
+        sy /= count
+    # A constant window has no spread at all, whatever the mean rounds to
+    flat_x = np.fmin.reduce(np.where(vw, xw, np.nan), axis=-1) == np.fmax.reduce(np.where(vw, xw, np.nan), axis=-1)
+    flat_y = np.fmin.reduce(np.where(vw, yw, np.nan), axis=-1) == np.fmax.reduce(np.where(vw, yw, np.nan), axis=-1)
+    cxy = np.zeros(x.shape)
+    cxx = np.zeros(x.shape)
+    cyy = np.zeros(x.shape)
+    for k in range(window):
+        du = np.where(flat_x, 0.0, xw[..., k] - sx)
+        dv = np.where(flat_y, 0.0, yw[..., k] - sy)
+        cxy += np.where(vw[..., k], du * dv, 0.0)
+        cxx += np.where(vw[..., k], du * du, 0.0)
+        cyy += np.where(vw[..., k], dv * dv, 0.0)
+    n = count.astype(np.float64)
+    n[count < min_periods] = np.nan
+    return n, cxy, cxx, cyy
+
+def _pair_window(x: np.ndarray, y: np.ndarray, valid: np.ndarray):
+    """
+    The _pair_scan arithmetic over one window of dates (rows) for a subset of
+    assets: returns the means and co-moments of each column.
+    """
+    sx = np.zeros(x.shape[1])
+    sy = np.zeros(x.shape[1])
+    for k in range(len(x)):
+        sx += np.where(valid[k], x[k], 0.0)
+        sy += np.where(valid[k], y[k], 0.0)
+    sx /= valid.sum(axis=0)
+    sy /= valid.sum(axis=0)
+    flat_x = np.fmin.reduce(np.where(valid, x, np.nan), axis=0) == np.fmax.reduce(np.where(valid, x, np.nan), axis=0)
+    flat_y = np.fmin.reduce(np.where(valid, y, np.nan), axis=0) == np.fmax.reduce(np.where(valid, y, np.nan), axis=0)
+    cxy = np.zeros(x.shape[1])
+    cxx = np.zeros(x.shape[1])
+    cyy = np.zeros(x.shape[1])
+    for k in range(len(x)):
+        du = np.where(flat_x, 0.0, x[k] - sx)
+        dv = np.where(flat_y, 0.0, y[k] - sy)
+        cxy += np.where(valid[k], du * dv, 0.0)
+        cxx += np.where(valid[k], du * du, 0.0)
+        cyy += np.where(valid[k], dv * dv, 0.0)
+    return sx, sy, cxy, cxx, cyy
+
+def _pair_start(n_assets: int) -> list:
+    """Running state of _pair_step for n_assets: pair count, shift_x, shift_y and the five sums."""
+    return [np.zeros(n_assets, dtype=np.int64), np.zeros(n_assets), np.zeros(n_assets), np.zeros((5, n_assets))]
+
+def _pair_step(state: list, old: tuple, new: tuple, window, min_periods: int) -> tuple:
+    """
+    Move a window longer than _SCAN_WINDOW on by one date, updating `state`
+    in place: the pair `old` (x, y rows) leaves it and `new` enters.
+    `window(cols)` returns the window's x and y after the move, oldest date
+    first, for the asset columns `cols`. Returns (n, cxy, cxx, cyy) for the
+    new date as _pair_moments.
+
+    The state holds running sums of x - shift_x, y - shift_y and their
+    squares and product; the shift is the first pair of each asset. Where
+    the co-moments cancel more than six significant digits of those sums
+    (long windows over trending series, near-constant windows), the window
+    is recomputed exactly as _pair_scan would and the sums restart from it,
+    shifted by its means.
+    """
+    count, shift_x, shift_y, sums = state
+
+    def add(x, y, sign, cols=slice(None)):
+        valid = ~np.isnan(x) & ~np.isnan(y)
+        du = x - shift_x[cols]
+        dv = y - shift_y[cols]
+        for i, term in enumerate((du, dv, du * du, dv * dv, du * dv)):
+            sums[i, cols] = np.where(valid, sums[i, cols] + sign * term, sums[i, cols])
+        return valid
+
+    count -= add(*old, -1.0)
+    x, y = new
+    restart = ~np.isnan(x) & ~np.isnan(y) & (count == 0)
+    shift_x[restart] = x[restart]
+    shift_y[restart] = y[restart]
+    sums[:, restart] = 0.0
+    count += add(x, y, 1.0)
+
+    ready = count >= min_periods
+    size = count.astype(np.float64)
+    sx, sy, sxx, syy, sxy = sums
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cxx = sxx - sx * sx / size
+        cyy = syy - sy * sy / size
+        cxy = sxy - sx * sy / size
+    rescan = np.flatnonzero(ready & ((cxx <= 1e-6 * sxx) | (cyy <= 1e-6 * syy)))
+    if len(rescan):
+        xs, ys = window(rescan)
+        valid = ~np.isnan(xs) & ~np.isnan(ys)
+        shift_x[rescan], shift_y[rescan], cxy[rescan], cxx[rescan], cyy[rescan] = _pair_window(xs, ys, valid)
+        sums[:, rescan] = 0.0
+        for k in range(len(xs)):
+            add(xs[k], ys[k], 1.0, rescan)
+    n = np.where(ready, size, np.nan)
+    return n, cxy, cxx, cyy
+
+def _pair_sliding(x: np.ndarray, y: np.ndarray, window: int, min_periods: int):
+    """Windowed co-moments for windows longer than _SCAN_WINDOW, one _pair_step per date."""
+    n_dates, n_assets = x.shape
+    state = _pair_start(n_assets)
+    missing = np.full(n_assets, np.nan)
+    moments = [np.empty(x.shape) for _ in range(4)]
+    for t in range(n_dates):
+        old = (x[t - window], y[t - window]) if t >= window else (missing, missing)
+        first = max(t - window + 1, 0)
+        step = _pair_step(state, old, (x[t], y[t]), lambda cols: (x[first:t + 1, cols], y[first:t + 1, cols]),
+                          min_periods)
+        for moment, row in zip(moments, step):
+            moment[t] = row
+    return tuple(moments)
+
+def _pair_output(n: np.ndarray, cxy: np.ndarray, cxx: np.ndarray, cyy: np.ndarray, correlation: bool) -> np.ndarray:
+    """Correlation or sample covariance from windowed co-moments, NaN where n is."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if not correlation:
+            return cxy / (n - 1)
+        variance = cxx * cyy
+        result = cxy / np.sqrt(variance)
+    result[np.isnan(n) | ~(variance > 0)] = np.nan
+    return result
+
+def _pair_moments(x: np.ndarray, y: np.ndarray, window: int, min_periods: int):
+    """
+    Windowed pair count and centred co-moments of x and y, using only dates
+    where both are valid (pairwise complete, like pandas rolling corr/cov).
+
+    Returns (n, cxy, cxx, cyy) where cxy = sum((x - mean_x)(y - mean_y)) over
+    the window and cxx/cyy are the matching sums of squares. Cells with fewer
+    than max(min_periods, 2) pairs have n = NaN.
+    """
+    if min_periods is None:
+        min_periods = window
+    min_periods = max(min_periods, 2)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if window <= _SCAN_WINDOW:
+        return _pair_scan(x, y, ~np.isnan(x) & ~np.isnan(y), window, min_periods)
+    return _pair_sliding(x, y, window, min_periods)
+
+def ts_correlation(x: np.ndarray, y: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    """
+    Time-series Pearson correlation of x and y over the past `window` days.
+    Windows where either series is constant give NaN.
+    """
+    result = _kernel('rolling_pair', (x, y), window, window if min_periods is None else min_periods, True)
+    if result is not None:
+        return result
+    return _pair_output(*_pair_moments(x, y, window, min_periods), correlation=True)
+
+def ts_covariance(x: np.ndarray, y: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    """Time-series sample covariance (ddof=1) of x and y over the past `window` days."""
+    result = _kernel('rolling_pair', (x, y), window, window if min_periods is None else min_periods, False)
+    if result is not None:
+        return result
+    return _pair_output(*_pair_moments(x, y, window, min_periods), correlation=False)
+
+# --- Cross-sectional Operators ---
+
+def cs_rank(x: np.ndarray, min_count: int = 1, fill: float = np.nan) -> np.ndarray:
+    """
+    Cross-sectional percentile rank, identical to series.rank(method='average', pct=True)
+    applied to each date. Dates with fewer than `min_count` valid values are set
+    entirely to `fill`.
+    """
+    n_assets = x.shape[1]
+    dtype = np.float32 if x.dtype == np.float32 else np.float64
+    missing = np.isnan(x)
+    count = n_assets - missing.sum(axis=1, keepdims=True)
+
+    # NaN is sorted as +inf: numpy's vectorised argsort only applies to
+    # NaN-free input, and is several times faster there
+    keys = np.where(missing, np.inf, x)
+    order = np.argsort(keys, axis=1)
+    srt = np.take_along_axis(keys, order, axis=1)
+    # NaN placeholders at the tail of each row are not ties
+    tie = (srt[:, 1:] == srt[:, :-1]) & (np.arange(1, n_assets) < count)
+    if tie.any():
+        # Runs of equal values, laid end to end over the whole matrix; every
+        # row starts a new run. A run covering 0-based slots [s, s + n) gets
+        # the average rank s + (n + 1) / 2.
+        starts = np.ones(srt.shape, dtype=bool)
+        np.logical_not(tie, out=starts[:, 1:])
+        run_start = np.flatnonzero(starts)
+        run_length = np.diff(np.append(run_start, srt.size))
+        slot = run_start % n_assets
+        ranks = np.repeat((slot + (run_length + 1) / 2).astype(dtype), run_length).reshape(srt.shape)
+    else:
+        ranks = np.tile(np.arange(1, n_assets + 1, dtype=dtype), (x.shape[0], 1))
+
+    result = np.empty_like(ranks)
+    np.put_along_axis(result, order, ranks, axis=1)
+    # Genuine +inf values share a run with the NaN placeholders; give them
+    # the average of the top n_inf valid ranks instead
+    posinf = np.isposinf(x)
+    if posinf.any():
+        n_inf = posinf.sum(axis=1, keepdims=True)
+        result = np.where(posinf, count - (n_inf - 1) / 2, result)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result /= count
+    result[missing] = np.nan
+    return _mask_rows(result, x, min_count, fill)
+
+def cs_scale(x: np.ndarray, min_count: int = 2, fill: float = 0.0) -> np.ndarray:
+    """
+    Cross-sectional z-score, (x - mean) / std with ddof=1, per date.
+    Dates with fewer than `min_count` valid values or zero dispersion are set
+    entirely to `fill`.
+    """
+    count = (~np.isnan(x)).sum(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(x, axis=1, keepdims=True) / count
+        std = np.sqrt(np.nansum((x - mean) ** 2, axis=1, keepdims=True) / (count - 1))
+        result = (x - mean) / std
+    result[(std == 0).ravel()] = fill
+    return _mask_rows(result, x, min_count, fill)
+
+def scale(x: np.ndarray, a: float = 1.0) -> np.ndarray:
+    """Rescale each date so that sum(abs(x)) = a, as defined in doc/functions.md."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return x * a / np.nansum(np.abs(x), axis=1, keepdims=True, dtype=np.float64)
+
+def indneutralize(x: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    """
+    Demean x within each group on every date. `groups` is an integer matrix of
+    the same shape holding each asset's group code.
+    """
+    n_dates = x.shape[0]
+    codes, group_idx = np.unique(groups, return_inverse=True)
+    keys = (np.arange(n_dates)[:, None] * len(codes) + group_idx.reshape(x.shape)).ravel()
+    valid = ~np.isnan(x).ravel()
+    size = n_dates * len(codes)
+    sums = np.bincount(keys[valid], weights=x.ravel()[valid], minlength=size)
+    counts = np.bincount(keys[valid], minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    return x - means[keys].reshape(x.shape)
@@ -0,0 +1,331 @@
+"""
+Vectorized number formatting and chunked CSV output for calculator results.
+
+    write_csv(df, 'alpha31_results.csv', float_format='%.2f')
+    write_csv(save_df, 'alpha16_results.csv', formats={'alpha16': '.2g', 'rank_high': '.4f'})
+    df['alpha22'] = format_significant(df['alpha22'], 2, zero_rep='0.00')
+
+Files are byte-identical to formatting every value with Python's
+`format(value, spec)` (or `float_format % value`) and writing with
+DataFrame.to_csv(index=False), but whole columns are formatted with integer
+arithmetic on NumPy arrays and rows are assembled as bytes. The few values
+whose scaled magnitude lies within rounding noise of a half-way point, or
+beyond exact integer range, are formatted one by one with Python so that
+the output never differs.
+"""
+
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+# Largest integer float64 represents exactly
+_EXACT = 2.0 ** 53
+# Relative error of one float64 multiplication or division
+_EPS = 2.0 ** -52
+# Powers of ten that float64 represents exactly
+_MAX_POWER = 22
+
+_SPEC = re.compile(r'^%?\.(\d+)([fg])$')
+# Characters that make to_csv quote a field
+_QUOTE_BYTES = np.frombuffer(b',"\n\r', dtype=np.uint8)
+
+# --- Formatting ---
+
+def _scale(a: np.ndarray, k) -> np.ndarray:
+    """a * 10**k with one rounding; k may be an array."""
+    k = np.asarray(k)
+    up = np.float64(10.0) ** np.clip(k, 0, _MAX_POWER)
+    down = np.float64(10.0) ** np.clip(-k, 0, _MAX_POWER)
+    # Products that overflow are infinite and go to the fallback
+    with np.errstate(over='ignore'):
+        return np.where(k >= 0, a * up, a / down)
+
+def _near_half(y: np.ndarray) -> np.ndarray:
+    """Values whose rounding to an integer the product's rounding error could flip."""
+    with np.errstate(invalid='ignore'):
+        return ~(np.abs(y - np.floor(y) - 0.5) > y * 2 * _EPS)
+
+def _digits(n: np.ndarray, width: int = None) -> np.ndarray:
+    """
+    ASCII digits of non-negative integers as a (len(n), width) uint8 matrix,
+    right-aligned. Without a width the numbers are zero-padded to the
+    widest; with one, leading positions beyond each number's digits are NUL.
+    """
+    pad = width is None
+    if pad:
+        width = len(str(int(n.max()))) if len(n) else 1
+    out = np.empty((len(n), width), dtype=np.uint8)
+    rest = n.copy()
+    for col in range(width - 1, -1, -1):
+        rest, digit = np.divmod(rest, 10)
+        out[:, col] = digit + ord('0')
+        if not pad and col < width - 1:
+            # Keep a digit while something is left to print
+            out[:, col] = np.where((rest > 0) | (digit > 0), out[:, col], 0)
+    return out
+
+def _left_align(matrix: np.ndarray) -> np.ndarray:
+    """Squeeze the NUL bytes out of each row of a field matrix into a bytes-string array."""
+    keep = matrix != 0
+    position = np.cumsum(keep, axis=1) - 1
+    width = max(int(position[:, -1].max(initial=-1)) + 1, 1) if matrix.shape[1] else 1
+    out = np.zeros((len(matrix), width), dtype=np.uint8)
+    out[np.nonzero(keep)[0], position[keep]] = matrix[keep]
+    return out.view(f'S{width}').ravel()
+
+def _strings(matrix: np.ndarray) -> np.ndarray:
+    """A field matrix as a str array."""
+    cells = _left_align(matrix)
+    # Formatted numbers are ASCII, which converts without a UTF-8 decoder
+    return cells.astype(str) if matrix.max(initial=0) < 0x80 else np.strings.decode(cells, 'utf-8')
+
+def _text_matrix(texts) -> np.ndarray:
+    """Field matrix of a sequence of str, one row each."""
+    cells = np.array([text.encode('utf-8') for text in texts] or [b''], dtype='S')[:len(texts)]
+    return cells.view(np.uint8).reshape(len(cells), cells.dtype.itemsize)
+
+def _patch(matrix: np.ndarray, rows: np.ndarray, texts: list) -> np.ndarray:
+    """Overwrite `rows` of a field matrix with `texts`, widening it if needed."""
+    if len(rows) == 0:
+        return matrix
+    patch = _text_matrix(texts)
+    if patch.shape[1] > matrix.shape[1]:
+        matrix = np.hstack([matrix, np.zeros((len(matrix), patch.shape[1] - matrix.shape[1]), dtype=np.uint8)])
+    matrix[rows] = 0
+    matrix[rows, :patch.shape[1]] = patch
+    return matrix
+
+def _fill(matrix: np.ndarray, values: np.ndarray, fallback: np.ndarray, spec: str, na_rep: str) -> np.ndarray:
+    rows = np.flatnonzero(fallback & ~np.isnan(values))
+    matrix = _patch(matrix, rows, [format(values[i], spec) for i in rows])
+    rows = np.flatnonzero(np.isnan(values))
+    return _patch(matrix, rows, [na_rep] * len(rows))
+
+def _sign(values: np.ndarray) -> np.ndarray:
+    return np.where(np.signbit(values), ord('-'), 0).astype(np.uint8)[:, None]
+
+def _as_float(values) -> np.ndarray:
+    return np.asarray(values, dtype=np.float64).ravel()
+
+def _fixed_matrix(values: np.ndarray, decimals: int, na_rep: str) -> np.ndarray:
+    a = np.abs(values)
+    y = _scale(a, min(decimals, _MAX_POWER))
+    fallback = ~np.isfinite(y) | (y >= _EXACT) | _near_half(y) | (decimals > 15)
+    n = np.rint(np.where(fallback, 0.0, y)).astype(np.int64)
+
+    whole, frac = np.divmod(n, 10 ** decimals)
+    parts = [_sign(values), _digits(whole, len(str(int(whole.max()))) if len(whole) else 1)]
+    if decimals:
+        parts += [np.full((len(n), 1), ord('.'), dtype=np.uint8), _digits(frac + 10 ** decimals)[:, 1:]]
+    return _fill(np.hstack(parts), values, fallback, f'.{decimals}f', na_rep)
+
+def _significant_matrix(values: np.ndarray, digits: int, na_rep: str) -> np.ndarray:
+    a = np.abs(values)
+    usable = np.isfinite(a) & (a > 0)
+    safe = np.where(usable, a, 1.0)
+
+    # Scale to a digits-long integer; the log10 exponent is only a guess and
+    # values it misplaces are left to the fallback
+    exponent = np.floor(np.log10(safe)).astype(np.int64)
+    shift = digits - 1 - exponent
+    y = _scale(safe, shift)
+    low, high = 10.0 ** (digits - 1), 10.0 ** digits
+    fallback = ~usable | (np.abs(shift) > _MAX_POWER) | (y < low * (1 + 2 * _EPS)) | (y >= high * (1 - 2 * _EPS)) \
+        | _near_half(y) | (digits > 15)
+    mantissa = np.rint(np.where(fallback, low, y)).astype(np.int64)
+    carry = mantissa == 10 ** digits
+    mantissa = np.where(carry, mantissa // 10, mantissa)
+    exponent = exponent + carry
+
+    # '%g' prints the digits as fixed-point for exponents in [-4, digits) and
+    # in scientific notation otherwise; within one exponent every value has
+    # the same layout, and there are only a handful of distinct exponents
+    sign = _sign(values)
+    groups = []
+    for e in np.unique(exponent[~fallback]):
+        rows = np.flatnonzero((exponent == e) & ~fallback)
+        if -4 <= e < digits:
+            places, suffix = digits - 1 - e, b''
+        else:
+            places, suffix = digits - 1, f"e{'-' if e < 0 else '+'}{abs(e):02d}".encode()
+        whole, frac = np.divmod(mantissa[rows], 10 ** places)
+        parts = [sign[rows], _digits(whole, len(str(int(whole.max()))))]
+        if places:
+            frac = _digits(frac + 10 ** places)[:, 1:]
+            # Trailing zeros are dropped, and the point with them if nothing is left
+            frac[np.flip(np.cumprod(np.flip(frac == ord('0'), axis=1), axis=1), axis=1).astype(bool)] = 0
+            parts += [np.where(frac[:, 0] != 0, ord('.'), 0).astype(np.uint8)[:, None], frac]
+        if suffix:
+            parts.append(np.frombuffer(suffix, dtype=np.uint8)[None, :].repeat(len(rows), axis=0))
+        groups.append((rows, np.hstack(parts)))
+
+    matrix = np.zeros((len(values), max([group.shape[1] for _, group in groups], default=1)), dtype=np.uint8)
+    for rows, group in groups:
+        matrix[rows, :group.shape[1]] = group
+    return _fill(matrix, values, fallback, f'.{digits}g', na_rep)
+
+def _format_matrix(values, spec: str, na_rep: str = '') -> np.ndarray:
+    """Field matrix of numbers formatted with a '.Nf' / '.Ng' spec."""
+    match = _SPEC.match(spec)
+    if not match:
+        raise ValueError(f"Unsupported number format '{spec}'; expected '.Nf' or '.Ng'.")
+    places = int(match.group(1))
+    values = _as_float(values)
+    if match.group(2) == 'f':
+        return _fixed_matrix(values, places, na_rep)
+    return _significant_matrix(values, max(places, 1), na_rep)
+
+def format_values(values, spec: str, na_rep: str = '') -> np.ndarray:
+    """
+    Format numbers as `format(x, spec)` for a spec of the form '.Nf' or
+    '.Ng', or the printf forms '%.Nf' / '%.Ng' that DataFrame.to_csv takes
+    as float_format.
+
+    Args:
+        values: Array-like of numbers.
+        spec (str): Number format.
+        na_rep (str): String for NaN.
+
+    Returns:
+        np.ndarray: String array, same length as `values`.
+
+    Raises:
+        ValueError: If the spec is not one of those forms.
+    """
+    return _strings(_format_matrix(values, spec, na_rep))
+
+def format_fixed(values, decimals: int, na_rep: str = '') -> np.ndarray:
+    """Format numbers with `decimals` digits after the point, as f'{x:.2f}' does for 2."""
+    return format_values(values, f'.{decimals}f', na_rep)
+
+def format_significant(values, digits: int, na_rep: str = '', zero_rep: str = None) -> np.ndarray:
+    """
+    Format numbers to `digits` significant figures, as f'{x:.2g}' does for 2.
+
+    Args:
+        zero_rep (str): String for zeros. Defaults to the '%g' form, '0'.
+    """
+    values = _as_float(values)
+    out = format_values(values, f'.{digits}g', na_rep)
+    if zero_rep is not None:
+        out = np.where(values == 0, zero_rep, out)
+    return out
+
+# --- Writing ---
+
+def _column_matrix(series: pd.Series, spec: str, na_rep: str) -> np.ndarray:
+    """
+    The CSV fields of one column as a field matrix: one row per value, NUL
+    bytes ignored. None if only to_csv knows how to write the column.
+    """
+    if spec is not None and pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return _format_matrix(series.to_numpy(dtype=np.float64, na_value=np.nan), spec, na_rep)
+    dtype = series.dtype
+    if isinstance(dtype, np.dtype) and (dtype.kind == 'i' or dtype.kind == 'u' and dtype.itemsize < 8):
+        values = series.to_numpy(dtype=np.int64)
+        if len(values) and values.min() == np.iinfo(np.int64).min:
+            return None
+        magnitude = np.abs(values)
+        width = len(str(int(magnitude.max()))) if len(values) else 1
+        return np.hstack([np.where(values < 0, ord('-'), 0).astype(np.uint8)[:, None], _digits(magnitude, width)])
+    if dtype == np.float64:
+        # to_csv writes floats without a format the way NumPy converts them to str
+        values = series.to_numpy()
+        matrix = _text_matrix([]) if not len(values) else values.astype('S').view(np.uint8).reshape(len(values), -1)
+        return _patch(matrix.copy(), np.flatnonzero(np.isnan(values)), [na_rep] * int(np.isnan(values).sum()))
+
+    # Dates and ids repeat across rows: format each distinct value once;
+    # categorical columns already hold the codes and the dictionary
+    if isinstance(dtype, pd.CategoricalDtype):
+        codes, uniques = series.cat.codes.to_numpy(), dtype.categories
+    else:
+        codes, uniques = pd.factorize(series)
+    if pd.api.types.is_datetime64_dtype(uniques):
+        values = uniques.to_numpy(dtype='datetime64[ns]')
+        days = values.astype('datetime64[D]')
+        # to_csv writes bare dates when every timestamp is at midnight
+        if not np.array_equal(days, values):
+            return None
+        texts = list(np.datetime_as_string(days))
+    elif pd.api.types.infer_dtype(uniques, skipna=False) in ('string', 'empty'):
+        texts = list(uniques)
+    else:
+        return None
+    dictionary = _text_matrix(texts + [na_rep])
+    if np.isin(dictionary, _QUOTE_BYTES).any():
+        return None
+    # Missing values are coded -1, the na_rep row
+    return dictionary[codes]
+
+def _has_times(series: pd.Series) -> bool:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.cat.categories.to_series()
+    if not pd.api.types.is_datetime64_dtype(series):
+        return False
+    values = series.dropna().to_numpy(dtype='datetime64[ns]')
+    return not np.array_equal(values.astype('datetime64[D]'), values)
+
+def _join_rows(columns: list, terminator: bytes) -> bytes:
+    """Join field matrices into CSV lines, dropping the NUL padding."""
+    rows = len(columns[0])
+    comma = np.full((rows, 1), ord(','), dtype=np.uint8)
+    parts = []
+    for matrix in columns:
+        parts += [matrix, comma]
+    parts[-1] = np.frombuffer(terminator, dtype=np.uint8)[None, :].repeat(rows, axis=0)
+    lines = np.hstack(parts)
+    return lines[lines != 0].tobytes()
+
+def write_csv(df: pd.DataFrame, path: str, formats: dict = None, float_format: str = None,
+              na_rep: str = '', chunksize: int = 200_000):
+    """
+    Write a DataFrame as DataFrame.to_csv(path, index=False, ...) would, with
+    number columns formatted vectorized and rows streamed in chunks.
+
+    Args:
+        df (pd.DataFrame): Frame to write.
+        path (str): Output CSV.
+        formats (dict): {column: spec} for columns with their own format,
+                        see format_values. Also applies to integer columns.
+        float_format (str): printf format for the remaining float columns,
+                            e.g. '%.2f'; None writes them as to_csv does.
+        na_rep (str): String for missing values.
+        chunksize (int): Rows formatted and written at a time.
+
+    Raises:
+        ValueError: If a format is not one format_values accepts.
+    """
+    formats = formats or {}
+    specs = []
+    for col in df.columns:
+        if col in formats:
+            specs.append(formats[col])
+        elif float_format is not None and pd.api.types.is_float_dtype(df[col]):
+            specs.append(float_format)
+        else:
+            specs.append(None)
+    # Validate the specs before the file is touched
+    for spec in set(specs) - {None}:
+        _format_matrix([], spec)
+
+    # to_csv picks bare dates or full timestamps per block of rows it writes;
+    # with a time of day anywhere, it has to see the rows all at once
+    if any(_has_times(df.iloc[:, i]) for i in range(df.shape[1])):
+        chunksize = max(len(df), 1)
+
+    terminator = os.linesep.encode()
+    with open(path, 'wb') as f:
+        f.write(df.iloc[:0].to_csv(index=False).encode('utf-8'))
+        for begin in range(0, len(df), chunksize):
+            chunk = df.iloc[begin:begin + chunksize]
+            columns = [_column_matrix(chunk.iloc[:, i], spec, na_rep) for i, spec in enumerate(specs)]
+            # csv quotes a lone empty field, so single-column rows go through to_csv
+            if all(matrix is not None for matrix in columns) and len(columns) > 1:
+                f.write(_join_rows(columns, terminator))
+                continue
+            out = pd.DataFrame({i: chunk.iloc[:, i] if matrix is None else _strings(matrix)
+                                for i, matrix in enumerate(columns)}, index=chunk.index)
+            out.columns = chunk.columns
+            f.write(out.to_csv(index=False, header=False, na_rep=na_rep, float_format=float_format).encode('utf-8'))
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+
+def factorize_keys(keys: pd.Series) -> tuple:
+    """
+    Dense integer codes of a key column and its sorted dictionary of values,
+    as pd.factorize(keys, sort=True). Categorical keys (see
+    engine.store.load_frame) already carry codes, so nothing is hashed again:
+    only the dictionary is sorted and pruned to the values present.
+    """
+    if not isinstance(keys.dtype, pd.CategoricalDtype):
+        return pd.factorize(keys, sort=True)
+    codes = keys.cat.codes.to_numpy()
+    categories = keys.cat.categories
+    used = np.zeros(len(categories), dtype=bool)
+    used[codes[codes >= 0]] = True
+    keep = np.flatnonzero(used)
+    keep = keep[categories[keep].argsort()]
+    remap = np.full(len(categories), -1, dtype=np.intp)
+    remap[keep] = np.arange(len(keep))
+    return np.where(codes >= 0, remap[codes], -1), categories[keep]
+
+
+class Panel:
+    """
+    Dense (date x asset) view of the long-format data used by the calculators.
+
+    The long layout of mock_data.csv (one row per date/asset pair) is pivoted
+    once into 2-D float64 matrices, one per field, with dates along axis 0 and
+    assets along axis 1. Time-series operators then work down the columns and
+    cross-sectional operators across the rows without any groupby.
+
+    The row -> cell mapping of the source DataFrame is kept so matrices can be
+    scattered back into the original row order with `to_long`.
+    """
+
+    def __init__(self, dates: pd.Index, assets: pd.Index, fields: dict,
+                 date_idx: np.ndarray = None, asset_idx: np.ndarray = None):
+        self.dates = dates
+        self.assets = assets
+        self.fields = fields
+        self.date_idx = date_idx
+        self.asset_idx = asset_idx
+
+    @classmethod
+    def from_long(cls, df: pd.DataFrame, fields: list = None) -> 'Panel':
+        """
+        Build a panel from a long DataFrame with 'date' and 'asset_id' columns.
+
+        Args:
+            df (pd.DataFrame): Long-format data, in any row order. The key
+                               columns may be categorical, whose codes are
+                               then used as they are.
+            fields (list): Numeric columns to pivot. Defaults to every column
+                           other than 'date' and 'asset_id'.
+
+        Returns:
+            Panel: Panel whose matrices are shaped (n_dates, n_assets). Cells
+                   with no source row are NaN.
+        """
+        for col in ['date', 'asset_id']:
+            if col not in df.columns:
+                raise ValueError(f"Required column '{col}' not found in DataFrame.")
+        if fields is None:
+            fields = [col for col in df.columns if col not in ('date', 'asset_id')]
+
+        date_idx, dates = factorize_keys(df['date'])
+        asset_idx, assets = factorize_keys(df['asset_id'])
+        shape = (len(dates), len(assets))
+
+        flat = date_idx.astype(np.int64) * shape[1] + asset_idx
+        if len(np.unique(flat)) != len(flat):
+            raise ValueError("Duplicate (date, asset_id) rows found in DataFrame.")
+
+        panel_fields = {}
+        for col in fields:
+            if col not in df.columns:
+                raise ValueError(f"Required column '{col}' not found in DataFrame.")
+            matrix = np.full(shape, np.nan)
+            matrix[date_idx, asset_idx] = df[col].to_numpy(dtype=np.float64)
+            panel_fields[col] = matrix
+
+        return cls(pd.Index(dates), pd.Index(assets), panel_fields, date_idx, asset_idx)
+
+    @property
+    def shape(self) -> tuple:
+        return (len(self.dates), len(self.assets))
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.fields
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name not in self.fields:
+            raise KeyError(f"Field '{name}' not found in panel.")
+        return self.fields[name]
+
+    def __setitem__(self, name: str, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape != self.shape:
+            raise ValueError(f"Field '{name}' has shape {values.shape}, expected {self.shape}.")
+        self.fields[name] = values
+
+    def to_long(self, values: np.ndarray) -> np.ndarray:
+        """Gather a (date x asset) matrix back into the row order of the source DataFrame."""
+        if self.date_idx is None:
+            raise ValueError("Panel was not built from a long DataFrame.")
+        return np.asarray(values)[self.date_idx, self.asset_idx]
+
+    def to_frame(self, values: np.ndarray) -> pd.DataFrame:
+        """Wrap a (date x asset) matrix as a wide DataFrame indexed by date."""
+        return pd.DataFrame(values, index=self.dates, columns=self.assets)
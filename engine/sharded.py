@@ -0,0 +1,367 @@
+"""
+Out-of-core evaluation of compiled formulas over a store, for universes
+whose panel and intermediates do not fit in memory at once.
+
+    python -m engine.sharded data/mock_data 31 41 --memory 2G --factors factors/
+
+    formulas = compile_formulas({name: FORMULAS[name] for name in ('alpha31', 'alpha41')})
+    results = evaluate_sharded(formulas, 'data/mock_data', memory_budget=2 << 30)
+    results['alpha31'][-1]      # read-only memory map, dates x assets
+
+The DAG is cut into stages wherever a time-series operator follows a
+cross-sectional one or the other way round. Time-series stages run shard by
+shard over blocks of asset columns with the whole history, cross-sectional
+stages over blocks of dates with every asset; element-wise nodes join the
+stage of their inputs, or of their first reader when they only combine
+store fields. A node read by a later stage is written to a
+(dates x assets) .npy scratch file, which is where the data is transposed
+from asset shards to date shards, and deleted once its last reader has run.
+
+Shard widths are chosen per stage so that the inputs, the live
+intermediates and the working space of the largest operator of one shard
+stay under `memory_budget`. Store fields and scratch files are mapped one
+band of dates at a time and dropped, so file pages do not pile up in the
+process either; what the budget cannot cover is memory the C allocator keeps
+after numpy frees it (on glibc, MALLOC_MMAP_THRESHOLD_=131072 returns it).
+
+Time-series operators compute every asset's column from that asset's
+columns alone, and cross-sectional ones every date's row from that row
+alone, so results equal FormulaSet.evaluate bit for bit however the shards
+fall.
+"""
+
+import argparse
+import math
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from .alpha101 import FORMULAS
+from .factors import FactorStore
+from .formula import _CROSS_SECTIONAL, _ELEMENTWISE, _OPERATORS, FormulaSet, _run, compile_formulas
+from .panel import Panel
+from .store import _read_meta, date_window, resolve_fields, store_path
+
+# Peak memory of one operator call, output included, in matrices the size of
+# its input (measured on the implementations in engine.operators)
+_WORKSPACE = {
+    'ts_delay': 1, 'ts_delta': 2, 'ts_sum': 4, 'ts_mean': 4, 'ts_stddev': 6, 'ts_rank': 6,
+    'ts_min': 9, 'ts_max': 9, 'ts_argmax': 10, 'ts_argmin': 10, 'decay_linear': 9,
+    'ts_correlation': 12, 'ts_covariance': 12,
+    'cs_rank': 9, 'scale': 4, 'indneutralize': 6,
+}
+_ELEMENTWISE_WORKSPACE = 2
+_BYTES = np.dtype(np.float64).itemsize
+
+# --- Planning ---
+
+class _Stage:
+    """Nodes evaluated together on one kind of shard: 'assets' (column blocks) or 'dates' (row blocks)."""
+
+    def __init__(self, axis: str):
+        self.axis = axis
+        self.nodes = []
+        self.inputs = []    # non-constant nodes read from the store or from scratch
+        self.width = None   # assets or dates per shard
+
+def _is_source(node, stored) -> bool:
+    """Constants and nodes read straight from the store rather than computed."""
+    return node.kind in ('const', 'field') or (node.kind == 'adv' and node.name in stored)
+
+def _workspace(node, n_dates: int) -> float:
+    if node.kind == 'adv':
+        size = _WORKSPACE['ts_mean']
+    elif node.name == 'ts_product':
+        # nanprod copies every window
+        size = node.params[0] + 4
+    else:
+        size = _WORKSPACE.get(node.name, _ELEMENTWISE_WORKSPACE)
+    if node.kind == 'adv' or 'd' in _OPERATORS[node.name][1]:
+        # Rolling windows pad every asset with window - 1 dates
+        size += 4 * node.params[0] / max(n_dates, 1)
+    return size
+
+def _peak(stage: _Stage, n_dates: int) -> float:
+    """Most matrices one shard of `stage` holds at a time, operator working space included."""
+    pending = {}
+    for node in stage.nodes:
+        for arg in node.args:
+            pending[arg.index] = pending.get(arg.index, 0) + 1
+    live = peak = len(stage.inputs)
+    for node in stage.nodes:
+        peak = max(peak, live + _workspace(node, n_dates))
+        live += 1 if pending.get(node.index) else 0
+        for arg in node.args:
+            pending[arg.index] -= 1
+            if pending[arg.index] == 0 and arg.kind != 'const':
+                live -= 1
+    return peak
+
+def _plan(formulas: FormulaSet, stored: list, shape: tuple, memory_budget: int) -> list:
+    """
+    Cut the DAG into stages of alternating shard axes and size their shards.
+
+    Raises:
+        ValueError: If one asset column or one date row of a stage does not
+                    fit in `memory_budget`.
+    """
+    # Nodes the roots need, without descending below nodes read from the store
+    needed, stack = {}, [f.root for f in formulas.formulas.values()]
+    while stack:
+        node = stack.pop()
+        if node.index not in needed:
+            needed[node.index] = node
+            if not _is_source(node, stored):
+                stack.extend(node.args)
+
+    # Stage s is time-series for even s and cross-sectional for odd s
+    level = {}
+    for node in sorted(needed.values(), key=lambda n: n.index):
+        if _is_source(node, stored):
+            continue
+        s = max((level.get(arg.index, 0) for arg in node.args), default=0)
+        if node.kind == 'adv' or node.name not in _ELEMENTWISE:
+            if (node.kind == 'op' and node.name in _CROSS_SECTIONAL) != (s % 2 == 1):
+                s += 1
+        level[node.index] = s
+    # Element-wise nodes of store inputs alone, e.g. close - open, can run as
+    # late as their earliest reader instead of being spilled for it
+    local, readers = set(), {}
+    for index in sorted(level):
+        node = needed[index]
+        if node.kind == 'op' and node.name in _ELEMENTWISE and all(
+                _is_source(arg, stored) or arg.index in local for arg in node.args):
+            local.add(index)
+        for arg in node.args:
+            readers.setdefault(arg.index, []).append(index)
+    roots = {f.root.index for f in formulas.formulas.values()}
+    for index in sorted(local - roots, reverse=True):
+        level[index] = min(level[reader] for reader in readers[index])
+
+    stages = {}
+    for index in sorted(level):
+        s = level[index]
+        if s not in stages:
+            stages[s] = _Stage('dates' if s % 2 else 'assets')
+        stages[s].nodes.append(needed[index])
+    stages = [stages[s] for s in sorted(stages)]
+
+    for stage in stages:
+        inside = {node.index for node in stage.nodes}
+        inputs = {}
+        for node in stage.nodes:
+            for arg in node.args:
+                if arg.index not in inside and arg.kind != 'const':
+                    inputs[arg.index] = arg
+        stage.inputs = [inputs[i] for i in sorted(inputs)]
+        extent, count = (shape[0], shape[1]) if stage.axis == 'assets' else (shape[1], shape[0])
+        need = math.ceil(_peak(stage, shape[0]) * extent * _BYTES)
+        width = (memory_budget - _band(memory_budget)) // need
+        if width < 1:
+            raise ValueError(f"memory_budget of {memory_budget} bytes is below the {need} bytes "
+                             f"one {stage.axis[:-1]} shard of a stage needs.")
+        stage.width = min(width, max(count, 1))
+    return stages
+
+# --- Evaluation ---
+
+# Bytes of a matrix file mapped at a time, at most, and taken out of the
+# budget. Files are row-major, so a block of asset columns is read and written
+# a band of dates at a time; each band is mapped afresh and dropped, and only
+# its pages are ever in the process
+_BAND = 16 << 20
+
+def _band(memory_budget: int) -> int:
+    return min(_BAND, memory_budget // 8)
+
+def _extent(cut: tuple, shape: tuple) -> tuple:
+    return tuple(len(range(*part.indices(size))) for part, size in zip(cut, shape))
+
+def _chunks(cut: tuple, shape: tuple, band: int) -> list:
+    """Date bands covering the rows of `cut`, each at most `band` bytes of file."""
+    first, last, _ = cut[0].indices(shape[0])
+    rows = max(band // (max(shape[1], 1) * _BYTES), 1)
+    return [slice(row, min(row + rows, last)) for row in range(first, last, rows)]
+
+def evaluate_sharded(formulas: FormulaSet, directory: str, memory_budget: int = 1 << 30,
+                     scratch: str = None, start=None, end=None) -> Panel:
+    """
+    Run formulas on a store without holding its panel in memory.
+
+    Args:
+        formulas (FormulaSet): Compiled formulas, as from compile_formulas.
+        directory (str): Store directory written by engine.store.convert_csv.
+        memory_budget (int): Bytes that the shards of one stage may use,
+                             inputs, intermediates and working space included.
+        scratch (str): Directory for intermediates and results. Defaults to
+                       a new temporary directory, which the caller removes
+                       when done with the results.
+        start, end: Dates to evaluate (inclusive), loaded with the formulas'
+                    lookback of earlier history; None for the whole store.
+
+    Returns:
+        Panel: The evaluated dates and every stored asset, with one read-only
+               memory map per formula (`<scratch>/<name>.npy`) as its
+               fields. It has no row mapping, so no to_long: the long form
+               of such a universe is what does not fit in memory.
+
+    Raises:
+        ValueError: If a field is not in the store or the budget cannot hold
+                    one shard.
+    """
+    meta = _read_meta(directory)
+    # adv{d} is read from the store when it carries one, like Formula.evaluate
+    advs = [node.name for node in formulas.nodes if node.kind == 'adv' and node.name in meta['fields']]
+    stored = resolve_fields(formulas.fields + advs, meta['fields'])
+    all_dates = pd.DatetimeIndex(np.load(os.path.join(directory, 'dates.npy')))
+    window = date_window(all_dates, start, end, formulas.lookback if start is not None else 0)
+    dates = all_dates[window]
+    assets = pd.Index(np.load(os.path.join(directory, 'assets.npy')).astype(object))
+    shape = (len(dates), len(assets))
+    band = _band(memory_budget)
+    stages = _plan(formulas, stored, shape, memory_budget)
+    scratch = scratch or tempfile.mkdtemp(prefix='engine-sharded-')
+    os.makedirs(scratch, exist_ok=True)
+
+    # Where each node's values live between stages: a root's result file, or scratch
+    roots = {}
+    for name, formula in formulas.formulas.items():
+        roots.setdefault(formula.root.index, name)
+    readers = {}
+    for position, stage in enumerate(stages):
+        for node in stage.inputs:
+            readers[node.index] = position
+    files = {}
+
+    def write(node, cut, values):
+        if node.index not in files:
+            files[node.index] = os.path.join(scratch, f"{roots.get(node.index, f'_node{node.index}')}.npy")
+            np.lib.format.open_memmap(files[node.index], mode='w+', dtype=np.float64, shape=shape)
+        for rows in _chunks(cut, shape, band):
+            target = np.load(files[node.index], mmap_mode='r+')
+            target[rows, cut[1]] = np.broadcast_to(values, _extent(cut, shape))[rows.start - cut[0].start:rows.stop - cut[0].start]
+
+    def read(node, cut) -> np.ndarray:
+        source = _is_source(node, stored)
+        if source and node.name not in stored:
+            raise ValueError(f"Required column '{node.name}' not found in panel.")
+        result = np.empty(_extent(cut, shape))
+        for rows in _chunks(cut, shape, band):
+            if source:
+                matrix = np.load(os.path.join(directory, f'{node.name}.npy'), mmap_mode='r')[window]
+            else:
+                matrix = np.load(files[node.index], mmap_mode='r')
+            result[rows.start - cut[0].start:rows.stop - cut[0].start] = matrix[rows, cut[1]]
+        return result
+
+    with np.errstate(all='ignore'):
+        for position, stage in enumerate(stages):
+            count = shape[1] if stage.axis == 'assets' else shape[0]
+            pending = {}
+            for node in stage.nodes:
+                for arg in node.args:
+                    pending[arg.index] = pending.get(arg.index, 0) + 1
+            for first in range(0, count, stage.width):
+                block = slice(first, min(first + stage.width, count))
+                cut = (slice(0, shape[0]), block) if stage.axis == 'assets' else (block, slice(None))
+                shard = Panel(dates[cut[0]], assets[cut[1]], {})
+                values = {node.index: read(node, cut) for node in stage.inputs}
+                left = dict(pending)
+                for node in stage.nodes:
+                    for arg in node.args:
+                        if arg.kind == 'const' and arg.index not in values:
+                            values[arg.index] = np.float64(arg.name)
+                    values[node.index] = _run(node, values, shard)
+                    if node.index in roots or readers.get(node.index, -1) > position:
+                        write(node, cut, values[node.index])
+                    if not left.get(node.index):
+                        del values[node.index]
+                    for arg in node.args:
+                        left[arg.index] -= 1
+                        if left[arg.index] == 0:
+                            values.pop(arg.index, None)
+            # Intermediates nothing after this stage reads
+            for index in [i for i in files if i not in roots and readers[i] <= position]:
+                os.remove(files.pop(index))
+
+    # Formulas that are a constant or a stored field have no stage
+    rows = max(memory_budget // (2 * max(shape[1], 1) * _BYTES), 1)
+    for index in roots:
+        if index in files:
+            continue
+        node = next(f.root for f in formulas.formulas.values() if f.root.index == index)
+        for first in range(0, shape[0], rows):
+            cut = (slice(first, min(first + rows, shape[0])), slice(None))
+            write(node, cut, np.float64(node.name) if node.kind == 'const' else read(node, cut))
+
+    results = {name: np.load(files[formula.root.index], mmap_mode='r') for name, formula in formulas.formulas.items()}
+    return Panel(dates, assets, results)
+
+# --- Command Line ---
+
+def _parse_bytes(text: str) -> int:
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*', text.upper())
+    if match is None:
+        raise argparse.ArgumentTypeError(f"Invalid size '{text}', expected e.g. 512M or 4G.")
+    return int(float(match.group(1)) * 1024 ** ' KMGT'.index(match.group(2) or ' '))
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(prog='python -m engine.sharded',
+                                     description='Evaluate formulas out of core on a store, within a memory budget.')
+    parser.add_argument('store', help='Store directory, or the CSV it was converted from (see engine.store).')
+    parser.add_argument('alphas', nargs='*', help='Alpha numbers, e.g. 31 alpha41 (default: every formula the store can serve).')
+    parser.add_argument('--factors', required=True, help='Factor store directory the results are written to.')
+    parser.add_argument('--memory', type=_parse_bytes, default=1 << 30, help='Memory budget, e.g. 512M or 4G (default: 1G).')
+    parser.add_argument('--start', default=None, help='First output date; earlier history is loaded only as far back as the alphas look.')
+    parser.add_argument('--end', default=None, help='Last output date (default: the last date in the store).')
+    parser.add_argument('--scratch', default=None, help='Directory for intermediates (default: a temporary directory).')
+    args = parser.parse_args(argv)
+
+    directory = args.store if os.path.isdir(args.store) else store_path(args.store)
+    if not os.path.exists(os.path.join(directory, 'meta.json')):
+        print(f"Error: No store at {directory}. Please run python -m engine.store first.")
+        exit(1)
+    stored = _read_meta(directory)['fields']
+    if args.alphas:
+        names = [f"alpha{re.sub(r'^alpha', '', item.lower())}" for item in args.alphas]
+        unknown = [name for name in names if name not in FORMULAS]
+        if unknown:
+            parser.error(f"No formula for {', '.join(unknown)} in engine.alpha101.")
+    else:
+        names = [name for name in FORMULAS
+                 if all(field in stored for field in compile_formulas({name: FORMULAS[name]}).fields)]
+    formulas = compile_formulas({name: FORMULAS[name] for name in names})
+
+    start = time.perf_counter()
+    scratch = tempfile.mkdtemp(prefix='engine-sharded-', dir=args.scratch)
+    try:
+        results = evaluate_sharded(formulas, directory, args.memory, scratch, args.start, args.end)
+        stages = _plan(formulas, stored, results.shape, args.memory)
+        compute_seconds = time.perf_counter() - start
+        # Store whole dates, as many at a time as the budget allows
+        first = 0 if args.start is None else results.dates.searchsorted(pd.Timestamp(args.start))
+        rows = max(args.memory // (3 * max(results.shape[1], 1) * _BYTES), 1)
+        factors = FactorStore(args.factors)
+        for name in names:
+            for row in range(first, results.shape[0], rows):
+                block = slice(row, min(row + rows, results.shape[0]))
+                factors.write_block(results.dates[block], {name: results[name][block]}, results.assets)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print(f"{len(names)} formulas on {results.shape[0]} dates x {results.shape[1]} assets, "
+          f"{len(stages)} stages within {args.memory} bytes:")
+    for stage in stages:
+        print(f"  {len(stage.nodes):4d} nodes by {stage.axis}, {stage.width} per shard")
+    print(f"Written to {args.factors} in {time.perf_counter() - start:.2f}s (compute {compute_seconds:.2f}s).")
+
+
+if __name__ == '__main__':
+    main()
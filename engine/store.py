@@ -0,0 +1,246 @@
+"""
+Columnar binary store for the long-format data, instead of parsing the CSV
+on every run.
+
+    python -m engine.store data/mock_data.csv      # one-time conversion to data/mock_data/
+
+    panel = load_panel('data/mock_data')           # memory-mapped, no parsing, no copies
+    panel = load_panel('data/mock_data', formula.fields, start='2025-03-01', lookback=formula.lookback)
+    df = load_frame('data/mock_data.csv')          # uses data/mock_data/ when it is up to date
+    df = load_frame('data/mock_data.csv', codes=True)   # date / asset_id as integer codes + dictionaries
+
+A store is a directory holding one (n_dates x n_assets) float64 .npy file per
+numeric column, NaN where the CSV has no row, together with the date and
+asset dictionaries and the CSV's row order:
+
+    dates.npy     datetime64[ns], sorted
+    assets.npy    asset ids as strings, sorted
+    rows.npy      int64 cell index date * n_assets + asset of every CSV row, in file order
+    <field>.npy   one matrix per column (open, high, low, close, volume, vwap, returns, ...)
+    meta.json     column names in CSV order and their CSV dtypes
+"""
+
+import argparse
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from .panel import Panel
+
+# Inputs that calculators compute themselves when the data does not carry
+# them, and the columns they are computed from; adv{d} is the mean of volume
+# (the formula compiler's fields already list what its adv{d} reads)
+DERIVED_INPUTS = {'returns': ['close']}
+_ADV = re.compile(r'adv\d+$')
+
+# --- Conversion ---
+
+def store_path(csv_path: str) -> str:
+    """Default store directory for a CSV: the same path without the extension."""
+    return os.path.splitext(csv_path)[0]
+
+def convert_csv(csv_path: str, directory: str = None) -> str:
+    """
+    Convert a long-format CSV with 'date' and 'asset_id' columns into a store.
+
+    Args:
+        csv_path (str): Source CSV.
+        directory (str): Store directory. Defaults to store_path(csv_path).
+
+    Returns:
+        str: The store directory.
+
+    Raises:
+        ValueError: If a column other than date and asset_id is not numeric,
+                    or a (date, asset_id) pair appears twice.
+    """
+    directory = directory or store_path(csv_path)
+    df = pd.read_csv(csv_path)
+    df['date'] = pd.to_datetime(df['date'])
+    df['asset_id'] = df['asset_id'].astype(str)
+    fields = [col for col in df.columns if col not in ('date', 'asset_id')]
+    for col in fields:
+        if not pd.api.types.is_numeric_dtype(df[col]):
+            raise ValueError(f"Column '{col}' is not numeric and cannot be stored.")
+
+    panel = Panel.from_long(df, fields)
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, 'dates.npy'), panel.dates.to_numpy(dtype='datetime64[ns]'))
+    np.save(os.path.join(directory, 'assets.npy'), panel.assets.to_numpy(dtype=str))
+    np.save(os.path.join(directory, 'rows.npy'), panel.date_idx.astype(np.int64) * len(panel.assets) + panel.asset_idx)
+    for col in fields:
+        np.save(os.path.join(directory, f'{col}.npy'), panel[col])
+    # meta.json is written last; a store without it is incomplete
+    meta = {'fields': fields, 'dtypes': {col: df[col].dtype.str for col in fields}}
+    with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return directory
+
+# --- Loading ---
+
+def _read_meta(directory: str) -> dict:
+    with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+def resolve_fields(fields: list, available: list) -> list:
+    """
+    Columns to read so that `fields` can be served: stored columns as they
+    are, and inputs that calculators derive when the data lacks them replaced
+    by what they are derived from (adv{d} from volume, returns from close).
+    Returned in the order of `available`; None means all of them.
+
+    Raises:
+        ValueError: If a field is neither stored nor derivable.
+    """
+    if fields is None:
+        return list(available)
+    needed = set()
+    for col in fields:
+        if col in available:
+            needed.add(col)
+        elif _ADV.match(col):
+            needed.add('volume')
+        elif col in DERIVED_INPUTS:
+            needed.update(DERIVED_INPUTS[col])
+        else:
+            raise ValueError(f"Required column '{col}' not found in data.")
+    missing = needed - set(available)
+    if missing:
+        raise ValueError(f"Required columns {sorted(missing)} not found in data.")
+    return [col for col in available if col in needed]
+
+def date_window(dates: pd.DatetimeIndex, start=None, end=None, lookback: int = 0) -> slice:
+    """
+    Positions in sorted `dates` covering [start, end] plus `lookback` earlier
+    dates of warm-up history. start / end of None are open-ended.
+    """
+    first = 0 if start is None else dates.searchsorted(pd.Timestamp(start))
+    last = len(dates) if end is None else dates.searchsorted(pd.Timestamp(end), side='right')
+    return slice(max(first - lookback, 0), last)
+
+def load_panel(directory: str, fields: list = None, start=None, end=None, lookback: int = 0) -> Panel:
+    """
+    Open a store as a Panel without parsing or copying the field matrices.
+
+    Args:
+        directory (str): Store directory written by convert_csv.
+        fields (list): Columns to open, see resolve_fields. Defaults to
+                       every stored column.
+        start, end: First and last dates wanted (inclusive); None for the
+                    whole history.
+        lookback (int): Dates of history to include before `start`, e.g. a
+                        Formula's lookback.
+
+    Returns:
+        Panel: Panel whose matrices are read-only memory maps of the selected
+               dates; only those rows of each file are touched. `to_long`
+               scatters back into the CSV's row order, i.e. the row order of
+               load_frame.
+    """
+    meta = _read_meta(directory)
+    dates = pd.DatetimeIndex(np.load(os.path.join(directory, 'dates.npy')))
+    assets = pd.Index(np.load(os.path.join(directory, 'assets.npy')).astype(object))
+    window = date_window(dates, start, end, lookback)
+    # Dates are the leading axis, so a date range is one contiguous block
+    panel_fields = {col: np.load(os.path.join(directory, f'{col}.npy'), mmap_mode='r')[window]
+                    for col in resolve_fields(fields, meta['fields'])}
+    date_idx, asset_idx = np.divmod(np.load(os.path.join(directory, 'rows.npy'), mmap_mode='r'), len(assets))
+    if window != slice(0, len(dates)):
+        keep = (date_idx >= window.start) & (date_idx < window.stop)
+        date_idx, asset_idx = date_idx[keep] - window.start, asset_idx[keep]
+    return Panel(dates[window], assets, panel_fields, date_idx, asset_idx)
+
+def _coded(df: pd.DataFrame) -> pd.DataFrame:
+    """Replace the key columns by categoricals: codes with a sorted dictionary."""
+    df['date'] = pd.Categorical(df['date'], ordered=True)
+    df['asset_id'] = pd.Categorical(df['asset_id'])
+    return df
+
+def load_frame(path: str, fields: list = None, start=None, end=None, lookback: int = 0,
+               codes: bool = False) -> pd.DataFrame:
+    """
+    Load long-format data from a store, or from a CSV.
+
+    Args:
+        path (str): Store directory, or a CSV path. For a CSV, the store at
+                    store_path(path) is used when it exists and is not older
+                    than the CSV.
+        fields (list): Columns the caller needs besides date and asset_id;
+                       only these, or what they are derived from, are read
+                       (see resolve_fields). Defaults to all.
+        start, end, lookback: Date range and warm-up history, as for
+                              load_panel.
+        codes (bool): Return 'date' and 'asset_id' as categoricals, i.e.
+                      dense integer codes plus a dictionary of the distinct
+                      dates and ids, instead of one datetime / str per row.
+                      Panel.from_long and write_csv use the codes directly,
+                      so the ids are never hashed again and only written out
+                      as strings.
+
+    Returns:
+        pd.DataFrame: Rows in CSV order with 'date' as datetime64, 'asset_id'
+                      as str (or both categorical) and every column in its
+                      CSV dtype.
+    """
+    directory = path
+    if not os.path.isdir(path):
+        directory = store_path(path)
+        stale = not os.path.exists(os.path.join(directory, 'meta.json')) or (
+            os.path.exists(path) and os.path.getmtime(path) > os.path.getmtime(os.path.join(directory, 'meta.json')))
+        if stale:
+            usecols = None
+            if fields is not None:
+                header = pd.read_csv(path, nrows=0).columns
+                usecols = ['date', 'asset_id'] + resolve_fields(fields, [c for c in header if c not in ('date', 'asset_id')])
+            df = pd.read_csv(path, usecols=usecols)
+            df['date'] = pd.to_datetime(df['date'])
+            df['asset_id'] = df['asset_id'].astype(str)
+            if start is not None or end is not None:
+                dates = pd.DatetimeIndex(np.sort(df['date'].unique()))
+                window = date_window(dates, start, end, lookback)
+                df = df[df['date'].isin(dates[window])].reset_index(drop=True)
+            return _coded(df) if codes else df
+
+    meta = _read_meta(directory)
+    panel = load_panel(directory, fields, start, end, lookback)
+    if codes:
+        # The store's dictionaries are already sorted: no id is looked at
+        columns = {
+            'date': pd.Categorical.from_codes(panel.date_idx, categories=panel.dates, ordered=True),
+            'asset_id': pd.Categorical.from_codes(panel.asset_idx, categories=panel.assets),
+        }
+    else:
+        columns = {
+            'date': panel.dates[panel.date_idx],
+            'asset_id': panel.assets[panel.asset_idx],
+        }
+    for col, matrix in panel.fields.items():
+        values = panel.to_long(matrix)
+        dtype = np.dtype(meta['dtypes'][col])
+        if dtype.kind in 'iub' and np.isnan(values).any():
+            raise ValueError(f"Column '{col}' has missing cells and cannot be restored as {dtype}.")
+        columns[col] = values.astype(dtype, copy=False)
+    return pd.DataFrame(columns)
+
+# --- Command Line ---
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(prog='python -m engine.store', description='Convert a long-format CSV into a columnar binary store.')
+    parser.add_argument('csv', help='Source CSV, e.g. data/mock_data.csv.')
+    parser.add_argument('--output', default=None, help='Store directory (default: the CSV path without .csv).')
+    args = parser.parse_args(argv)
+
+    try:
+        directory = convert_csv(args.csv, args.output)
+    except FileNotFoundError:
+        print(f"Error: Data file not found at {args.csv}. Please run data/generate_mock_data.py first.")
+        exit(1)
+    meta = _read_meta(directory)
+    print(f"Stored {len(meta['fields'])} columns ({', '.join(meta['fields'])}) in {directory}.")
+
+
+if __name__ == '__main__':
+    main()
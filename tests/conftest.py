@@ -0,0 +1,73 @@
+"""
+Shared fixtures: synthetic market data in the layout of data/mock_data.csv,
+and a switch between the compiled kernels and the NumPy / pandas code.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from engine import operators as op  # noqa: E402
+
+
+def make_data(n_assets: int = 12, n_dates: int = 300, missing: float = 0.0, seed: int = 0,
+              ticks: bool = True) -> pd.DataFrame:
+    """
+    Long-format data like data/generate_mock_data.py writes: random-walk
+    prices rounded to cents (so that windows and cross-sections hold ties),
+    log-normal volume, and a `missing` fraction of NaN in every value column.
+    Without `ticks` prices and returns are left unrounded, and ties are
+    left to chance.
+    """
+    def tick(values: np.ndarray, decimals: int) -> np.ndarray:
+        return values.round(decimals) if ticks else values
+
+    rng = np.random.default_rng(seed)
+    close = np.maximum(100 + np.cumsum(tick(rng.normal(0, 1.5, (n_dates, n_assets)), 1), axis=0), 1.0)
+    previous = np.vstack([close[:1], close[:-1]])
+    open_ = tick(np.maximum(previous + rng.normal(0, 0.8, close.shape), 1.0), 2)
+    high = tick(np.maximum(open_, close) + np.abs(rng.normal(0, 0.5, close.shape)), 2)
+    low = tick(np.maximum(np.minimum(open_, close) - np.abs(rng.normal(0, 0.5, close.shape)), 0.01), 2)
+    vwap = np.clip(tick((high + low + close) / 3, 2), low, high)
+    volume = (1e6 * rng.lognormal(0, 0.5, close.shape)).astype(np.int64).astype(np.float64)
+    returns = tick(close / previous - 1, 4)
+    fields = {'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume, 'vwap': vwap,
+              'returns': returns}
+    if missing:
+        for values in fields.values():
+            values[rng.random(values.shape) < missing] = np.nan
+
+    dates = pd.date_range('2024-06-01', periods=n_dates)
+    assets = [f'asset_{i + 1}' for i in range(n_assets)]
+    df = pd.DataFrame({
+        'date': np.repeat(dates, n_assets),
+        'asset_id': np.tile(assets, n_dates),
+        **{name: values.reshape(-1) for name, values in fields.items()},
+    })
+    return df.sort_values(['asset_id', 'date'], ignore_index=True)
+
+
+@pytest.fixture(scope='session')
+def data() -> pd.DataFrame:
+    return make_data()
+
+
+@pytest.fixture(scope='session')
+def data_with_nan() -> pd.DataFrame:
+    return make_data(missing=0.03, seed=1)
+
+
+@pytest.fixture(params=['kernels', 'numpy'])
+def backend(request, monkeypatch) -> str:
+    """Run a test on the compiled kernels and again on the NumPy / pandas code."""
+    if request.param == 'kernels':
+        if op._kernels is None:
+            pytest.skip('engine._kernels is not built (cythonize -i engine/_kernels.pyx)')
+    else:
+        monkeypatch.setattr(op, '_kernels', None)
+    return request.param
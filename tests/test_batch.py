@@ -0,0 +1,262 @@
+"""engine.batch: chunked and parallel runs against one pass in one process."""
+
+import glob
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_data
+from engine import batch, operators as op
+from engine import FactorStore
+from engine.batch import (date_chunks, discover_alphas, load_costs, lookback_days, main, record_costs,
+                          required_fields, run_batch, run_chunks)
+from engine.output import write_csv
+from engine.store import load_frame
+
+# Short lookbacks keep the halo, and the test, small
+MAX_LOOKBACK = 70
+
+
+@pytest.fixture(scope='module')
+def csv(tmp_path_factory) -> str:
+    # Unrounded prices: no calculator rounds a running sum onto a tie (see the engine.batch docstring)
+    path = str(tmp_path_factory.mktemp('batch') / 'data.csv')
+    make_data(missing=0.01, seed=5, ticks=False).to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture(scope='module')
+def alphas() -> dict:
+    return {number: path for number, path in discover_alphas().items()
+            if lookback_days([number]) is not None and lookback_days([number]) <= MAX_LOOKBACK}
+
+
+def plain(results: pd.DataFrame) -> pd.DataFrame:
+    return results.assign(date=results['date'].to_numpy(dtype='datetime64[ns]'),
+                          asset_id=results['asset_id'].astype(str)).reset_index(drop=True)
+
+
+def test_discover_alphas():
+    alphas = discover_alphas()
+    assert list(alphas) == sorted(alphas)
+    assert os.path.join('alpha', 'alpha31', 'alpha_calculator.py') in alphas[31]
+    assert os.path.join('alpha', 'archive', 'alpha16', 'alpha_calculator.py') in alphas[16]
+    # Every calculator directory has its calculate_alphaN, class-based scripts included
+    assert len(alphas) == len(glob.glob(os.path.join(batch.REPO_ROOT, 'alpha', '**', 'alpha*', 'alpha_calculator.py'),
+                                        recursive=True))
+
+
+def test_a_failing_calculator_leaves_the_others(csv, tmp_path):
+    path = tmp_path / 'alpha_calculator.py'
+    path.write_text("def calculate_alpha999(df):\n    print('starting')\n    raise RuntimeError('boom')\n")
+    df = load_frame(csv, codes=True)
+    results, summary = run_batch(df, {999: str(path), 41: discover_alphas()[41]}, workers=1)
+    assert results.columns.tolist() == ['date', 'asset_id', 'alpha41']
+    assert summary['status'].tolist() == ['RuntimeError: boom', 'ok']
+    assert summary['valid'].tolist() == [0, int(results['alpha41'].notna().sum())]
+
+
+def test_main_writes_the_results_costs_and_factors(csv, tmp_path, capsys):
+    output, costs, factors = (str(tmp_path / name) for name in ('results.csv', 'costs.json', 'factors'))
+    main(['31', 'alpha41', '--data', csv, '--output', output, '-w', '1', '--costs', costs, '--factors', factors])
+    printed = capsys.readouterr().out
+    assert '2/2 alphas written' in printed and 'decay_linear' in printed
+
+    alphas = discover_alphas()
+    results, _ = run_batch(load_frame(csv, codes=True), {31: alphas[31], 41: alphas[41]}, workers=1)
+    write_csv(results, str(tmp_path / 'expected.csv'), float_format='%.2f')
+    assert (tmp_path / 'results.csv').read_bytes() == (tmp_path / 'expected.csv').read_bytes()
+    assert set(load_costs(costs)['alphas']) == {'alpha31', 'alpha41'}
+    assert FactorStore(factors).factors == ['alpha31', 'alpha41']
+
+    with pytest.raises(SystemExit):
+        main(['999', '--data', csv, '--output', output, '--costs', costs])
+
+
+def test_row_order_does_not_matter():
+    # Calculators that sort once and work on a Panel, in whatever order the rows come
+    alphas = {number: path for number, path in discover_alphas().items() if number in (18, 19, 20, 22, 31, 36, 39)}
+    df = make_data(n_dates=400, missing=0.002)
+    keys = ['date', 'asset_id']
+    expected, summary = run_batch(df, alphas, workers=1)
+    shuffled, _ = run_batch(df.sample(frac=1, random_state=0, ignore_index=True), alphas, workers=1)
+    assert (summary['status'] == 'ok').all() and (summary['valid'] > 0).all()
+    pd.testing.assert_frame_equal(shuffled.sort_values(keys, ignore_index=True),
+                                  expected.sort_values(keys, ignore_index=True))
+
+
+@pytest.mark.parametrize('number', [2, 3])
+def test_zero_is_written_unsigned(data, number):
+    # -1 * correlation gives -0.0, which the CSV would print as -0.00
+    values = batch._load_function(discover_alphas()[number], number)(data.copy())[f'alpha{number}'].to_numpy()
+    assert (values == 0).any() and not np.signbit(values[values == 0]).any()
+
+
+def test_declared_columns_are_enough(csv):
+    df = load_frame(csv, codes=True)
+    declared = {number: path for number, path in discover_alphas().items() if required_fields([path]) is not None}
+    assert len(declared) > 20
+    whole, _ = run_batch(df, declared, workers=1)
+    for number, path in declared.items():
+        fields = required_fields([path])
+        pruned, summary = run_batch(load_frame(csv, fields, codes=True), {number: path}, workers=1)
+        assert summary['status'].tolist() == ['ok']
+        pd.testing.assert_series_equal(pruned[f'alpha{number}'], whole[f'alpha{number}'])
+
+
+def test_date_chunks():
+    assert date_chunks(list('abcdefg'), 3) == [('a', 'c'), ('d', 'f'), ('g', 'g')]
+    with pytest.raises(ValueError):
+        date_chunks(list('ab'), 0)
+
+
+def test_chunks_concatenate_to_the_single_pass_result(csv, alphas):
+    df = load_frame(csv, codes=True)
+    whole, whole_summary = run_batch(df, alphas, workers=1)
+    assert (whole_summary['status'] == 'ok').all()
+
+    halo = lookback_days(alphas)
+    dates = df['date'].cat.categories
+    first = dates[halo + 20]
+    chunks = date_chunks(dates[dates >= first], 45)
+    results, summary = run_chunks(csv, None, alphas, chunks, halo, workers=1)
+
+    whole = plain(whole)
+    whole = whole[whole['date'] >= first].reset_index(drop=True)
+    results = plain(results)
+    assert results.columns.tolist() == whole.columns.tolist()
+    pd.testing.assert_frame_equal(results[['date', 'asset_id']], whole[['date', 'asset_id']])
+    for alpha in whole.columns[2:]:
+        pd.testing.assert_series_equal(results[alpha], whole[alpha], check_exact=True)
+
+    # Valid counts cover each chunk's own dates, not its halo
+    assert summary['alpha'].tolist() == whole_summary['alpha'].tolist()
+    assert (summary['status'] == 'ok').all()
+    assert summary['valid'].tolist() == [int(whole[alpha].notna().sum()) for alpha in summary['alpha']]
+
+
+def test_start_loads_enough_history(csv):
+    # As main loads for --start: the output dates plus the alphas' longest lookback
+    alphas = {number: path for number, path in discover_alphas().items() if lookback_days([number]) is not None}
+    lookback = lookback_days(alphas)
+    df = load_frame(csv, codes=True)
+    start = df['date'].cat.categories[-20]
+    recent = load_frame(csv, required_fields(alphas.values()), start=start, lookback=lookback, codes=True)
+    assert recent['date'].nunique() == 20 + lookback < df['date'].nunique()
+
+    whole, _ = run_batch(df, alphas, workers=1)
+    results, summary = run_batch(recent, alphas, workers=1)
+    assert (summary['status'] == 'ok').all()
+    whole, results = plain(whole), plain(results)
+    whole = whole[whole['date'] >= start].reset_index(drop=True)
+    results = results[results['date'] >= start].reset_index(drop=True)
+    pd.testing.assert_frame_equal(results[['date', 'asset_id']], whole[['date', 'asset_id']])
+    for alpha in whole.columns[2:]:
+        pd.testing.assert_series_equal(results[alpha], whole[alpha], check_exact=True)
+
+
+def test_workers_give_the_single_process_result(csv, alphas):
+    df = load_frame(csv, codes=True)
+    single, single_summary = run_batch(df, alphas, workers=1)
+    # Costs high enough that every splittable operator call is offered to idle workers
+    costs = {'alphas': {}, 'operators': {name: 1e6 for name in batch._SPLITTABLE}}
+    segments = set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else None
+    parallel, summary = run_batch(df, alphas, workers=2, costs=costs)
+    pd.testing.assert_frame_equal(parallel, single)
+    # Inputs, outputs, the board and the split calls' blocks are all unlinked
+    if segments is not None:
+        assert set(os.listdir('/dev/shm')) <= segments
+    assert summary['valid'].tolist() == single_summary['valid'].tolist()
+    assert set(summary['operators'][summary['alpha'] == 'alpha31'].iloc[0]) >= {'ts_delta', 'decay_linear'}
+
+
+@pytest.fixture
+def board(monkeypatch):
+    """This process as a pool worker whose every splittable call is worth sharing, with a thief thread."""
+    blocks = []
+    spec, prefix = batch._share_board(blocks, 1)
+    monkeypatch.setattr(batch, '_worker_board', batch._attach(spec, writeable=True))
+    monkeypatch.setattr(batch, '_worker_prefix', prefix)
+    monkeypatch.setattr(batch, '_worker_lock', threading.Lock())
+    monkeypatch.setattr(batch, '_worker_costs', {name: 1e6 for name in batch._SPLITTABLE})
+    stolen = {}
+    thief = threading.Thread(target=lambda: stolen.update(batch._steal()))
+    thief.start()
+    while batch._worker_board[0, batch._IDLE] == 0:
+        thief.join(0.001)
+    yield batch._worker_board, stolen
+    batch._worker_board[0, batch._PENDING] = 0
+    thief.join()
+    assert not batch._worker_board[1:].any() and batch._worker_board[0, batch._IDLE] == 0
+    monkeypatch.setattr(batch, '_worker_board', None)
+    batch._release(blocks)
+
+
+@pytest.mark.parametrize('name, args', [
+    ('ts_rank', (60,)),
+    ('ts_correlation', ('y', 40)),
+    ('decay_linear', (33,)),
+    ('ts_sum', (5,)),
+])
+def test_shared_calls_give_the_single_call_result(board, backend, name, args):
+    rng = np.random.default_rng(6)
+    x = np.cumsum(rng.normal(size=(400, 50)), axis=0)
+    x[rng.random(x.shape) < 0.02] = np.nan
+    args = (x, *[x[::-1].copy() if arg == 'y' else arg for arg in args])
+    func = getattr(op, name)
+    result, waited = batch._shared_call(7, name, func, args, {})
+    np.testing.assert_array_equal(result, func(*args))
+    assert waited >= 0.0
+
+
+def test_calls_not_worth_sharing_run_directly(board):
+    x = np.ones((10, 3))
+    batch._worker_costs.clear()
+    result, waited = batch._shared_call(7, 'ts_sum', op.ts_sum, (x, 2), {})
+    np.testing.assert_array_equal(result, op.ts_sum(x, 2))
+    assert waited == 0.0 and batch._worker_board[0, batch._LAST_JOB] == 0
+
+
+def test_operator_clock_counts_exclusive_time_and_restores_the_operators():
+    originals = {name: getattr(op, name) for name in batch._operator_names()}
+    x = np.ones((20, 4))
+    waited = [0.0]
+    with batch._operator_clock(3, waited) as times:
+        # ts_delay inside ts_delta is timed under its own name
+        op.cs_rank(op.ts_delta(x, 1))
+        op.cs_rank(x)
+    assert {name: cells for name, (_, cells) in times.items()} == {'cs_rank': 160, 'ts_delta': 80, 'ts_delay': 80}
+    assert all(seconds >= 0.0 for seconds, _ in times.values()) and waited == [0.0]
+    assert {name: getattr(op, name) for name in originals} == originals
+
+
+def test_costs_are_moving_averages(tmp_path):
+    path = str(tmp_path / 'cache' / 'costs.json')
+    assert load_costs(path) == {'alphas': {}, 'operators': {}}
+    summary = pd.DataFrame({'alpha': ['alpha31', 'alpha32'], 'seconds': [2.0, 1.0], 'status': ['ok', 'failed'],
+                            'operators': [{'ts_rank': [1.0, 4_000_000]}, {'ts_mean': [5.0, 1_000_000]}]})
+    record_costs(path, summary, 2_000_000)
+    assert load_costs(path) == {'alphas': {'alpha31': 1.0}, 'operators': {'ts_rank': 0.25}}
+    summary['seconds'] = [4.0, 1.0]
+    record_costs(path, summary, 2_000_000)
+    assert load_costs(path)['alphas'] == {'alpha31': 1.5}
+
+    # Histories from before operators were timed hold the alphas alone
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'alpha31': 3.0}, f)
+    assert load_costs(path) == {'alphas': {'alpha31': 3.0}, 'operators': {}}
+
+
+def test_longest_first():
+    # alpha200 has no formula to estimate a cost from; alpha101 is arithmetic only, estimated free
+    alphas = {31: '', 32: '', 33: '', 101: '', 200: ''}
+    costs = {'alphas': {'alpha31': 1.0, 'alpha33': 5.0}, 'operators': {}}
+    assert batch._longest_first(alphas, costs) == [32, 200, 33, 31, 101]
+    # Estimated from its five timed operator calls
+    costs['operators'] = {name: 2.0 for name in batch._operator_names()}
+    assert batch._estimated_cost(32, costs['operators']) == 10.0
+    assert batch._longest_first(alphas, costs) == [200, 32, 33, 31, 101]
@@ -0,0 +1,92 @@
+"""FactorStore: what is written is read back, and partial writes keep the rest of a date."""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine import FactorStore, Panel
+
+
+@pytest.fixture
+def results(data_with_nan) -> pd.DataFrame:
+    df = data_with_nan[['date', 'asset_id']].copy()
+    df['alpha1'] = data_with_nan['close'].to_numpy() / 100
+    df['alpha2'] = data_with_nan['volume'].to_numpy()
+    return df
+
+
+def stored(store: FactorStore, factor: str, panel: Panel) -> np.ndarray:
+    return store.read(factor, assets=panel.assets).to_numpy()
+
+
+def test_write_reads_back(tmp_path, results):
+    FactorStore(str(tmp_path)).write(results)
+    # A fresh object reads only what is on disk
+    store = FactorStore(str(tmp_path))
+    panel = Panel.from_long(results)
+    assert store.factors == ['alpha1', 'alpha2']
+    np.testing.assert_array_equal(stored(store, 'alpha1', panel), panel['alpha1'])
+    np.testing.assert_array_equal(store.dates('alpha2'), panel.dates)
+
+    day = panel.dates[100]
+    at = store.at(day, ['alpha2'], ['asset_3', 'unknown'])
+    np.testing.assert_array_equal(at['alpha2'], [panel['alpha2'][100, panel.assets.get_loc('asset_3')], np.nan])
+    window = store.read('alpha1', start=day, end=panel.dates[130], assets=panel.assets)
+    np.testing.assert_array_equal(window.to_numpy(), panel['alpha1'][100:131])
+
+
+def test_append_of_some_assets_keeps_the_others(tmp_path, results):
+    store = FactorStore(str(tmp_path))
+    store.write(results)
+    panel = Panel.from_long(results)
+    expected = panel['alpha1'].copy()
+
+    # Overwrite two assets on a date in the middle of a month, and add a new one
+    day, row = panel.dates[45], 45
+    store.append(day, {'alpha1': np.array([-1.0, -2.0, -3.0])}, ['asset_2', 'asset_7', 'asset_new'])
+    expected[row, panel.assets.get_indexer(['asset_2', 'asset_7'])] = [-1.0, -2.0]
+
+    store = FactorStore(str(tmp_path))
+    np.testing.assert_array_equal(stored(store, 'alpha1', panel), expected)
+    assert store.at(day, ['alpha1'], ['asset_new'])['alpha1'].tolist() == [-3.0]
+    # The new asset has no value on the other dates
+    assert np.isnan(store.read('alpha1', assets=['asset_new']).drop(index=day).to_numpy()).all()
+    # Only the rewritten partition's new version is left
+    assert len([name for name in os.listdir(tmp_path / 'alpha1') if name.startswith(f'{day:%Y-%m}')]) == 1
+
+
+def test_append_after_the_last_date(tmp_path, results):
+    store = FactorStore(str(tmp_path))
+    panel = Panel.from_long(results)
+    history = results[results['date'] < panel.dates[-1]]
+    store.write(history)
+    last = panel.dates[-1]
+    today = results[results['date'] == last]
+    store.append(last, {'alpha1': today['alpha1'].to_numpy()}, today['asset_id'])
+
+    store = FactorStore(str(tmp_path))
+    np.testing.assert_array_equal(stored(store, 'alpha1', panel), panel['alpha1'])
+
+
+def test_write_replaces_a_date_as_a_whole(tmp_path, results):
+    store = FactorStore(str(tmp_path))
+    store.write(results)
+    panel = Panel.from_long(results)
+    day = panel.dates[10]
+    store.write(pd.DataFrame({'date': [day], 'asset_id': ['asset_1'], 'alpha1': [7.0]}))
+
+    row = FactorStore(str(tmp_path)).at(day, ['alpha1'])['alpha1']
+    assert row['asset_1'] == 7.0
+    assert row.drop('asset_1').isna().all()
+
+
+def test_float32_store(tmp_path, results):
+    FactorStore(str(tmp_path), dtype='float32').write(results, ['alpha1'])
+    panel = Panel.from_long(results)
+    values = FactorStore(str(tmp_path)).read('alpha1', assets=panel.assets)
+    assert values.dtypes.unique().tolist() == [np.float32]
+    np.testing.assert_array_equal(values.to_numpy(), panel['alpha1'].astype(np.float32))
+    with pytest.raises(ValueError):
+        FactorStore(str(tmp_path), dtype='int32')
@@ -0,0 +1,160 @@
+"""engine.formula: the doc/functions.md notation compiled to operator calls."""
+
+import numpy as np
+import pytest
+
+from engine import FORMULAS, Panel, compile_formula, compile_formulas, operators as op
+
+
+@pytest.fixture(scope='module')
+def panel(data_with_nan) -> Panel:
+    panel = Panel.from_long(data_with_nan)
+    n_dates, n_assets = panel.shape
+    for level, groups in [('sector', 2), ('industry', 3), ('subindustry', 5)]:
+        panel[level] = np.tile(np.arange(n_assets) % groups, (n_dates, 1)).astype(np.float64)
+    panel['cap'] = panel['close'] * 1e7
+    return panel
+
+
+def evaluate(source: str, panel: Panel) -> np.ndarray:
+    return compile_formula(source).evaluate(panel)
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('1 + 2 * 3 ^ 2', 19.0),
+    ('-2 ^ 2', -4.0),
+    ('2 ^ -1', 0.5),
+    ('2 ^ 3 ^ 2', 512.0),
+    ('10 - 4 - 3', 3.0),
+    ('1 < 2 ? 3 : 4', 3.0),
+    ('0 ? 1 : 0 ? 2 : 3', 3.0),
+    ('(1 < 2) + (2 <= 2) + (1 == 2) + (1 != 2)', 3.0),
+    ('0 || 2 && 1', 1.0),
+    ('.5e1 + 1.', 6.0),
+])
+def test_constant_expressions_fold(source, expected):
+    formula = compile_formula(source)
+    assert formula.root.kind == 'const' and formula.root.name == expected
+    assert formula.fields == [] and formula.lookback == 0
+
+
+def test_formulas_call_the_operators(panel):
+    close, volume, open_ = panel['close'], panel['volume'], panel['open']
+    np.testing.assert_array_equal(evaluate(FORMULAS['alpha6'], panel), -1 * op.ts_correlation(open_, volume, 10))
+    np.testing.assert_array_equal(evaluate(FORMULAS['alpha101'], panel),
+                                  (close - open_) / ((panel['high'] - panel['low']) + .001))
+    # Names are case-insensitive and windows are floored
+    np.testing.assert_array_equal(evaluate('Ts_Rank(SUM(close, 7.9), 4.2)', panel),
+                                  op.ts_rank(op.ts_sum(close, 7), 4))
+    np.testing.assert_array_equal(evaluate('SignedPower(delta(close, 1), 2)', panel),
+                                  op.signed_power(op.ts_delta(close, 1), 2.0))
+    np.testing.assert_array_equal(evaluate('adv20', panel), op.ts_mean(close * volume, 20))
+    np.testing.assert_array_equal(evaluate('IndNeutralize(close, IndClass.sector)', panel),
+                                  op.indneutralize(close, panel['sector']))
+    np.testing.assert_array_equal(evaluate('scale(close)', panel), op.scale(close, 1.0))
+
+
+def test_min_and_max_are_time_series_with_a_constant_window(panel):
+    close, open_ = panel['close'], panel['open']
+    np.testing.assert_array_equal(evaluate('min(close, 5)', panel), op.ts_min(close, 5))
+    np.testing.assert_array_equal(evaluate('max(close, open)', panel), np.maximum(close, open_))
+
+
+def test_conditions_treat_nan_as_false(panel):
+    close = panel['close']
+    assert np.isnan(close).any()
+    np.testing.assert_array_equal(evaluate('close > 100 ? 1 : -1', panel), np.where(close > 100, 1.0, -1.0))
+    np.testing.assert_array_equal(evaluate('close ? 1 : -1', panel), np.where(np.isnan(close), -1.0, 1.0))
+    np.testing.assert_array_equal(evaluate('close && 1', panel), (~np.isnan(close)).astype(float))
+    # Comparisons are NumPy's: NaN != NaN
+    np.testing.assert_array_equal(evaluate('close != close', panel), np.isnan(close).astype(float))
+
+
+def test_adv_of_share_volume(panel):
+    # The paper's adv{d} is dollar volume; the calculators under alpha/ average shares
+    shares = compile_formula('adv20', adv='shares')
+    assert shares.fields == ['volume'] and compile_formula('adv20').fields == ['close', 'volume']
+    np.testing.assert_array_equal(shares.evaluate(panel), op.ts_mean(panel['volume'], 20))
+    assert compile_formulas({'alpha7': FORMULAS['alpha7']}, adv='shares').adv == 'shares'
+    with pytest.raises(ValueError, match='adv'):
+        compile_formula('adv20', adv='notional')
+
+
+def test_a_panel_adv_field_is_used_as_is(panel):
+    fields = {'adv20': panel['open'], 'close': panel['close'], 'volume': panel['volume']}
+    panel = Panel(panel.dates, panel.assets, fields, panel.date_idx, panel.asset_idx)
+    np.testing.assert_array_equal(evaluate('adv20 * 2', panel), panel['adv20'] * 2)
+
+
+def test_identities_are_dropped():
+    formula = compile_formula('-(-(close * 1 / 1 ^ 1)) + ts_min(product(close, 1), 1)')
+    assert repr(formula) == 'Formula(add(close, close))'
+
+
+def test_fields_and_lookback():
+    formula = compile_formula(FORMULAS['alpha32'])
+    assert formula.fields == ['close', 'vwap']
+    # delay(close, 5) inside a 230-day correlation
+    assert formula.lookback == 234
+    assert compile_formula('delta(ts_sum(close, 10), 3) + adv5').lookback == 12
+    assert compile_formula('IndNeutralize(vwap, IndClass.industry)').fields == ['vwap', 'industry']
+
+
+@pytest.mark.parametrize('source, message', [
+    ('foo(close)', "Unknown function 'foo'"),
+    ('sum(close)', 'ts_sum expects 2 arguments, got 1'),
+    ('sum(close, volume)', 'must be a constant'),
+    ('sum(close, 0.5)', 'Window of ts_sum must be at least 1'),
+    ('IndNeutralize(close, 1)', 'Group argument of indneutralize must be a field'),
+    ('(close + 1', "Expected ')'"),
+    ('close close', "Expected ''"),
+    ('close + ', "Unexpected 'end of formula'"),
+    ('close $ 1', 'position'),
+])
+def test_compile_errors(source, message):
+    with pytest.raises(ValueError, match=message.replace('(', r'\(').replace(')', r'\)')):
+        compile_formula(source)
+
+
+def test_compile_formulas_names_the_formula_that_fails():
+    with pytest.raises(ValueError, match='^alpha2: '):
+        compile_formulas({'alpha1': 'close', 'alpha2': 'rank(close'})
+
+
+def test_every_alpha101_formula_compiles():
+    assert len(compile_formulas(FORMULAS)) == 101
+
+
+def test_shared_subexpressions_are_one_node():
+    formula = compile_formula('rank(close * volume) + rank(volume * close) + delta(close * volume, 1)')
+    assert sum(node.kind == 'op' and node.name == 'mul' for node in formula.nodes) == 1
+    assert sum(node.kind == 'op' and node.name == 'cs_rank' for node in formula.nodes) == 1
+    # 0.0 and -0.0 are equal keys but different constants
+    assert len(compile_formula('close * 0 + close * -0').nodes) == 6
+
+    batch = compile_formulas({name: FORMULAS[name] for name in ('alpha7', 'alpha17', 'alpha25')})
+    separate = sum(len(formula.nodes) for formula in batch.formulas.values())
+    assert len(batch.nodes) < separate
+    assert sum(node.kind == 'adv' and node.params == (20,) for node in batch.nodes) == 1
+
+
+def test_a_formula_set_gives_each_formula_s_own_result(panel):
+    batch = compile_formulas(FORMULAS)
+    results = batch.evaluate(panel)
+    assert list(results) == list(FORMULAS)
+    for name, source in FORMULAS.items():
+        np.testing.assert_array_equal(results[name], compile_formula(source).evaluate(panel), err_msg=name)
+
+
+@pytest.mark.parametrize('split', [False, True])
+def test_threads_give_the_sequential_result(panel, backend, monkeypatch, split):
+    if split:
+        # Every column-wise operator runs as one task per block of assets
+        monkeypatch.setattr('engine.formula._SPLIT_CELLS', 1)
+    batch = compile_formulas(FORMULAS)
+    sequential = batch.evaluate(panel)
+    threaded = batch.evaluate(panel, workers=4)
+    for name in FORMULAS:
+        np.testing.assert_array_equal(threaded[name], sequential[name], err_msg=name)
+    # A root that is an input field is a copy, never the panel's matrix
+    assert not np.shares_memory(compile_formula('close').evaluate(panel, workers=4), panel['close'])
@@ -0,0 +1,119 @@
+"""FormulaStream.update against FormulaSet.evaluate on the whole history."""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from engine import FORMULAS, FormulaStream, Panel, compile_formulas
+
+# Dates appended one at a time after FormulaStream.start
+STEPS = 6
+
+
+@pytest.fixture(scope='module')
+def formulas(data_with_nan):
+    names = [name for name, source in FORMULAS.items()
+             if set(compile_formulas({name: source}).fields) <= set(data_with_nan.columns)]
+    return compile_formulas({name: FORMULAS[name] for name in names})
+
+
+def test_stream_matches_batch_bit_for_bit(backend, data_with_nan, formulas, tmp_path):
+    full = formulas.evaluate(Panel.from_long(data_with_nan))
+    dates = data_with_nan['date'].drop_duplicates().sort_values().to_list()
+
+    stream = FormulaStream(formulas, checkpoint=str(tmp_path))
+    stream.start(Panel.from_long(data_with_nan[data_with_nan['date'] < dates[-STEPS]], stream.fields))
+    for step, date in enumerate(dates[-STEPS:]):
+        if step == STEPS // 2:
+            # Carry on from the checkpoint the previous update wrote
+            stream = FormulaStream.load(str(tmp_path))
+        today = stream.update(data_with_nan[data_with_nan['date'] == date])
+        row = len(dates) - STEPS + step
+        for name, values in today.items():
+            np.testing.assert_array_equal(values, full[name][row], err_msg=f'{name} on {date:%Y-%m-%d}')
+
+
+@pytest.fixture(scope='module')
+def small():
+    return compile_formulas({name: FORMULAS[name] for name in ('alpha6', 'alpha12', 'alpha31', 'alpha39')})
+
+
+def test_assets_missing_from_a_date_are_nan(data_with_nan, small):
+    dates = data_with_nan['date'].drop_duplicates().sort_values().to_list()
+    # asset_3 has no rows on the last two dates
+    data = data_with_nan[~((data_with_nan['asset_id'] == 'asset_3') & (data_with_nan['date'] >= dates[-2]))]
+    full = small.evaluate(Panel.from_long(data))
+
+    stream = FormulaStream(small)
+    stream.start(Panel.from_long(data[data['date'] < dates[-3]], stream.fields))
+    for row, date in enumerate(dates[-3:], len(dates) - 3):
+        today = stream.update(data[data['date'] == date])
+        for name, values in today.items():
+            np.testing.assert_array_equal(values, full[name][row], err_msg=name)
+
+
+def test_update_rejects_what_it_cannot_append(data, small):
+    dates = data['date'].drop_duplicates().sort_values().to_list()
+    stream = FormulaStream(small)
+    with pytest.raises(ValueError, match='start'):
+        stream.update(data[data['date'] == dates[-1]])
+    stream.start(Panel.from_long(data[data['date'] < dates[-1]], stream.fields))
+    today = data[data['date'] == dates[-1]]
+    for day, message in [
+        (data[data['date'] >= dates[-2]], 'one date'),
+        (data[data['date'] == dates[-2]], 'not later'),
+        (today.assign(asset_id='asset_new'), 'not in the history'),
+        (today.drop(columns='volume'), "'volume'"),
+    ]:
+        with pytest.raises(ValueError, match=message):
+            stream.update(day)
+    # A rejected update leaves the stream as it was
+    assert stream.last_date == dates[-2]
+    stream.update(today)
+    assert stream.last_date == dates[-1]
+
+
+def test_a_snapshot_can_be_resumed_more_than_once(data_with_nan, small, tmp_path):
+    dates = data_with_nan['date'].drop_duplicates().sort_values().to_list()
+    stream = FormulaStream(small, checkpoint=str(tmp_path))
+    stream.start(Panel.from_long(data_with_nan[data_with_nan['date'] < dates[-2]], stream.fields))
+    assert sorted(name.split('-')[0] for name in os.listdir(tmp_path)) == ['arrays', 'state.json']
+
+    # The arrays are mapped copy-on-write: updating a resumed stream leaves the file as it was
+    days = [data_with_nan[data_with_nan['date'] == date] for date in dates[-2:]]
+    first = FormulaStream.load(str(tmp_path))
+    first.checkpoint = None
+    expected = [first.update(day) for day in days]
+    second = FormulaStream.load(str(tmp_path))
+    assert second.last_date == dates[-3] and second.assets.equals(stream.assets)
+    for day, values in zip(days, expected):
+        for name, today in second.update(day).items():
+            np.testing.assert_array_equal(today, values[name], err_msg=name)
+    # Each snapshot replaces the previous arrays file
+    assert sorted(name.split('-')[0] for name in os.listdir(tmp_path)) == ['arrays', 'state.json']
+
+
+def test_a_snapshot_keeps_the_adv_definition(data_with_nan, tmp_path):
+    formulas = compile_formulas({'alpha7': FORMULAS['alpha7']}, adv='shares')
+    dates = data_with_nan['date'].drop_duplicates().sort_values().to_list()
+    FormulaStream(formulas, checkpoint=str(tmp_path)).start(
+        Panel.from_long(data_with_nan[data_with_nan['date'] < dates[-1]], formulas.fields))
+    stream = FormulaStream.load(str(tmp_path))
+    assert stream.formulas.adv == 'shares' and sorted(stream.fields) == ['close', 'volume']
+    today = stream.update(data_with_nan[data_with_nan['date'] == dates[-1]])
+    np.testing.assert_array_equal(today['alpha7'], formulas.evaluate(Panel.from_long(data_with_nan))['alpha7'][-1])
+
+
+def test_a_snapshot_of_other_formulas_is_rejected(data, small, tmp_path):
+    stream = FormulaStream(small, checkpoint=str(tmp_path))
+    with pytest.raises(ValueError, match='start'):
+        stream.save(str(tmp_path))
+    stream.start(Panel.from_long(data, stream.fields))
+    path = tmp_path / 'state.json'
+    index = json.loads(path.read_text(encoding='utf-8'))
+    index['states'][0]['expr'] = 'ts_sum(close, 99)'
+    path.write_text(json.dumps(index), encoding='utf-8')
+    with pytest.raises(ValueError, match='does not match'):
+        FormulaStream.load(str(tmp_path))
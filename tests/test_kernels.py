@@ -0,0 +1,34 @@
+"""The compiled kernels against the NumPy / pandas code, on every formula of engine.alpha101."""
+
+import numpy as np
+import pytest
+
+from conftest import make_data
+from engine import FORMULAS, Panel, compile_formulas, operators as op
+
+pytestmark = pytest.mark.skipif(op._kernels is None, reason='engine._kernels is not built')
+
+
+@pytest.fixture(scope='module')
+def panel() -> Panel:
+    # Long enough for the 251-day lookback of the set, with few enough NaN
+    # that the longest windows still hold values
+    panel = Panel.from_long(make_data(n_dates=400, missing=0.002, seed=2))
+    n_dates, n_assets = panel.shape
+    # Group codes for IndClass and a market cap for alpha56
+    for level, groups in [('sector', 2), ('industry', 3), ('subindustry', 5)]:
+        panel[level] = np.tile(np.arange(n_assets) % groups, (n_dates, 1)).astype(np.float64)
+    panel['cap'] = panel['close'] * 1e7
+    return panel
+
+
+def test_every_formula_is_covered(panel):
+    assert set(compile_formulas(FORMULAS).fields) <= set(panel.fields)
+
+
+@pytest.mark.parametrize('name', sorted(FORMULAS, key=lambda name: int(name[5:])))
+def test_kernels_match_numpy_bit_for_bit(panel, monkeypatch, name):
+    formula = compile_formulas({name: FORMULAS[name]})
+    kernels = formula.evaluate(panel)[name]
+    monkeypatch.setattr(op, '_kernels', None)
+    np.testing.assert_array_equal(kernels, formula.evaluate(panel)[name])
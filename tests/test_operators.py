@@ -0,0 +1,137 @@
+"""engine.operators against the pandas code the calculators used before the engine."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine import Panel, operators as op
+
+# Both sides of operators._SCAN_WINDOW
+WINDOWS = [1, 2, 5, 32, 33, 60]
+
+
+@pytest.fixture(scope='module')
+def panel(data_with_nan) -> Panel:
+    return Panel.from_long(data_with_nan)
+
+
+@pytest.fixture(scope='module')
+def x(panel) -> np.ndarray:
+    return panel['close']
+
+
+@pytest.fixture(scope='module')
+def y(panel) -> np.ndarray:
+    return panel['vwap']
+
+
+def rolling(x: np.ndarray, window: int) -> pd.core.window.Rolling:
+    return pd.DataFrame(x).rolling(window)
+
+
+def assert_same(actual: np.ndarray, expected) -> None:
+    np.testing.assert_array_equal(actual, np.asarray(expected, dtype=np.float64))
+
+
+@pytest.mark.parametrize('period', [0, 1, 5, 400])
+def test_delay_and_delta(x, period):
+    assert_same(op.ts_delay(x, period), pd.DataFrame(x).shift(period))
+    assert_same(op.ts_delta(x, period), pd.DataFrame(x).diff(period))
+
+
+@pytest.mark.parametrize('window', WINDOWS)
+@pytest.mark.parametrize('name, method', [('ts_sum', 'sum'), ('ts_mean', 'mean'), ('ts_stddev', 'std')])
+def test_moments_match_pandas_bit_for_bit(backend, x, window, name, method):
+    # pandas treats infinities as missing
+    x = x.copy()
+    x[7, 3], x[150, 5] = np.inf, -np.inf
+    assert_same(getattr(op, name)(x, window), getattr(rolling(x, window), method)())
+
+
+def test_moments_of_a_constant_window_are_exact(backend):
+    x = np.full((40, 2), 0.1)
+    x[:, 1] = np.arange(40) % 3 * 1e9 + 0.1
+    assert_same(op.ts_stddev(x, 5)[4:, 0], np.zeros(36))
+    assert_same(op.ts_mean(x, 5), rolling(x, 5).mean())
+
+
+@pytest.mark.parametrize('window', WINDOWS)
+def test_extremes(backend, x, window):
+    assert_same(op.ts_min(x, window), rolling(x, window).min())
+    assert_same(op.ts_max(x, window), rolling(x, window).max())
+
+
+@pytest.mark.parametrize('window', WINDOWS)
+def test_arg_extremes_count_from_the_oldest_day_latest_wins(backend, x, window):
+    # Prices are rounded to cents, so windows hold ties
+    latest_max = rolling(x, window).apply(lambda w: window - 1 - np.argmax(w[::-1]), raw=True)
+    latest_min = rolling(x, window).apply(lambda w: window - 1 - np.argmin(w[::-1]), raw=True)
+    assert_same(op.ts_argmax(x, window), latest_max)
+    assert_same(op.ts_argmin(x, window), latest_min)
+
+
+@pytest.mark.parametrize('window', WINDOWS)
+def test_ts_rank_matches_pandas_rank_bit_for_bit(backend, x, window):
+    x = x.copy()
+    x[20, 1] = np.inf
+    assert_same(op.ts_rank(x, window), rolling(x, window).rank(method='average', pct=True))
+
+
+@pytest.mark.parametrize('window', WINDOWS)
+def test_ts_product(backend, x, window):
+    returns = 1 + op.ts_delta(x, 1) / 1000
+    expected = rolling(returns, window).apply(np.prod, raw=True)
+    np.testing.assert_allclose(op.ts_product(returns, window), expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize('window', WINDOWS)
+def test_decay_linear(backend, x, window):
+    weights = np.arange(1, window + 1) / (window * (window + 1) / 2)
+    expected = rolling(x, window).apply(lambda w: w @ weights, raw=True)
+    np.testing.assert_allclose(op.decay_linear(x, window), expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize('window', [2, 5, 32, 33, 60, 230])
+def test_correlation_and_covariance(backend, x, y, window):
+    # rolling().corr() of a constant window is NaN or +-inf; the operator gives
+    # NaN. pandas takes the moments around its running means and is off by up
+    # to 1e-8 on two-day windows, whose correlation is +-1.
+    expected = rolling(x, window).corr(pd.DataFrame(y)).to_numpy()
+    expected[~np.isfinite(expected)] = np.nan
+    np.testing.assert_allclose(op.ts_correlation(x, y, window), expected, rtol=1e-7)
+    np.testing.assert_allclose(op.ts_covariance(x, y, window), rolling(x, window).cov(pd.DataFrame(y)),
+                               rtol=1e-9, atol=1e-9)
+
+
+def test_covariance_of_large_prices_keeps_its_digits(backend):
+    rng = np.random.default_rng(3)
+    x = 1e6 + np.cumsum(rng.normal(0, 0.01, (600, 3)), axis=0)
+    y = 1e6 + np.cumsum(rng.normal(0, 0.01, (600, 3)), axis=0)
+    expected = pd.DataFrame(x - 1e6).rolling(230).cov(pd.DataFrame(y - 1e6))
+    np.testing.assert_allclose(op.ts_covariance(x, y, 230), expected, rtol=1e-6)
+
+
+def test_cs_rank(x):
+    assert_same(op.cs_rank(x), pd.DataFrame(x).rank(axis=1, method='average', pct=True))
+    thin = op.cs_rank(x[:, :2], min_count=3, fill=0.5)
+    assert_same(thin, np.full(thin.shape, 0.5))
+
+
+def test_cs_scale(x):
+    df = pd.DataFrame(x)
+    expected = df.sub(df.mean(axis=1), axis=0).div(df.std(axis=1), axis=0)
+    np.testing.assert_allclose(op.cs_scale(x), expected, rtol=1e-12)
+
+
+def test_scale(x):
+    df = pd.DataFrame(x)
+    np.testing.assert_allclose(op.scale(x, 2.0), df.mul(2.0).div(df.abs().sum(axis=1), axis=0), rtol=1e-12)
+
+
+def test_indneutralize(x):
+    groups = np.tile(np.arange(x.shape[1]) % 3, (x.shape[0], 1))
+    long = pd.DataFrame({'date': np.repeat(np.arange(x.shape[0]), x.shape[1]),
+                         'group': groups.reshape(-1), 'value': x.reshape(-1)})
+    expected = long['value'] - long.groupby(['date', 'group'])['value'].transform('mean')
+    np.testing.assert_allclose(op.indneutralize(x, groups), expected.to_numpy().reshape(x.shape),
+                               rtol=1e-12, atol=1e-12)
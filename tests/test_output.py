@@ -0,0 +1,84 @@
+"""engine.output against Python's format() and DataFrame.to_csv."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine.output import format_significant, format_values, write_csv
+
+
+@pytest.fixture(scope='module')
+def numbers() -> np.ndarray:
+    rng = np.random.default_rng(4)
+    hard = [0.0, -0.0, 0.125, 2.5, -2.5, 0.005, 1.005, 2.675, 0.0001, 99.995, 1e-5, 1e15, 1e16, 1e22, 1e300,
+            -1e-300, 5e-324, 123456.789, np.inf, -np.inf, np.nan]
+    # Values at and next to half-way points of two decimals
+    halves = (np.arange(-500, 500) + 0.5) / 100
+    return np.concatenate([hard, halves, np.nextafter(halves, np.inf), np.nextafter(halves, -np.inf),
+                           rng.normal(0, 1, 2000) * 10.0 ** rng.integers(-8, 12, 2000)])
+
+
+def python_format(values, spec: str, na_rep: str = '') -> list:
+    return [na_rep if np.isnan(value) else format(value, spec) for value in values]
+
+
+@pytest.mark.parametrize('spec', ['.0f', '.2f', '.4f', '.17f', '.1g', '.2g', '.4g', '.6g', '.17g'])
+def test_format_values_matches_python(numbers, spec):
+    assert format_values(numbers, spec, na_rep='NA').tolist() == python_format(numbers, spec, 'NA')
+    assert format_values(numbers, '%' + spec).tolist() == python_format(numbers, spec)
+
+
+def test_format_significant_zero_rep():
+    assert format_significant([0.0, -0.0, 0.01234], 2, zero_rep='0.00').tolist() == ['0.00', '0.00', '0.012']
+
+
+def test_unsupported_format_leaves_the_file_alone(tmp_path):
+    path = tmp_path / 'out.csv'
+    with pytest.raises(ValueError):
+        write_csv(pd.DataFrame({'a': [1.0]}), str(path), formats={'a': '.2e'})
+    assert not path.exists()
+
+
+@pytest.fixture(scope='module')
+def results(data_with_nan) -> pd.DataFrame:
+    df = data_with_nan[['date', 'asset_id', 'close', 'volume']].copy()
+    df['alpha'] = np.log(df['close']).diff() * 1e3
+    df['rank'] = df.groupby('date')['close'].rank(pct=True)
+    df['count'] = np.arange(len(df)) - 50
+    return df
+
+
+@pytest.mark.parametrize('chunksize', [200_000, 7])
+def test_write_csv_float_format_is_byte_identical(tmp_path, results, chunksize):
+    write_csv(results, str(tmp_path / 'fast.csv'), float_format='%.2f', chunksize=chunksize)
+    results.to_csv(tmp_path / 'slow.csv', index=False, float_format='%.2f')
+    assert (tmp_path / 'fast.csv').read_bytes() == (tmp_path / 'slow.csv').read_bytes()
+
+
+def test_write_csv_column_formats_are_byte_identical(tmp_path, results):
+    formats = {'alpha': '.2g', 'rank': '.4f', 'count': '.1f'}
+    write_csv(results, str(tmp_path / 'fast.csv'), formats=formats, na_rep='nan', chunksize=1000)
+    expected = results.copy()
+    for col, spec in formats.items():
+        expected[col] = python_format(results[col].to_numpy(dtype=np.float64), spec, 'nan')
+    expected.to_csv(tmp_path / 'slow.csv', index=False, na_rep='nan')
+    assert (tmp_path / 'fast.csv').read_bytes() == (tmp_path / 'slow.csv').read_bytes()
+
+
+@pytest.mark.parametrize('frame', [
+    # Categorical keys with a missing value, as FactorStore frames hold them
+    pd.DataFrame({'date': pd.Categorical(pd.to_datetime(['2024-01-02', None, '2024-01-02'])),
+                  'asset_id': pd.Categorical(['b', 'a', None]), 'alpha': [0.5, -1.25, np.nan]}),
+    # Unformatted floats, small integers and booleans
+    pd.DataFrame({'x': [0.1, 1e-7, 123456789.123, np.nan], 'n': np.array([1, -2, 3, 0], dtype=np.int8),
+                  'flag': [True, False, True, False]}),
+    # Times of day, and text to_csv has to quote
+    pd.DataFrame({'date': pd.to_datetime(['2024-01-02 00:00', '2024-01-02 09:30']), 'asset_id': ['a,b', 'c"d']}),
+    # One column: to_csv quotes a lone empty field
+    pd.DataFrame({'alpha': [1.0, np.nan]}),
+    pd.DataFrame({'alpha': pd.Series([], dtype=np.float64), 'asset_id': pd.Series([], dtype=object)}),
+], ids=['categorical', 'mixed', 'quoted', 'single', 'empty'])
+def test_write_csv_other_columns_are_byte_identical(tmp_path, frame):
+    write_csv(frame, str(tmp_path / 'fast.csv'), float_format='%.3f', chunksize=1)
+    frame.to_csv(tmp_path / 'slow.csv', index=False, float_format='%.3f')
+    assert (tmp_path / 'fast.csv').read_bytes() == (tmp_path / 'slow.csv').read_bytes()
@@ -0,0 +1,50 @@
+"""float32 evaluation and engine.precision's report of how far it strays from float64."""
+
+import numpy as np
+import pytest
+
+from engine import FORMULAS, Panel, compile_formula, compile_formulas, operators as op
+from engine.precision import deviation_report
+
+NAMES = ['alpha6', 'alpha12', 'alpha32', 'alpha41', 'alpha101']
+
+
+@pytest.fixture(scope='module')
+def panel(data_with_nan) -> Panel:
+    return Panel.from_long(data_with_nan)
+
+
+def test_float32_results_are_float32_and_close(panel, backend):
+    formulas = compile_formulas({name: FORMULAS[name] for name in NAMES})
+    reference = formulas.evaluate(panel)
+    reduced = formulas.evaluate(panel, dtype='float32')
+    for name in NAMES:
+        assert reduced[name].dtype == np.float32
+        np.testing.assert_array_equal(np.isnan(reduced[name]), np.isnan(reference[name]), err_msg=name)
+    # Prices near 100 in float32 are good to about 1e-5
+    np.testing.assert_allclose(reduced['alpha41'], reference['alpha41'], atol=1e-4)
+    np.testing.assert_allclose(reduced['alpha6'], reference['alpha6'], atol=1e-5)
+
+
+def test_running_sums_accumulate_in_float64(panel, backend):
+    close = panel['close'].astype(np.float32)
+    expected = op.ts_mean(close.astype(np.float64), 60).astype(np.float32)
+    np.testing.assert_array_equal(op.ts_mean(close, 60).astype(np.float32), expected)
+    np.testing.assert_array_equal(compile_formula('ts_mean(close, 60)').evaluate(panel, dtype='float32'), expected)
+
+
+def test_other_dtypes_are_rejected(panel):
+    with pytest.raises(ValueError):
+        compile_formula('close').evaluate(panel, dtype='float16')
+
+
+def test_deviation_report(panel):
+    formulas = compile_formulas({name: FORMULAS[name] for name in NAMES})
+    report = deviation_report(formulas, panel, start=panel.dates[50])
+    assert report['alpha'].tolist() == NAMES
+    assert report.columns.tolist() == ['alpha', 'max_abs', 'max_rel', 'changed', 'nan_mismatch', 'cells']
+    assert set(report.attrs) == {'seconds_float64', 'seconds_float32'}
+    row = report.set_index('alpha').loc['alpha41']
+    assert row['nan_mismatch'] == 0 and 0 < row['max_abs'] < 1e-4
+    reference = formulas.evaluate(panel)['alpha6'][50:]
+    assert report.set_index('alpha').loc['alpha6', 'cells'] == (~np.isnan(reference)).sum()
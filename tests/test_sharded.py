@@ -0,0 +1,58 @@
+"""engine.sharded: out-of-core evaluation against FormulaSet.evaluate in memory."""
+
+import os
+
+import numpy as np
+import pytest
+
+from engine import FORMULAS, compile_formulas
+from engine.sharded import _plan, evaluate_sharded
+from engine.store import convert_csv, load_panel
+
+# Small enough that every stage runs in several shards
+BUDGET = 200_000
+
+
+@pytest.fixture(scope='module')
+def store(tmp_path_factory, data_with_nan) -> str:
+    path = str(tmp_path_factory.mktemp('sharded') / 'data.csv')
+    data_with_nan.to_csv(path, index=False)
+    return convert_csv(path)
+
+
+@pytest.fixture(scope='module')
+def formulas(data_with_nan):
+    names = [name for name, source in FORMULAS.items()
+             if set(compile_formulas({name: source}).fields) <= set(data_with_nan.columns)]
+    return compile_formulas({name: FORMULAS[name] for name in names})
+
+
+def test_shards_give_the_in_memory_result(store, formulas, backend, tmp_path):
+    panel = load_panel(store, formulas.fields)
+    stages = _plan(formulas, formulas.fields, panel.shape, BUDGET)
+    assert all(stage.width < panel.shape[stage.axis == 'assets'] for stage in stages)
+
+    results = evaluate_sharded(formulas, store, memory_budget=BUDGET, scratch=str(tmp_path))
+    expected = formulas.evaluate(panel)
+    assert results.dates.equals(panel.dates) and results.assets.equals(panel.assets)
+    for name in formulas.formulas:
+        assert not results[name].flags.writeable
+        np.testing.assert_array_equal(results[name], expected[name], err_msg=name)
+    # Intermediates are deleted once read; only the results are left
+    assert sorted(os.listdir(tmp_path)) == sorted(f'{name}.npy' for name in formulas.formulas)
+
+
+def test_a_date_range_loads_the_lookback(store, tmp_path):
+    formulas = compile_formulas({name: FORMULAS[name] for name in ('alpha6', 'alpha101')})
+    panel = load_panel(store, formulas.fields)
+    start, end = panel.dates[200], panel.dates[250]
+    results = evaluate_sharded(formulas, store, memory_budget=BUDGET, scratch=str(tmp_path), start=start, end=end)
+    assert results.dates.equals(panel.dates[200 - formulas.lookback:251])
+    expected = formulas.evaluate(panel)
+    for name in formulas.formulas:
+        np.testing.assert_array_equal(results[name][formulas.lookback:], expected[name][200:251])
+
+
+def test_a_budget_below_one_shard_is_rejected(store, formulas, tmp_path):
+    with pytest.raises(ValueError, match='memory_budget'):
+        evaluate_sharded(formulas, store, memory_budget=1 << 10, scratch=str(tmp_path))
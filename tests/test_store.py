@@ -0,0 +1,165 @@
+"""engine.store: a converted store loads the same frame as the CSV it came from."""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_data
+from engine import FORMULAS, Panel, compile_formulas
+from engine.panel import factorize_keys
+from engine.store import convert_csv, date_window, load_frame, load_panel, resolve_fields, store_path
+
+
+@pytest.fixture(scope='module')
+def csv(tmp_path_factory, data) -> str:
+    """A CSV in no particular row order, with an integer column and some (date, asset) rows absent."""
+    df = data.assign(volume=data['volume'].astype(np.int64))
+    df = df.sample(frac=0.97, random_state=7)
+    path = str(tmp_path_factory.mktemp('store') / 'data.csv')
+    df.to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture(scope='module')
+def store(csv) -> str:
+    return convert_csv(csv, store_path(csv) + '_store')
+
+
+def from_csv(csv: str, **kwargs) -> pd.DataFrame:
+    # No store at store_path(csv): load_frame parses the CSV
+    assert not os.path.exists(store_path(csv))
+    return load_frame(csv, **kwargs)
+
+
+def test_store_loads_the_csv_frame(csv, store):
+    expected = pd.read_csv(csv)
+    expected['date'] = pd.to_datetime(expected['date'])
+    pd.testing.assert_frame_equal(from_csv(csv), expected)
+    pd.testing.assert_frame_equal(load_frame(store), expected)
+
+
+@pytest.mark.parametrize('fields, loaded', [
+    (['vwap', 'close'], ['close', 'vwap']),
+    (['adv20'], ['volume']),
+    ([], []),
+])
+def test_only_the_needed_columns_are_loaded(csv, store, fields, loaded):
+    expected = from_csv(csv)[['date', 'asset_id'] + loaded]
+    pd.testing.assert_frame_equal(from_csv(csv, fields=fields), expected)
+    pd.testing.assert_frame_equal(load_frame(store, fields), expected)
+    assert list(load_panel(store, fields).fields) == loaded
+
+
+def test_resolve_fields():
+    available = ['open', 'close', 'volume']
+    assert resolve_fields(None, available) == available
+    # Calculators compute returns and adv{d} themselves when the data lacks them
+    assert resolve_fields(['returns', 'adv5', 'open'], available) == available
+    assert resolve_fields(['returns'], available + ['returns']) == ['returns']
+    with pytest.raises(ValueError):
+        resolve_fields(['vwap'], available)
+    assert resolve_fields(['adv20'], available) == ['volume']
+    with pytest.raises(ValueError):
+        resolve_fields(['adv20'], ['close'])
+
+
+@pytest.mark.parametrize('source', ['csv', 'store'])
+def test_coded_keys(csv, store, source):
+    path = csv if source == 'csv' else store
+    plain = load_frame(path, start='2024-08-01')
+    coded = load_frame(path, start='2024-08-01', codes=True)
+    assert isinstance(coded['date'].dtype, pd.CategoricalDtype) and coded['date'].cat.ordered
+    assert isinstance(coded['asset_id'].dtype, pd.CategoricalDtype)
+    pd.testing.assert_frame_equal(coded.astype({'date': 'datetime64[ns]', 'asset_id': object}), plain)
+
+    by_codes, by_values = Panel.from_long(coded), Panel.from_long(plain)
+    assert by_codes.dates.equals(by_values.dates) and by_codes.assets.equals(by_values.assets)
+    np.testing.assert_array_equal(by_codes['close'], by_values['close'])
+
+
+def test_factorize_keys_prunes_and_sorts_the_dictionary():
+    keys = pd.Series(pd.Categorical(['b', 'd', None, 'b', 'a'], categories=['d', 'c', 'b', 'a']))
+    codes, uniques = factorize_keys(keys)
+    expected_codes, expected_uniques = pd.factorize(keys.astype(object), sort=True)
+    np.testing.assert_array_equal(codes, expected_codes)
+    assert list(uniques) == list(expected_uniques) == ['a', 'b', 'd']
+
+
+def test_load_panel_maps_the_stored_matrices(csv, store):
+    panel = load_panel(store)
+    assert isinstance(panel['close'], np.memmap) and not panel['close'].flags.writeable
+    assert panel.dates.is_monotonic_increasing and panel.assets.is_monotonic_increasing
+    df = from_csv(csv)
+    np.testing.assert_array_equal(panel.to_long(panel['close']), df['close'])
+    assert np.isnan(panel['close']).sum() == panel['close'].size - len(df)
+
+
+def test_a_csv_newer_than_its_store_is_read_instead(tmp_path, data):
+    path = str(tmp_path / 'data.csv')
+    data.to_csv(path, index=False)
+    convert_csv(path)
+    stamp = os.path.getmtime(os.path.join(store_path(path), 'meta.json'))
+    data.assign(close=-1.0).to_csv(path, index=False)
+    os.utime(path, (stamp + 10, stamp + 10))
+    assert (load_frame(path)['close'] == -1.0).all()
+
+
+def test_convert_rejects_text_and_duplicate_rows(tmp_path, data):
+    path = str(tmp_path / 'data.csv')
+    data.assign(sector='tech').to_csv(path, index=False)
+    with pytest.raises(ValueError):
+        convert_csv(path)
+    pd.concat([data, data.iloc[:1]]).to_csv(path, index=False)
+    with pytest.raises(ValueError):
+        convert_csv(path)
+
+
+def test_date_window():
+    dates = pd.date_range('2024-01-01', periods=10)
+    assert date_window(dates) == slice(0, 10)
+    assert date_window(dates, '2024-01-05', '2024-01-07') == slice(4, 7)
+    assert date_window(dates, '2024-01-05', lookback=2) == slice(2, 10)
+    # Dates between trading days, and more lookback than history
+    assert date_window(dates, '2024-01-04 12:00', '2025-01-01', lookback=9) == slice(0, 10)
+
+
+@pytest.mark.parametrize('start, end, lookback', [('2024-09-01', None, 20), (None, '2024-08-01', 5),
+                                                  ('2024-07-15', '2024-07-20', 400)])
+def test_windowed_loads_match(csv, store, start, end, lookback):
+    expected = from_csv(csv, start=start, end=end, lookback=lookback)
+    pd.testing.assert_frame_equal(load_frame(store, start=start, end=end, lookback=lookback), expected)
+    every = pd.DatetimeIndex(from_csv(csv)['date'].unique()).sort_values()
+    loaded = pd.DatetimeIndex(expected['date'].unique()).sort_values()
+    assert loaded.equals(every[date_window(every, start, end, lookback)])
+
+
+# ts_sum, ts_mean and ts_stddev (adv{d} among them) are pandas' running sums
+# over the loaded history, and can differ from the full history's in the last bit
+RUNNING_SUMS = {'alpha15', 'alpha28', 'alpha47', 'alpha83'}
+# ... which alpha45 ranks through 2-day correlations, +-1 up to rounding,
+# so its ties break by how the sums rounded
+RANKS_ROUNDING = {'alpha45'}
+
+
+def test_formula_lookback_is_enough_history(tmp_path):
+    df = make_data(missing=0.01, seed=5, ticks=False)
+    path = str(tmp_path / 'data.csv')
+    df.to_csv(path, index=False)
+    store = convert_csv(path)
+    names = [name for name, source in FORMULAS.items() if set(compile_formulas({name: source}).fields) <= set(df.columns)]
+    for name in names:
+        formula = compile_formulas({name: FORMULAS[name]})
+        # Both from the store, so the values parsed from the CSV are the same
+        whole = load_panel(store, formula.fields)
+        start = whole.dates[-20]
+        panel = load_panel(store, formula.fields, start=start, lookback=formula.lookback)
+        assert len(panel.dates) == 20 + formula.lookback
+        expected = formula.evaluate(whole)[name][-20:]
+        actual = formula.evaluate(panel)[name][-20:]
+        np.testing.assert_array_equal(np.isnan(actual), np.isnan(expected), err_msg=name)
+        if name in RUNNING_SUMS:
+            np.testing.assert_allclose(actual, expected, rtol=1e-12, atol=1e-14, err_msg=name)
+        elif name not in RANKS_ROUNDING:
+            np.testing.assert_array_equal(actual, expected, err_msg=name)